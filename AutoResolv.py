@@ -14,30 +14,22 @@
 
 
 import idaapi
-import idc
-import sys
-import idautils
-import ida_funcs
-import time
 import os
-import subprocess
-import sys
-from collections import defaultdict
 
-from libautoresolv.resultshower import ResultShower
-from libautoresolv.util import *
-from libautoresolv.error import *
-from libautoresolv.dbcache import *
-
-from libautoresolv.GUI.gui_main import *
-from libautoresolv.GUI.gui_start import *
 
+VERSION = "dev-v0.90p"
 
+# the GUI (PyQt5), the ELF code and the DB cache are loaded on first activation, not at IDA startup
+p_loaded = False
 
-VERSION = "dev-v0.90p"
-idaapi.require("libautoresolv.GUI.gui_main")
-idaapi.require("libautoresolv.GUI.gui_export")
-idaapi.require("libautoresolv.GUI.gui_start")
+def loadModules():
+    global p_loaded
+    if p_loaded is False:
+        idaapi.require("libautoresolv.GUI.gui_worker")
+        idaapi.require("libautoresolv.GUI.gui_main")
+        idaapi.require("libautoresolv.GUI.gui_export")
+        idaapi.require("libautoresolv.GUI.gui_start")
+        p_loaded = True
 
 
 
@@ -84,7 +76,7 @@ class Kp_Menu_Context(idaapi.action_handler_t):
 
 class Searcher(Kp_Menu_Context):
     def activate(self, ctx):
-        self.plugin.search()
+        self.plugin.run(0)
         return 1
 
 
@@ -132,17 +124,25 @@ class AutoResolv(idaapi.plugin_t):
         pass
 
     def _decompile_then_write_on_fd(self, fd, funs):
+        from libautoresolv.util import getPrototype, openSignatureCache
+
         lenf = len(funs)
         cpt = 0
+        module_path = os.path.join(os.path.dirname(__file__), "libautoresolv", "db")
+        os.makedirs(module_path, exist_ok=True)
+        sigcache = openSignatureCache(module_path)
         for fun in funs:
             ea = funs[fun]
-            cfunc = str(idaapi.decompile(ea)).split("\n")[0] + ";"
+            cfunc = getPrototype(ea, sigcache)
             print(f"Exporting {cfunc}, Progression: {(cpt/lenf)*100}%")
             cpt += 1
             fd.write(cfunc + "\n")
+        if sigcache is not None:
+            sigcache.close()
 
     def _signature_export(self, fd):
-        
+        from libautoresolv.util import get_seg, get_funs
+
         start,end = get_seg(".text")   
         if start == None or end == None:
             print("[AutoResolv] Error when parsing Segments() address.")
@@ -157,6 +157,11 @@ class AutoResolv(idaapi.plugin_t):
 
     def main(self):
         print(f"AutoResolv {VERSION}")
+        loadModules()
+        from libautoresolv.ldpath import getLibsFromBin
+        from libautoresolv.dbcache import DB_CACHE_MANAGER
+        from libautoresolv.GUI.gui_main import GUI_MAIN
+        from libautoresolv.GUI.gui_start import GUI_START
 
         module_path = os.path.join(os.path.dirname(__file__), "libautoresolv", "db")
         os.makedirs(module_path, exist_ok=True)
@@ -202,6 +207,9 @@ class AutoResolv(idaapi.plugin_t):
             else:
                 cache.create_cache(libs, bin_path)
                 cache.rpath = []
+        else:
+            # only libraries whose size/mtime/build-id changed are resolved again
+            cache.check_fingerprints(bin_path)
 
         cache.cache_save_bininfo(bin_path)
         gui_main = GUI_MAIN(cache)
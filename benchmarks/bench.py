@@ -0,0 +1,501 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# Resolver benchmarks on synthetic ELF corpora, runs in a plain python without IDA:
+#   python -m benchmarks.bench [--preset quick|full] [--out results.json] [--compare baseline.json]
+# The only IDA call on these paths, the demangler, is replaced by stubDemangle.
+
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libautoresolv import elfutil, ldpath, symstore
+from libautoresolv.elfutil import *
+from libautoresolv.ldpath import *
+from libautoresolv.core import *
+from libautoresolv.symstore import *
+from libautoresolv.dbcache import *
+from libautoresolv.demangler import *
+from benchmarks.elfgen import *
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (target, layout, libraries, symbols per library, DT_NEEDED fan-out, imports, section headers)
+PRESETS = {
+    "quick": [(target, layout, 6, 1000, 3, 500, True) for target in TARGETS for layout in LAYOUTS]
+             + [("x86_64", "system", 6, 1000, 3, 500, False)],
+    "full": [(target, "system", 40, 5000, 8, 50000, True) for target in TARGETS]
+            + [("x86_64", layout, 40, 5000, 8, 50000, True) for layout in ("rpath", "runpath")]
+            + [("x86_64", "system", 40, 5000, 8, 50000, False),
+               ("x86_64", "system", 200, 1000, 40, 20000, True),
+               ("x86_64", "system", 8, 50000, 8, 50000, True)],
+}
+
+STAGES = ("ldpath", "imports", "parse", "symstore_build", "symstore_open",
+          "match", "match_store", "resolve_cold", "resolve", "dbcache_save", "dbcache_parse", "dbcache_replace", "dbcache_page",
+          "dbcache_search", "demangle_cold", "demangle", "import")
+
+# timed by the "import" stage, each in a fresh interpreter: what the first activation of the plugin,
+# the batch mode and the pool workers import
+IMPORT_MODULES = ["libautoresolv.elfutil", "libautoresolv.core", "libautoresolv.dbcache", "libautoresolv.demangler",
+                  "libautoresolv.pool", "libautoresolv.batch"]
+# modules IDA has loaded before any plugin, ida_* and PyQt5 ones too
+IDA_MODULES = ("idaapi", "idc", "idautils")
+# stdlib modules imported in a fresh interpreter as the yardstick of the machine and python speed
+REFERENCE_IMPORTS = ["sqlite3", "subprocess", "json"]
+# times the reference the first activation may spend importing the modules that don't need IDA or Qt
+# (AutoResolv.py itself only adds os to IDA startup). Measured on python 3.11 the activation takes
+# 2.4x the reference, 7x before its imports were deferred: 4x leaves room for noise and still fails
+# if they come back.
+ACTIVATION_IMPORT_BUDGET_RATIO = 4
+
+
+def stubDemangle(name):
+    # stands for idc.demangle_name: one call per resolved row, mangled names only
+    return name[2:] if name.startswith("_Z") else None
+
+
+def getCaseName(target, layout, nb_libs, symbols, fanout, imports, sections):
+    name = f"{target}-{layout}-{nb_libs}x{symbols}-f{fanout}-i{imports}"
+    return name if sections else name + "-stripped"
+
+
+def getGitRevision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip() != ""
+        return commit, dirty
+    except Exception:
+        return None, None
+
+
+def clearSessionCaches():
+    # everything the plugin keeps for the IDA session, each timed run starts from a fresh process state
+    elfutil.clearFunsCache()
+    ldpath._RESOLVERS.clear()
+    clearDirIndex()
+    clearSymbolStores()
+
+
+def timeStage(fun, repeat, setup=None):
+    walls = []
+    cpus = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t_wall = time.perf_counter()
+        t_cpu = time.process_time()
+        result = fun()
+        cpus.append(time.process_time() - t_cpu)
+        walls.append(time.perf_counter() - t_wall)
+    return {
+        'runs': repeat,
+        'min': min(walls),
+        'median': statistics.median(walls),
+        'mean': statistics.mean(walls),
+        'cpu_median': statistics.median(cpus),
+    }, result
+
+
+def isIdaModule(module):
+    return module in IDA_MODULES or module.startswith("ida_") or module.split(".")[0] == "PyQt5"
+
+
+def _getImports(path, nested=False):
+    with open(path) as fd:
+        tree = ast.parse(fd.read())
+    modules = []
+    for node in (ast.walk(tree) if nested else tree.body):
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+        elif nested and isinstance(node, ast.Call) and getattr(node.func, "attr", None) == "require":
+            # idaapi.require("libautoresolv...") of loadModules()
+            modules += [arg.value for arg in node.args if isinstance(arg, ast.Constant)]
+    return modules
+
+
+def getPluginImports():
+    """Modules imported by AutoResolv.py when IDA loads it, other than the IDA ones"""
+    return [module for module in _getImports(os.path.join(REPO_DIR, "AutoResolv.py")) if not isIdaModule(module)]
+
+
+def getActivationImports():
+    """Modules the first activation of the plugin loads that a plain python can import.
+
+    A plugin module importing IDA or Qt is replaced by what it imports, so the GUI and util
+    still count for the ELF, cache and demangler code they pull in.
+    """
+    todo = _getImports(os.path.join(REPO_DIR, "AutoResolv.py"), nested=True)
+    seen = set()
+    modules = []
+    while todo:
+        module = todo.pop(0)
+        if module in seen or isIdaModule(module):
+            continue
+        seen.add(module)
+        path = os.path.join(REPO_DIR, *module.split(".")) + ".py"
+        if module.split(".")[0] == "libautoresolv" and os.path.isfile(path):
+            imports = _getImports(path)
+            if any(isIdaModule(imported) for imported in imports):
+                todo += imports
+                continue
+        modules.append(module)
+    return modules
+
+
+def timeImport(modules, repeat):
+    # one fresh interpreter per run, so nothing is already in sys.modules
+    code = "\n".join(["import sys, time", "sys.path.insert(0, sys.argv[1])", "t_wall = time.perf_counter()", "t_cpu = time.process_time()"]
+                     + [f"import {module}" for module in modules]
+                     + ["print(time.perf_counter() - t_wall, time.process_time() - t_cpu)"])
+    walls = []
+    cpus = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code, REPO_DIR], capture_output=True, text=True, check=True).stdout.split()
+        walls.append(float(out[0]))
+        cpus.append(float(out[1]))
+    return {
+        'runs': repeat,
+        'min': min(walls),
+        'median': statistics.median(walls),
+        'mean': statistics.mean(walls),
+        'cpu_median': statistics.median(cpus),
+    }
+
+
+def runImports(repeat):
+    plugin_imports = getPluginImports()
+    activation_imports = getActivationImports()
+    results = {'reference': timeImport(REFERENCE_IMPORTS, repeat), 'plugin_entry': timeImport(plugin_imports, repeat),
+               'first_activation': timeImport(activation_imports, repeat)}
+    for module in IMPORT_MODULES:
+        results[module] = timeImport([module], repeat)
+    return {
+        'name': "imports",
+        'params': {},
+        'counters': {'plugin_imports': plugin_imports, 'activation_imports': activation_imports, 'mismatches': 0},
+        'stages': results,
+    }
+
+
+def _removeTree(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _removeDb(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def runCase(work_dir, params, repeat, stages):
+    target, layout, nb_libs, symbols, fanout, imports, sections = params
+    root = os.path.join(work_dir, "sysroot")
+    store_dir = os.path.join(work_dir, "symstore")
+    demangle_path = os.path.join(work_dir, "demangle.db")
+    db_path = os.path.join(work_dir, "cache.db")
+    db_pristine = os.path.join(work_dir, "cache.pristine.db")
+
+    t_start = time.perf_counter()
+    exe, lib_paths, expected = makeCorpus(root, TARGETS[target], nb_libs, symbols, fanout, imports, layout, sections=sections)
+    generate = time.perf_counter() - t_start
+
+    results = {}
+    wanted = lambda stage: stages is None or stage in stages
+
+    # the stages below share their inputs, they are always computed once even when not timed
+    clearSessionCaches()
+    libs, rpath = getLibsFromBin(exe, root)
+    if wanted("ldpath"):
+        results['ldpath'], _ = timeStage(lambda: getLibsFromBin(exe, root), repeat, clearSessionCaches)
+
+    bin_imports = getImportsFromBin(exe)
+    versions = getImportVersionsFromBin(exe)
+    if wanted("imports"):
+        results['imports'], _ = timeStage(lambda: (getImportsFromBin(exe), getImportVersionsFromBin(exe)), repeat)
+
+    def parseAll():
+        return {lib: getAllFunsFromLib(path, True) for lib, path in libs.items()}
+    funs = parseAll()
+    if wanted("parse"):
+        results['parse'], _ = timeStage(parseAll, repeat, clearSessionCaches)
+
+    def storeBuild():
+        for path in libs.values():
+            buildSymbolStore(path, store_dir)
+
+    def storeOpen():
+        return {lib: openSymbolStore(getSymbolStorePath(store_dir, path), path) for lib, path in libs.items()}
+
+    if wanted("symstore_build"):
+        results['symstore_build'], _ = timeStage(storeBuild, repeat, lambda: (clearSymbolStores(), _removeTree(store_dir)))
+    if not os.path.isdir(store_dir):
+        storeBuild()
+    if wanted("symstore_open"):
+        results['symstore_open'], _ = timeStage(storeOpen, repeat, clearSymbolStores)
+
+    # wrappers named like IDA names them in .plt
+    externalfuns = {"." + name: 0x1000 + i * 16 for i, name in enumerate(bin_imports)}
+    values, _ = matchFunctions(externalfuns, funs, libs, stubDemangle, versions)
+    if wanted("match"):
+        results['match'], _ = timeStage(lambda: matchFunctions(externalfuns, funs, libs, stubDemangle, versions), repeat)
+
+    if wanted("match_store"):
+        stores = storeOpen()
+        results['match_store'], _ = timeStage(lambda: matchFunctions(externalfuns, stores, libs, stubDemangle, versions), repeat)
+
+    # C++ names standing for the resolved rows, demangled by library batches as the plugin does
+    mangled = {}
+    for row in values:
+        mangled.setdefault(row[1], []).append(f"_Z{len(row[0])}{row[0]}v")
+
+    def demangleAll():
+        demangler = BULK_DEMANGLER(demangle_path, cxxfilt=True)
+        for names in mangled.values():
+            demangler.demangle(names)
+        demangler.close()
+
+    if (wanted("demangle_cold") or wanted("demangle")) and getCxxfilt() is None:
+        print(f"[AutoResolv] {DEMANGLE_CXXFILT} not found, demangle stages skipped")
+    else:
+        if wanted("demangle_cold"):
+            results['demangle_cold'], _ = timeStage(demangleAll, repeat, lambda: _removeDb(demangle_path))
+        if wanted("demangle"):
+            if not os.path.exists(demangle_path):
+                demangleAll()
+            results['demangle'], _ = timeStage(demangleAll, repeat)
+
+    def resolve():
+        return resolveImports(exe, True, sysroot=root, store_dir=store_dir)
+
+    if wanted("resolve_cold"):
+        results['resolve_cold'], _ = timeStage(resolve, repeat, lambda: (clearSessionCaches(), _removeTree(store_dir)))
+    if wanted("resolve"):
+        results['resolve'], _ = timeStage(resolve, repeat, clearSessionCaches)
+
+    def cacheSave():
+        cache = DB_CACHE_MANAGER(db_path, work_dir, exe)
+        cache.check_cache_con()
+        cache.create_cache(libs, exe, rpath)
+        cache.save_data(values, cache.CONFIG)
+        cache.save_fingerprints(libs, exe)
+        cache.save_wrappers(bin_imports)
+        cache.close()
+
+    def cacheParse():
+        cache = DB_CACHE_MANAGER(db_path, work_dir, exe)
+        cache.check_cache_con()
+        cache.parse_conf_cache()
+        cache.parse_libinfo_cache()
+        cache.parse_data_cache()
+        values = cache.cached_data
+        cache.close()
+        return values
+
+    # every tenth row now comes from another library, the others are unchanged
+    libnames = list(libs)
+    moved = [[row[0], libnames[(libnames.index(row[1]) + 1) % len(libnames)], row[2], row[3]] if i % 10 == 0 else row
+             for i, row in enumerate(values)]
+
+    def cacheReplace():
+        cache = DB_CACHE_MANAGER(db_path, work_dir, exe)
+        cache.check_cache_con()
+        cache.parse_conf_cache()
+        cache.replace_data(moved, cache.CONFIG)
+        cache.close()
+
+    def cachePage():
+        # what the result window reads: the count, the first screen, a jump, then the same after a sort
+        rows = CACHED_ROWS(db_path, False)
+        screen = []
+        for column in (0, 1):
+            rows.set_order(column)
+            total = len(rows)
+            for start in (0, total // 2):
+                screen += [rows[n] for n in range(start, min(start + 50, total))]
+        rows.close()
+        return screen
+
+    # a selective substring, a broad regex, then a library with a prefix
+    search_terms = [values[len(values) // 3][0][-6:], "/_[0-9]+$/", f"lib:{libnames[0]} ^{values[0][0][:3]}"]
+
+    def cacheSearch():
+        rows = CACHED_ROWS(db_path, False)
+        screen = []
+        for query in search_terms:
+            library, text, mode, demangled = parseSearchQuery(query)
+            rows.set_filter(library, text, mode, demangled)
+            screen += [rows[n] for n in range(min(50, len(rows)))]
+        rows.close()
+        return screen
+
+    def cacheRestore():
+        _removeDb(db_path)
+        shutil.copyfile(db_pristine, db_path)
+
+    # the cache prints its progress, it isn't part of what is measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        if wanted("dbcache_save"):
+            results['dbcache_save'], _ = timeStage(cacheSave, repeat, lambda: _removeDb(db_path))
+        else:
+            _removeDb(db_path)
+            cacheSave()
+        shutil.copyfile(db_path, db_pristine)
+        if wanted("dbcache_parse"):
+            results['dbcache_parse'], _ = timeStage(cacheParse, repeat)
+        if wanted("dbcache_page"):
+            results['dbcache_page'], _ = timeStage(cachePage, repeat)
+        if wanted("dbcache_search"):
+            results['dbcache_search'], _ = timeStage(cacheSearch, repeat)
+        if wanted("dbcache_replace"):
+            results['dbcache_replace'], _ = timeStage(cacheReplace, repeat, cacheRestore)
+
+    resolved = {row[0]: row[1] for row in values}
+    mismatches = [name for name, lib in expected.items() if resolved.get(name) != lib]
+    clearSessionCaches()
+
+    return {
+        'name': getCaseName(*params),
+        'params': {'target': target, 'layout': layout, 'libraries': nb_libs, 'symbols': symbols,
+                   'fanout': fanout, 'imports': imports, 'sections': sections},
+        'counters': {
+            'libraries_found': len([path for path in libs.values() if path != "Path not found"]),
+            'library_symbols': sum(len(f) for f in funs.values() if f is not None),
+            'imports': len(bin_imports),
+            'resolved': len(values),
+            'mismatches': len(mismatches),
+            'corpus_bytes': sum(os.path.getsize(path) for path in lib_paths.values()) + os.path.getsize(exe),
+            'generate_seconds': generate,
+        },
+        'stages': results,
+    }
+
+
+def compareResults(results, baseline, threshold):
+    """Print median ratios against a previous run, return the number of stages slower than threshold"""
+    base = {case['name']: case['stages'] for case in baseline['cases']}
+    regressions = 0
+    print(f"[AutoResolv] Comparing with {baseline['meta'].get('commit')} (ratio = new / baseline median)")
+    for case in results['cases']:
+        if case['name'] not in base:
+            continue
+        for stage, timing in case['stages'].items():
+            old = base[case['name']].get(stage)
+            if old is None or old['median'] <= 0:
+                continue
+            ratio = timing['median'] / old['median']
+            flag = ""
+            if ratio > threshold:
+                regressions += 1
+                flag = "  <-- slower"
+            print(f"[AutoResolv]   {case['name']:<40} {stage:<16} {old['median'] * 1000:10.2f}ms -> {timing['median'] * 1000:10.2f}ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="autoresolv-bench", description="Time the resolver stages on synthetic ELF corpora")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--case", default=None, help="only run cases whose name contains this text")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="only time these stages (repeatable)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per stage, the median is compared")
+    parser.add_argument("--out", default=None, help="results file (default: bench_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="previous results file to compare the medians with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="with --compare, ratio above which a stage counts as a regression")
+    parser.add_argument("--keep", default=None, help="generate the corpora in this directory and keep them")
+    args = parser.parse_args(argv)
+
+    commit, dirty = getGitRevision()
+    cases = [params for params in PRESETS[args.preset] if args.case is None or args.case in getCaseName(*params)]
+    if args.stage is not None and not set(args.stage) - {"import"}:
+        cases = []
+    results = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'preset': args.preset,
+            'repeat': args.repeat,
+            'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'cases': [],
+    }
+
+    status = 0
+    if args.case is None and (args.stage is None or "import" in args.stage):
+        case = runImports(args.repeat)
+        results['cases'].append(case)
+        activation = case['stages']['first_activation']['median'] * 1000
+        budget = case['stages']['reference']['median'] * 1000 * ACTIVATION_IMPORT_BUDGET_RATIO
+        stages = ", ".join(f"{stage} {timing['median'] * 1000:.1f}ms" for stage, timing in case['stages'].items())
+        print(f"[AutoResolv] imports: {stages}")
+        if activation > budget:
+            print(f"[AutoResolv] First activation imports {', '.join(case['counters']['activation_imports'])}: {activation:.1f}ms, "
+                  f"over the {budget:.1f}ms budget ({ACTIVATION_IMPORT_BUDGET_RATIO}x reference) !")
+            status = 1
+
+    base_dir = args.keep or tempfile.mkdtemp(prefix="autoresolv-bench-")
+    try:
+        for i, params in enumerate(cases):
+            name = getCaseName(*params)
+            work_dir = os.path.join(base_dir, name)
+            _removeTree(work_dir)
+            os.makedirs(work_dir)
+            case = runCase(work_dir, params, args.repeat, args.stage)
+            results['cases'].append(case)
+            stages = ", ".join(f"{stage} {timing['median'] * 1000:.1f}ms" for stage, timing in case['stages'].items())
+            print(f"[AutoResolv] [{i + 1}/{len(cases)}] {name}: {stages}")
+            if case['counters']['mismatches']:
+                print(f"[AutoResolv] [{i + 1}/{len(cases)}] {name}: {case['counters']['mismatches']} imports resolved to the wrong library !")
+    finally:
+        if args.keep is None:
+            _removeTree(base_dir)
+
+    out = args.out or f"bench_{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    with open(out, "w") as fd:
+        json.dump(results, fd, indent=2)
+    print(f"[AutoResolv] Results written to {out}")
+
+    if any(case['counters']['mismatches'] for case in results['cases']):
+        status = 1
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        regressions = compareResults(results, baseline, args.threshold)
+        print(f"[AutoResolv] {regressions} stages slower than x{args.threshold:.2f}")
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# Synthetic ELF shared objects and executables for the benchmarks: only the dynamic
+# tables AutoResolv reads (dynsym, dynstr, hash, versions, PLT relocations, dynamic),
+# in one PT_LOAD mapped at address 0 so file offsets and addresses are the same.
+
+import os
+import random
+import struct
+
+ET_DYN = 3
+EM_386 = 3
+EM_MIPS = 8
+EM_PPC = 20
+EM_PPC64 = 21
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+SHT_PROGBITS = 1
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_HASH = 5
+SHT_DYNAMIC = 6
+SHT_REL = 9
+SHT_DYNSYM = 11
+SHT_GNU_VERDEF = 0x6ffffffd
+SHT_GNU_VERNEED = 0x6ffffffe
+SHT_GNU_VERSYM = 0x6fffffff
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_PLTRELSZ = 2
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_RELA = 7
+DT_STRSZ = 10
+DT_SYMENT = 11
+DT_SONAME = 14
+DT_RPATH = 15
+DT_REL = 17
+DT_PLTREL = 20
+DT_JMPREL = 23
+DT_RUNPATH = 29
+DT_VERSYM = 0x6ffffff0
+DT_VERDEF = 0x6ffffffc
+DT_VERDEFNUM = 0x6ffffffd
+DT_VERNEED = 0x6ffffffe
+DT_VERNEEDNUM = 0x6fffffff
+
+STB_GLOBAL = 1
+STB_WEAK = 2
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+
+
+class ELF_TARGET():
+
+    def __init__(self, name, elfclass, endian, machine, rela, jump_slot, triplet):
+        self.name = name
+        self.elfclass = elfclass
+        self.endian = endian
+        self.machine = machine
+        self.rela = rela
+        self.jump_slot = jump_slot
+        self.triplet = triplet
+
+    def __repr__(self):
+        return self.name
+
+
+# every (class, endianness), and the firmware architectures with their own PLT relocation layout
+TARGETS = {
+    "x86_64": ELF_TARGET("x86_64", 64, "<", EM_X86_64, True, 7, "x86_64-linux-gnu"),
+    "i386": ELF_TARGET("i386", 32, "<", EM_386, False, 7, "i386-linux-gnu"),
+    "ppc64": ELF_TARGET("ppc64", 64, ">", EM_PPC64, True, 21, "powerpc64-linux-gnu"),
+    "ppc": ELF_TARGET("ppc", 32, ">", EM_PPC, True, 21, "powerpc-linux-gnu"),
+    "arm": ELF_TARGET("arm", 32, "<", EM_ARM, False, 22, "arm-linux-gnueabihf"),
+    "aarch64": ELF_TARGET("aarch64", 64, "<", EM_AARCH64, True, 1026, "aarch64-linux-gnu"),
+    "mips": ELF_TARGET("mips", 32, ">", EM_MIPS, False, 127, "mips-linux-gnu"),
+    "mipsel": ELF_TARGET("mipsel", 32, "<", EM_MIPS, False, 127, "mipsel-linux-gnu"),
+    "mips64el": ELF_TARGET("mips64el", 64, "<", EM_MIPS, False, 127, "mips64el-linux-gnuabi64"),
+}
+
+
+def elfHash(name):
+    h = 0
+    for c in name.encode():
+        h = (h << 4) + c
+        g = h & 0xf0000000
+        if g:
+            h ^= g >> 24
+        h &= ~g & 0xffffffff
+    return h
+
+
+class _STRTAB():
+
+    def __init__(self):
+        self.blob = bytearray(b"\0")
+        self.offsets = {"": 0}
+
+    def add(self, text):
+        if text not in self.offsets:
+            self.offsets[text] = len(self.blob)
+            self.blob += text.encode() + b"\0"
+        return self.offsets[text]
+
+
+def writeElf(path, target, exports=(), imports=(), needed=(), soname=None, rpath=None, runpath=None, version=None, sections=True):
+    """Write a dynamic ELF file.
+
+    exports: (name, binding, type) defined functions, all at `version` when given.
+    imports: (name, library soname or None, version or None) undefined functions, each one
+    bound by a PLT relocation. sections=False leaves out the section headers, like a stripped firmware.
+    """
+    e = target.endian
+    is64 = target.elfclass == 64
+    addr = "Q" if is64 else "I"
+    ehdr = struct.Struct(e + "16sHHI" + addr * 3 + "IHHHHHH")
+    phdr = struct.Struct(e + ("IIQQQQQQ" if is64 else "IIIIIIII"))
+    shdr = struct.Struct(e + ("IIQQQQIIQQ" if is64 else "IIIIIIIIII"))
+    sym = struct.Struct(e + ("IBBHQQ" if is64 else "IIIBBH"))
+    dyn = struct.Struct(e + ("qQ" if is64 else "iI"))
+    if is64:
+        rel = struct.Struct(e + ("QQq" if target.rela else "QQ"))
+    else:
+        rel = struct.Struct(e + ("IIi" if target.rela else "II"))
+    align = 8 if is64 else 4
+
+    dynstr = _STRTAB()
+    for name in needed:
+        dynstr.add(name)
+    for value in (soname, rpath, runpath, version):
+        if value:
+            dynstr.add(value)
+
+    # symbol 0 is the null symbol, imports then exports
+    symbols = [("", 0, 0)]
+    versym = [0]
+    vernaux = {}  # (library, version) -> version index, indexes 2.. after the verdef ones
+    first_need = 3 if version else 2
+    for name, lib, need in imports:
+        ndx = 1
+        if need and lib:
+            ndx = vernaux.setdefault((lib, need), first_need + len(vernaux))
+        symbols.append((name, (STB_GLOBAL << 4) | STT_FUNC, 0))
+        versym.append(ndx)
+    nb_imports = len(imports)
+    for name, bind, kind in exports:
+        symbols.append((name, (bind << 4) | kind, 1))
+        versym.append(2 if version else 1)
+    for name, _, _ in symbols:
+        dynstr.add(name)
+    for lib, need in vernaux:
+        dynstr.add(lib)
+        dynstr.add(need)
+
+    blob = bytearray()
+
+    def place(data, alignment=align):
+        blob.extend(b"\0" * (-len(blob) % alignment))
+        offset = len(blob)
+        blob.extend(data)
+        return offset
+
+    nb_phdr = 2
+    place(b"\0" * (ehdr.size + nb_phdr * phdr.size))
+    text_off = place(b"\xc3" * 16, 16)
+
+    dynstr_off = place(bytes(dynstr.blob), 1)
+
+    dynsym_data = bytearray()
+    for name, info, shndx in symbols:
+        if is64:
+            dynsym_data += sym.pack(dynstr.add(name), info, 0, shndx, text_off if shndx else 0, 0)
+        else:
+            dynsym_data += sym.pack(dynstr.add(name), text_off if shndx else 0, 0, info, 0, shndx)
+    dynsym_off = place(bytes(dynsym_data))
+
+    nbucket = max(1, len(symbols) // 2)
+    buckets = [0] * nbucket
+    chains = [0] * len(symbols)
+    for i in range(1, len(symbols)):
+        b = elfHash(symbols[i][0]) % nbucket
+        chains[i] = buckets[b]
+        buckets[b] = i
+    hash_off = place(struct.pack(f"{e}II{nbucket}I{len(symbols)}I", nbucket, len(symbols), *buckets, *chains), 4)
+
+    versym_off = place(struct.pack(f"{e}{len(versym)}H", *versym), 2)
+
+    verdef_off = None
+    if version:
+        base = soname or os.path.basename(path)
+        verdef = struct.pack(e + "HHHHIII", 1, 1, 1, 1, elfHash(base), 20, 28) + struct.pack(e + "II", dynstr.add(base), 0)
+        verdef += struct.pack(e + "HHHHIII", 1, 0, 2, 1, elfHash(version), 20, 0) + struct.pack(e + "II", dynstr.add(version), 0)
+        verdef_off = place(verdef, 4)
+
+    verneed_off = None
+    libs = list(dict.fromkeys(lib for lib, _ in vernaux))
+    if libs:
+        verneed = bytearray()
+        for i, lib in enumerate(libs):
+            needs = [(need, ndx) for (l, need), ndx in vernaux.items() if l == lib]
+            next_off = 16 + 16 * len(needs) if i + 1 < len(libs) else 0
+            verneed += struct.pack(e + "HHIII", 1, len(needs), dynstr.add(lib), 16, next_off)
+            for j, (need, ndx) in enumerate(needs):
+                verneed += struct.pack(e + "IHHII", elfHash(need), 0, ndx, dynstr.add(need), 16 if j + 1 < len(needs) else 0)
+        verneed_off = place(bytes(verneed), 4)
+
+    jmprel_data = bytearray()
+    for i in range(1, nb_imports + 1):
+        r_offset = 0x100000 + i * align
+        if not is64:
+            r_info = (i << 8) | target.jump_slot
+        elif target.machine == EM_MIPS and e == "<":
+            # mips64el: r_sym in the low word, the type bytes (r_ssym, r_type3, r_type2, r_type) above it
+            r_info = (target.jump_slot << 56) | i
+        else:
+            r_info = (i << 32) | target.jump_slot
+        if target.rela:
+            jmprel_data += rel.pack(r_offset, r_info, 0)
+        else:
+            jmprel_data += rel.pack(r_offset, r_info)
+    jmprel_off = place(bytes(jmprel_data)) if nb_imports else None
+
+    tags = [(DT_NEEDED, dynstr.add(name)) for name in needed]
+    if soname:
+        tags.append((DT_SONAME, dynstr.add(soname)))
+    if rpath:
+        tags.append((DT_RPATH, dynstr.add(rpath)))
+    if runpath:
+        tags.append((DT_RUNPATH, dynstr.add(runpath)))
+    tags += [(DT_HASH, hash_off), (DT_STRTAB, dynstr_off), (DT_SYMTAB, dynsym_off),
+             (DT_STRSZ, len(dynstr.blob)), (DT_SYMENT, sym.size), (DT_VERSYM, versym_off)]
+    if verdef_off is not None:
+        tags += [(DT_VERDEF, verdef_off), (DT_VERDEFNUM, 2)]
+    if verneed_off is not None:
+        tags += [(DT_VERNEED, verneed_off), (DT_VERNEEDNUM, len(libs))]
+    if jmprel_off is not None:
+        tags += [(DT_JMPREL, jmprel_off), (DT_PLTRELSZ, len(jmprel_data)), (DT_PLTREL, DT_RELA if target.rela else DT_REL)]
+    tags.append((DT_NULL, 0))
+    dynamic_off = place(b"".join(dyn.pack(tag, value) for tag, value in tags))
+    dynamic_size = len(blob) - dynamic_off
+
+    shoff = 0
+    shnum = 0
+    shstrndx = 0
+    if sections:
+        shstr = _STRTAB()
+        entries = [(None, 0, 0, 0, 0, 0, 0)]
+        # (name, type, offset, size, link, info, entsize)
+        entries.append((".text", SHT_PROGBITS, text_off, 16, 0, 0, 0))
+        entries.append((".dynstr", SHT_STRTAB, dynstr_off, len(dynstr.blob), 0, 0, 0))
+        entries.append((".dynsym", SHT_DYNSYM, dynsym_off, len(dynsym_data), 2, 1, sym.size))
+        entries.append((".hash", SHT_HASH, hash_off, 8 + 4 * (nbucket + len(symbols)), 3, 0, 4))
+        entries.append((".gnu.version", SHT_GNU_VERSYM, versym_off, 2 * len(versym), 3, 0, 2))
+        if verdef_off is not None:
+            entries.append((".gnu.version_d", SHT_GNU_VERDEF, verdef_off, 56, 2, 2, 0))
+        if verneed_off is not None:
+            entries.append((".gnu.version_r", SHT_GNU_VERNEED, verneed_off, len(verneed), 2, len(libs), 0))
+        if jmprel_off is not None:
+            entries.append((".rela.plt" if target.rela else ".rel.plt", SHT_RELA if target.rela else SHT_REL, jmprel_off, len(jmprel_data), 3, 0, rel.size))
+        entries.append((".dynamic", SHT_DYNAMIC, dynamic_off, dynamic_size, 2, 0, dyn.size))
+        entries.append((".shstrtab", SHT_STRTAB, 0, 0, 0, 0, 0))
+        for entry in entries[1:]:
+            shstr.add(entry[0])
+        shstr_off = place(bytes(shstr.blob), 1)
+        entries[-1] = (".shstrtab", SHT_STRTAB, shstr_off, len(shstr.blob), 0, 0, 0)
+
+        shoff = place(b"")
+        for name, sh_type, offset, size, link, info, entsize in entries:
+            name_off = shstr.add(name) if name else 0
+            blob.extend(shdr.pack(name_off, sh_type, 0, offset, offset, size, link, info, align if sh_type else 0, entsize))
+        shnum = len(entries)
+        shstrndx = shnum - 1
+
+    ident = b"\x7fELF" + bytes([1 if target.elfclass == 32 else 2, 1 if e == "<" else 2, 1]) + b"\0" * 9
+    ehdr.pack_into(blob, 0, ident, ET_DYN, target.machine, 1, 0, ehdr.size, shoff, 0,
+                   ehdr.size, phdr.size, nb_phdr, shdr.size if sections else 0, shnum, shstrndx)
+    if is64:
+        phdr.pack_into(blob, ehdr.size, PT_LOAD, 5, 0, 0, 0, len(blob), len(blob), 0x1000)
+        phdr.pack_into(blob, ehdr.size + phdr.size, PT_DYNAMIC, 6, dynamic_off, dynamic_off, dynamic_off, dynamic_size, dynamic_size, align)
+    else:
+        phdr.pack_into(blob, ehdr.size, PT_LOAD, 0, 0, 0, len(blob), len(blob), 5, 0x1000)
+        phdr.pack_into(blob, ehdr.size + phdr.size, PT_DYNAMIC, dynamic_off, dynamic_off, dynamic_off, dynamic_size, dynamic_size, 6, align)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fd:
+        fd.write(blob)
+    return path
+
+
+# where libraries and the executable live for each search path layout, relative to the sysroot
+LAYOUTS = ("system", "rpath", "runpath")
+
+
+def makeCorpus(root, target, nb_libs=8, symbols=2000, fanout=4, imports=1000, layout="system", versions=True, sections=True, seed=0):
+    """Sysroot with one executable and `nb_libs` libraries, return (executable path, {soname: path}, expected).
+
+    The executable needs the first `fanout` libraries, the others are needed by an earlier
+    library, so every library is reached through the dependency closure. `expected` maps each
+    import to the soname that must resolve it, None when no library exports it.
+    """
+    rand = random.Random(seed)
+    fanout = max(1, min(fanout, nb_libs))
+    sonames = [f"libbench{i}.so.1" for i in range(nb_libs)]
+    if layout == "system":
+        bin_dir = "usr/bin"
+        lib_dirs = [f"usr/lib/{target.triplet}"] * nb_libs
+    elif layout == "rpath":
+        bin_dir = "opt/app/bin"
+        lib_dirs = ["opt/app/lib"] * nb_libs
+    elif layout == "runpath":
+        bin_dir = "opt/app/bin"
+        lib_dirs = ["opt/vendor/lib" if i % 2 else "opt/app/lib" for i in range(nb_libs)]
+    else:
+        raise ValueError(f"unknown layout {layout}")
+
+    deps = {i: [] for i in range(nb_libs)}
+    for i in range(fanout, nb_libs):
+        deps[rand.randrange(0, i)].append(i)
+
+    # a few names are exported by two libraries to exercise precedence, some weak, some ifunc
+    exports = {}
+    providers = {}
+    for i in range(nb_libs):
+        funs = []
+        for j in range(symbols):
+            name = f"bench{i}_fun{j}"
+            if j % 50 == 0 and i > 0:
+                name = f"bench{rand.randrange(0, i)}_fun{j}"
+            bind = STB_WEAK if j % 17 == 0 else STB_GLOBAL
+            kind = STT_GNU_IFUNC if j % 101 == 0 else STT_FUNC
+            funs.append((name, bind, kind))
+        exports[i] = funs
+
+    # ld.so breadth-first order decides the provider of a name exported twice
+    order = list(range(fanout))
+    for i in order:
+        order += [dep for dep in deps[i] if dep not in order]
+    for i in order:
+        for name, _, _ in exports[i]:
+            providers.setdefault(name, i)
+
+    names = sorted(providers)
+    picked = rand.sample(names, min(imports, len(names)))
+    missing = max(1, imports // 50)
+    picked += [f"bench_missing{k}" for k in range(missing)]
+    rand.shuffle(picked)
+
+    expected = {}
+    bin_imports = []
+    for name in picked:
+        lib = providers.get(name)
+        soname = sonames[lib] if lib is not None else None
+        expected[name] = soname
+        bin_imports.append((name, soname, f"BENCH{lib}_1.0" if versions and lib is not None else None))
+
+    paths = {}
+    for i in range(nb_libs):
+        path = os.path.join(root, lib_dirs[i], sonames[i])
+        runpath = None
+        if layout == "runpath":
+            # DT_RUNPATH isn't inherited, every library carries its own
+            runpath = "$ORIGIN:$ORIGIN/../../vendor/lib:$ORIGIN/../../app/lib"
+        writeElf(path, target, exports[i], (), [sonames[dep] for dep in deps[i]], sonames[i],
+                 runpath=runpath, version=f"BENCH{i}_1.0" if versions else None, sections=sections)
+        paths[sonames[i]] = path
+
+    rpath = runpath = None
+    if layout == "rpath":
+        rpath = "$ORIGIN/../lib"
+    elif layout == "runpath":
+        runpath = "/opt/vendor/lib:$ORIGIN/../lib"
+    exe = os.path.join(root, bin_dir, "benchapp")
+    writeElf(exe, target, (), bin_imports, sonames[:fanout], rpath=rpath, runpath=runpath, sections=sections)
+    return exe, paths, expected
@@ -198,8 +198,8 @@ class GUI_EXPORT(QtWidgets.QDialog):
             if "No db found in" in file:
                 self.listcache.addItem(file)
                 added_count += 1
-            elif file.endswith(".db"):
-                # Skip current library's own cache
+            elif file.startswith(".cache_") and file.endswith(".db"):
+                # Skip current library's own cache, shared indexes of db/ aren't binary caches
                 if file != current_cache:
                     self.listcache.addItem(file)
                     added_count += 1
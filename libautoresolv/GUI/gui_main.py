@@ -22,7 +22,10 @@ from libautoresolv.resultshower import ResultShower
 from libautoresolv.util import *
 from libautoresolv.error import *
 from libautoresolv.dbcache import *
+from libautoresolv.pool import *
+from libautoresolv.profiler import *
 from libautoresolv.GUI.gui_export import GUI_EXPORT
+from libautoresolv.GUI.gui_worker import RESOLVE_WORKER
 
 export_windows = []
 
@@ -30,6 +33,7 @@ class GUI_MAIN(QtWidgets.QDialog):
     def __init__(self, cache):
         QtWidgets.QDialog.__init__(self, None, QtCore.Qt.WindowSystemMenuHint | QtCore.Qt.WindowTitleHint | QtCore.Qt.WindowCloseButtonHint)
         self.cache = cache
+        self.resolving = False
         self.setupUi()
         self.setupAction()
         self.setupLabel()
@@ -192,6 +196,19 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.b_libpathchange.setMinimumHeight(28)
         libpaths_layout.addWidget(self.b_libpathchange)
 
+        libpaths_layout.addWidget(QLabel("Firmware sysroot (empty resolves on this host):"))
+
+        self.lineedit_sysroot = QLineEdit()
+        self.lineedit_sysroot.setObjectName(u"lineedit_sysroot")
+        self.lineedit_sysroot.setMinimumHeight(26)
+        self.lineedit_sysroot.setPlaceholderText("Enter extracted root filesystem path...")
+        libpaths_layout.addWidget(self.lineedit_sysroot)
+
+        self.b_sysroot = QPushButton("Set Sysroot")
+        self.b_sysroot.setObjectName(u"b_sysroot")
+        self.b_sysroot.setMinimumHeight(28)
+        libpaths_layout.addWidget(self.b_sysroot)
+
         top_layout.addWidget(self.libpaths_group)
 
         # Set equal stretch for top section
@@ -222,6 +239,11 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.c_demangle.setTristate(False)
         params_layout.addWidget(self.c_demangle)
 
+        self.c_cxxfilt = QCheckBox("Demangle with c++filt (faster, names differ from IDA)")
+        self.c_cxxfilt.setObjectName(u"c_cxxfilt")
+        self.c_cxxfilt.setTristate(False)
+        params_layout.addWidget(self.c_cxxfilt)
+
         self.c_comment = QCheckBox("Comment IDA code")
         self.c_comment.setObjectName(u"c_comment")
         self.c_comment.setTristate(False)
@@ -232,6 +254,31 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.c_verbose.setTristate(False)
         params_layout.addWidget(self.c_verbose)
 
+        # -1 shows "All", 0 comments the wrappers only
+        xref_layout = QHBoxLayout()
+        xref_layout.addWidget(QLabel("Call sites commented per function"))
+        self.s_xref_limit = QSpinBox()
+        self.s_xref_limit.setObjectName(u"s_xref_limit")
+        self.s_xref_limit.setRange(-1, 1000000)
+        self.s_xref_limit.setSpecialValueText("All")
+        xref_layout.addWidget(self.s_xref_limit)
+        params_layout.addLayout(xref_layout)
+
+        self.c_xref_sample = QCheckBox("Spread commented call sites over the binary")
+        self.c_xref_sample.setObjectName(u"c_xref_sample")
+        self.c_xref_sample.setTristate(False)
+        params_layout.addWidget(self.c_xref_sample)
+
+        self.c_profile = QCheckBox("Write a profiling report per run")
+        self.c_profile.setObjectName(u"c_profile")
+        self.c_profile.setTristate(False)
+        params_layout.addWidget(self.c_profile)
+
+        self.c_cprofile = QCheckBox("Also capture a cProfile (slower)")
+        self.c_cprofile.setObjectName(u"c_cprofile")
+        self.c_cprofile.setTristate(False)
+        params_layout.addWidget(self.c_cprofile)
+
         bottom_layout.addWidget(params_group)
 
         # Information Group
@@ -351,7 +398,15 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.c_comment.setChecked(self.cache.CONFIG['comment'])
         self.c_libc.setChecked(self.cache.CONFIG['libc'])
         self.c_demangle.setChecked(self.cache.CONFIG['demangle'])
+        self.c_cxxfilt.setChecked(self.cache.CONFIG['cxxfilt'])
         self.c_verbose.setChecked(self.cache.CONFIG['verbose'])
+        limit = self.cache.CONFIG['comment_xref_limit']
+        self.s_xref_limit.setValue(-1 if limit is None else limit)
+        self.c_xref_sample.setChecked(self.cache.CONFIG['comment_xref_sample'])
+        self.c_profile.setChecked(self.cache.CONFIG['profile'])
+        self.c_cprofile.setChecked(self.cache.CONFIG['cprofile'])
+        if self.cache.CONFIG['sysroot']:
+            self.lineedit_sysroot.setText(self.cache.CONFIG['sysroot'])
 
         # Populate library search paths with intelligent Windows path merging
         if len(self.cache.rpath) >= 1:
@@ -411,7 +466,10 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.v_info_bin_path.setToolTip(f"Full path: {self.cache.bin_path}")
 
         # Set cache data status
-        if self.cache.is_cached_data:
+        if self.cache.is_cached_data and self.cache.stale_libs:
+            self.v_info_db_value.setText(f"Yes, {len(self.cache.stale_libs)} changed libraries")
+            self.v_info_db_value.setStyleSheet("QLabel { color: #ca5010; font-style: italic; font-weight: bold; }")
+        elif self.cache.is_cached_data:
             self.v_info_db_value.setText("Yes")
             self.v_info_db_value.setStyleSheet("QLabel { color: #107c10; font-style: italic; font-weight: bold; }")
         else:
@@ -428,7 +486,12 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.c_comment.clicked.connect(self.on_parameter_modified)
         self.c_libc.clicked.connect(self.on_parameter_modified)
         self.c_demangle.clicked.connect(self.on_parameter_modified)
+        self.c_cxxfilt.clicked.connect(self.on_parameter_modified)
         self.c_verbose.clicked.connect(self.on_parameter_modified)
+        self.s_xref_limit.editingFinished.connect(self.on_parameter_modified)
+        self.c_xref_sample.clicked.connect(self.on_parameter_modified)
+        self.c_profile.clicked.connect(self.on_parameter_modified)
+        self.c_cprofile.clicked.connect(self.on_parameter_modified)
         self.combobox_lib.activated.connect(self.on_combox_event)
         self.b_cleandb.clicked.connect(self.on_button_cleandb)
         self.b_libchange.clicked.connect(self.on_button_libchange)
@@ -436,6 +499,7 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.b_refactor_export.clicked.connect(self.on_button_export)
         self.b_refactor_import.clicked.connect(self.on_button_import)
         self.b_libpathchange.clicked.connect(self.on_newlibpath)
+        self.b_sysroot.clicked.connect(self.on_sysroot)
         self.libpath_list.customContextMenuRequested.connect(self.show_libpath_context_menu)
 
 
@@ -473,7 +537,15 @@ class GUI_MAIN(QtWidgets.QDialog):
 
             # Extract signatures from current library
             print("[AutoResolv] Extracting function signatures...")
-            cpt, allsig = getSignature(values, self.cache.CONFIG)
+            startProfiler("export_" + idaapi.get_root_filename(), self.cache.modpath, self.cache.CONFIG['profile'], self.cache.CONFIG['cprofile'])
+            sigcache = openSignatureCache(self.cache.modpath, self.cache.CONFIG['verbose'])
+            try:
+                with profileCapture(), profilePhase("signature"):
+                    cpt, allsig = getSignature(values, self.cache.CONFIG, sigcache)
+            finally:
+                if sigcache is not None:
+                    sigcache.close()
+                stopProfiler()
 
             if cpt == 0:
                 QtWidgets.QMessageBox.warning(self, "Export Warning",
@@ -512,7 +584,12 @@ class GUI_MAIN(QtWidgets.QDialog):
             if self.cache.CONFIG['verbose']:
                 print("[AutoResolv] Parsed cached successfully. Refactoring wrapper and XREF using signature")
 
-            cpt, xref_cpt = refactorExtern(sigs, self.cache.CONFIG)
+            startProfiler("import_" + idaapi.get_root_filename(), self.cache.modpath, self.cache.CONFIG['profile'], self.cache.CONFIG['cprofile'])
+            try:
+                with profileCapture():
+                    cpt, xref_cpt = refactorExtern(sigs, self.cache.CONFIG)
+            finally:
+                stopProfiler()
 
             if self.cache.CONFIG['verbose']:
                 print(f"[AutoResolv] Successfully patched {cpt} functions and {xref_cpt} Xrefs")
@@ -574,6 +651,9 @@ class GUI_MAIN(QtWidgets.QDialog):
 
                     # Attempt to remove the database file
                     os.remove(self.cache.db_path)
+                    for suffix in ("-wal", "-shm"):
+                        if os.path.exists(self.cache.db_path + suffix):
+                            os.remove(self.cache.db_path + suffix)
 
                     if self.cache.CONFIG['verbose']:
                         print("[AutoResolv] Cleaned DB Cache successful")
@@ -679,6 +759,33 @@ class GUI_MAIN(QtWidgets.QDialog):
         self.update_paths_count()
 
 
+    def on_sysroot(self):
+        sysroot = self.lineedit_sysroot.text().strip() or None
+        if sysroot is not None and not os.path.isdir(sysroot):
+            raise Exception(f"[AutoResolv] Sysroot {sysroot} is not a directory")
+
+        self.cache.CONFIG['sysroot'] = sysroot
+        self.cache.save_conf(self.cache.CONFIG)
+
+        # DT_NEEDED libraries are searched again below the new root, changed paths are resolved again
+        libs, _ = getLibsFromBin(self.cache.bin_path, sysroot, self.cache.CONFIG['verbose'])
+        for lib, path in libs.items():
+            if self.cache.libsinfo.get(lib) != path:
+                self.cache.setNewLibPath(lib, path, self.cache.CONFIG)
+        self.cache.parse_libinfo_cache()
+
+        self.lib_list.clear()
+        self.combobox_lib.clear()
+        for lib in self.cache.libsinfo:
+            lib_path = os.path.normpath(self.cache.libsinfo[lib])
+            self.lib_list.addItem(f"{lib} | {lib_path}")
+            self.combobox_lib.addItem(lib)
+
+        if self.cache.CONFIG['verbose']:
+            print(f"[AutoResolv] Set sysroot to {sysroot}, updated cache and GUI")
+        self.update_libs_count()
+
+
     def show_libpath_context_menu(self, position):
         """Show context menu for library search paths"""
         # Check if an item is selected
@@ -785,31 +892,24 @@ class GUI_MAIN(QtWidgets.QDialog):
 
     def on_button_resolv(self):
         try:
-            if self.cache.is_cached_data:
-                values = self.cache.cached_data
-                if self.cache.CONFIG['verbose']:
-                    print("[AutoResolv] Data found in DB Cache, not resolving again")
-
-                rs = ResultShower("Result", values, self.cache.CONFIG['demangle'])
-                r = rs.show()
-                self.close()
-                return
-
+            startProfiler("resolve_" + idaapi.get_root_filename(), self.cache.modpath, self.cache.CONFIG['profile'], self.cache.CONFIG['cprofile'])
             if self.cache.CONFIG['verbose']:
                 print("[AutoResolv] Looking for extern functions in .PLT | .PLT-SEC segment")                            
-            start,end = get_seg(".plt")
-            
-            wrapper_funs_plt = {}
-            wrapper_funs_plt2 = {}
-            if start is not None and end is not None:
-                wrapper_funs_plt = get_extern(start,end)
-            
-            start,end = get_seg(".plt.sec")
-            if start is not None and end is not None:
-                wrapper_funs_plt2 = get_extern(start,end)
-         
+            with profileCapture(), profilePhase("segment_scan"):
+                start,end = get_seg(".plt")
+
+                wrapper_funs_plt = {}
+                wrapper_funs_plt2 = {}
+                if start is not None and end is not None:
+                    wrapper_funs_plt = get_extern(start,end)
+
+                start,end = get_seg(".plt.sec")
+                if start is not None and end is not None:
+                    wrapper_funs_plt2 = get_extern(start,end)
+
             funs_binary = dict(wrapper_funs_plt)
             funs_binary.update(wrapper_funs_plt2)
+            profileCount("wrappers", len(funs_binary))
 
             if len(funs_binary) == 0:
                 raise IdaGetFunsError
@@ -817,84 +917,166 @@ class GUI_MAIN(QtWidgets.QDialog):
             if self.cache.CONFIG['verbose']:
                 print(f"[AutoResolv] Got {len(funs_binary)} functions")      
 
+            # cached rows are reused, only new, unresolved or possibly overridden wrappers are resolved
+            self.kept_rows = []
+            self.wrapper_names = set(getWrapperName(fun) for fun in funs_binary)
+            if self.cache.is_cached_data and self.cache.data_demangle == self.cache.CONFIG['demangle']:
+                known = self.cache.parse_wrappers()
+                # same wrappers and libraries as the last resolve: the cached rows are paged, never loaded
+                if not self.cache.stale_libs and known == self.wrapper_names:
+                    funs_binary = {}
+                    self.kept_rows = None
+                else:
+                    funs_binary, self.kept_rows = getIncrementalWork(funs_binary, self.cache.cached_data, self.cache.libsinfo, self.cache.stale_libs, known)
+                if not funs_binary and (self.kept_rows is None or len(self.kept_rows) == self.cache.cached_count):
+                    if self.cache.CONFIG['verbose']:
+                        print("[AutoResolv] Data found in DB Cache, not resolving again")
+
+                    stopProfiler()
+                    self.show_cached_results()
+                    self.close()
+                    return
+                print(f"[AutoResolv] Incremental resolve: {len(self.kept_rows)} cached rows kept, {len(funs_binary)} wrappers to resolve")
+                profileCount("cached_rows_kept", len(self.kept_rows))
+
             total_libs = len(self.cache.libsinfo)
             self.progress = QProgressDialog("Parsing libraries...", "Cancel", 0, total_libs, self)
             self.progress.setWindowModality(Qt.WindowModal)
             self.progress.setAutoClose(False)  # Manual close for better control
             self.progress.setMinimumDuration(0)  # Show immediately
             self.progress.show()
-            QCoreApplication.processEvents()  # Force initial display
-
-            self.libsfun = {}
-            for i, lib in enumerate(self.cache.libsinfo):
-                # Update UI before processing
-                self.progress.setLabelText(f"Parsing library: {lib} ({i+1}/{total_libs})")
-                self.progress.setValue(i)
-                QCoreApplication.processEvents()  # Refresh UI immediately
-
-                if self.progress.wasCanceled():
-                    self.progress.close()
-                    return
-
-                # Perform time-consuming operation
-                funs = getAllFunsFromLib(self.cache.libsinfo[lib], self.cache.CONFIG['libc'])
-
-                if funs is None:
-                    if self.cache.CONFIG['verbose']:
-                        print(f"[AutoResolv] Couldn't parse {lib}")
-                    continue
-                else:
-                    if self.cache.CONFIG['verbose']:
-                        print(f"[AutoResolv] Parsed {lib}")
-                    self.libsfun[lib] = funs
 
-                # Update progress after completion
-                QCoreApplication.processEvents()  # Keep UI responsive
+            # ELF parsing and matching run in a worker thread, the UI only reacts to its signals
+            self.rs = None
+            self.result_rows = list(self.kept_rows)
+            self.worker = RESOLVE_WORKER(funs_binary, self.cache, self)
+            self.worker.libParsed.connect(self.on_resolve_lib_parsed)
+            self.worker.rowsChanged.connect(self.on_resolve_rows_changed)
+            self.worker.resolveDone.connect(self.on_resolve_done)
+            self.worker.resolveFailed.connect(self.on_resolve_failed)
+            self.progress.canceled.connect(self.on_resolve_canceled)
+            # cleared by whichever of done, failed or canceled comes first, the profiler is stopped once
+            self.resolving = True
+            self.worker.start()
 
-            self.progress.setValue(total_libs)
-            QCoreApplication.processEvents()
-
-            if self.cache.CONFIG['verbose']:
-                print("\n[AutoResolv] All libs parsed. Resolving now...\n")
-
-            # Show resolving phase with updated progress dialog
-            self.progress.setLabelText("Resolving functions...")
-            self.progress.setRange(0, 0)  # Indeterminate progress
-            QCoreApplication.processEvents()
-
-            values, external_resolved= Resolve(funs_binary, self.libsfun, self.cache.libsinfo, self.cache.CONFIG)
+        except Exception as e:
+            stopProfiler()
+            if hasattr(self, 'progress'):
+                self.close_progress()
+            QtWidgets.QMessageBox.critical(self, "Error", str(e))
 
-            # Close progress dialog after resolving
-            self.progress.close()
-            QCoreApplication.processEvents()  # Allow UI to refresh before showing results
+    def close_progress(self):
+        # QProgressDialog emits canceled when it is closed, only the Cancel button may reach on_resolve_canceled
+        try:
+            self.progress.canceled.disconnect(self.on_resolve_canceled)
+        except TypeError:
+            pass
+        self.progress.close()
+
+    def show_cached_results(self):
+        rows = CACHED_ROWS(self.cache.db_path, self.cache.CONFIG['demangle'])
+        self.rs = ResultShower("Result", rows, self.cache.CONFIG['demangle'])
+        self.rs.show()
+
+    def on_resolve_lib_parsed(self, lib, done, total_libs):
+        self.progress.setLabelText(f"Parsed library: {lib} ({done}/{total_libs})")
+        self.progress.setValue(done)
+
+    def on_resolve_rows_changed(self, new_rows, moved):
+        # Results window opens with the first resolved rows and grows with each library
+        self.result_rows.extend(new_rows)
+        offset = len(self.kept_rows)
+        for n, row in moved:
+            self.result_rows[offset + n] = row
+        if self.rs is None:
+            self.rs = ResultShower("Result", self.result_rows, self.cache.CONFIG['demangle'])
+            self.rs.show()
+        else:
+            self.rs.update_items()
 
-            rs = ResultShower("Result", values, self.cache.CONFIG['demangle'])
-            r = rs.show()
+    def on_resolve_canceled(self):
+        if not self.resolving:
+            return
+        self.resolving = False
+        self.worker.cancel()
+        self.close_progress()
+        print("[AutoResolv] Resolving canceled")
+        stopProfiler()
+
+    def on_resolve_failed(self, message):
+        if not self.resolving:
+            return
+        self.resolving = False
+        stopProfiler()
+        self.close_progress()
+        QtWidgets.QMessageBox.critical(self, "Error", message)
+
+    def on_resolve_done(self, values, external_resolved):
+        # a result queued before the user canceled is dropped, its profiler is already stopped
+        if not self.resolving:
+            return
+        self.resolving = False
+        try:
+            self.progress.setValue(self.progress.maximum())
+            self.close_progress()
+
+            # a (fun_name, library) pair is saved once, so are the shown rows and cached_count
+            values = getUniqueRows(self.kept_rows + values)
+            self.result_rows[:] = values
+            if self.rs is None:
+                self.rs = ResultShower("Result", self.result_rows, self.cache.CONFIG['demangle'])
+                self.rs.show()
+            else:
+                self.rs.update_items()
 
             if self.cache.CONFIG['comment']:
                 if self.cache.CONFIG['verbose']:
                     print("[AutoResolv] Adding libname in IDA code near the call")
-                CommentFuns(external_resolved, self.cache.CONFIG)
+                with profileCapture(), profilePhase("comment"):
+                    executeSync(lambda: CommentFuns(external_resolved, self.cache.CONFIG), write=True)
     
-            self.cache.save_data(values, self.cache.CONFIG)
+            with profileCapture(), profilePhase("save"):
+                self.cache.replace_data(values, self.cache.CONFIG)
+                self.cache.save_fingerprints(self.cache.libsinfo, self.cache.bin_path)
+                self.cache.save_wrappers(self.wrapper_names)
+            self.cache.cached_data = values
+            self.cache.is_cached_data = True
+            # sorting and search run on the saved rows
+            self.rs.set_items(CACHED_ROWS(self.cache.db_path, self.cache.CONFIG['demangle']))
             if self.cache.CONFIG['verbose']:
                 print("[AutoResolv] Data Saved to Cache")
                 
             if self.cache.CONFIG['verbose']:
                 print("[AutoResolv] All done ")
 
+            stopProfiler()
             self.close()
             
         except Exception as e:
-            if hasattr(self, 'progress'):
-                self.progress.close()
+            stopProfiler()
             QtWidgets.QMessageBox.critical(self, "Error", str(e))
 
     def on_parameter_modified(self):
+        if self.cache.CONFIG['libc'] != self.c_libc.isChecked():
+            # libc functions are skipped or matched from now on, the next Resolve rechecks libc
+            for lib, path in self.cache.libsinfo.items():
+                if "libc.so" in path and lib not in self.cache.stale_libs:
+                    self.cache.stale_libs.append(lib)
+        if self.cache.CONFIG['cxxfilt'] != self.c_cxxfilt.isChecked():
+            # rows of one cache keep a single demangled format, the next Resolve demangles them all again
+            for lib in self.cache.libsinfo:
+                if lib not in self.cache.stale_libs:
+                    self.cache.stale_libs.append(lib)
         self.cache.CONFIG['libc'] = self.c_libc.isChecked()
+        self.cache.CONFIG['cxxfilt'] = self.c_cxxfilt.isChecked()
         self.cache.CONFIG['demangle'] = self.c_demangle.isChecked()
         self.cache.CONFIG['comment'] = self.c_comment.isChecked()
         self.cache.CONFIG['verbose'] = self.c_verbose.isChecked()
+        limit = self.s_xref_limit.value()
+        self.cache.CONFIG['comment_xref_limit'] = None if limit < 0 else limit
+        self.cache.CONFIG['comment_xref_sample'] = self.c_xref_sample.isChecked()
+        self.cache.CONFIG['profile'] = self.c_profile.isChecked()
+        self.cache.CONFIG['cprofile'] = self.c_cprofile.isChecked()
 
         self.cache.save_conf(self.cache.CONFIG)
         if self.cache.CONFIG['verbose']:
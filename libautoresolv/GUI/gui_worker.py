@@ -0,0 +1,113 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+from PyQt5 import QtCore
+from PyQt5.QtCore import *
+
+from libautoresolv.util import *
+from libautoresolv.error import *
+from libautoresolv.pool import *
+
+
+class RESOLVE_WORKER(QtCore.QThread):
+    """Parse and match the libraries off the UI thread, results come back as signals.
+
+    No IDA API is called from run() except through execute_sync (idaDemangleNames).
+    """
+
+    libParsed = pyqtSignal(str, int, int)  # library, parsed count, total
+    rowsChanged = pyqtSignal(object, object)  # copies of the new rows, [(position, copy of a moved row)]
+    resolveDone = pyqtSignal(object, object)  # rows, {wrapper: [ea, library]}
+    resolveFailed = pyqtSignal(str)
+
+    def __init__(self, funs_binary, cache, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.funs_binary = funs_binary
+        self.libsinfo = dict(cache.libsinfo)
+        self.config = dict(cache.CONFIG)
+        self.modpath = cache.modpath
+        self.bin_path = getattr(cache, "bin_path", None)
+        # read here, on the main thread
+        self.demangle_engine = getIdaDemangleEngine() if self.config['demangle'] else None
+        self.token = CANCEL_TOKEN()
+        self.parser = None
+
+    def cancel(self):
+        # called from the UI thread: processes still parsing are killed, run() returns at its next poll
+        self.token.cancel()
+        if self.parser is not None:
+            self.parser.terminate()
+
+    def run(self):
+        with profileCapture():
+            self._run()
+
+    def _run(self):
+        demangler = None
+        try:
+            store_dir = os.path.join(self.modpath, SYMSTORE_DIR)
+
+            # versions from .gnu.version_r pick memcpy@GLIBC_2.14 over memcpy@GLIBC_2.2.5 like the loader
+            versions = getImportVersionsFromBin(self.bin_path)
+            resolver = IMPORT_RESOLVER(self.funs_binary, self.libsinfo, None, versions)
+            if self.config['demangle']:
+                demangler = BULK_DEMANGLER(os.path.join(self.modpath, DEMANGLE_CACHE_NAME), idaDemangleNames, self.demangle_engine,
+                                           verbose=self.config['verbose'], cxxfilt=self.config['cxxfilt'])
+            self.parser = LIB_PARSER_POOL(verbose=self.config['verbose'], token=self.token)
+
+            total_libs = len(self.libsinfo)
+            done = 0
+            for lib, funs in self.parser.parse(self.libsinfo, self.config['libc'], store_dir=store_dir):
+                if self.token.is_canceled():
+                    break
+                if lib is None:
+                    continue
+
+                done += 1
+                self.libParsed.emit(lib, done, total_libs)
+                if funs is None:
+                    if self.config['verbose']:
+                        print(f"[AutoResolv] Couldn't parse {lib}")
+                    continue
+
+                with profilePhase("match", lib):
+                    new_rows, moved = resolver.feed(lib, funs)
+                if new_rows and demangler is not None:
+                    with profilePhase("demangle"):
+                        demangler.demangleRows(new_rows)
+                profileCount("library_symbols", len(funs))
+                if self.config['verbose']:
+                    print(f"[AutoResolv] Parsed {lib}, resolved {len(new_rows)} functions ({len(resolver.pending)} pending)")
+
+                # only what changed crosses threads, the rows themselves keep being updated by feed()
+                if new_rows or moved:
+                    self.rowsChanged.emit([list(row) for row in new_rows], [(n, list(resolver.values[n])) for n in moved])
+
+            self.parser.shutdown(wait=not self.token.is_canceled())
+            if self.token.is_canceled():
+                return
+
+            if demangler is not None and self.config['verbose']:
+                print(f"[AutoResolv] Demangle cache: {demangler.hits} names from cache, {demangler.misses} demangled ({demangler.engine})")
+            profileCount("libraries", total_libs)
+            profileCount("resolved", len(resolver.values))
+            self.resolveDone.emit(resolver.values, resolver.resolved)
+
+        except Exception as e:
+            self.resolveFailed.emit(str(e))
+        finally:
+            clearFunsCache()
+            if demangler is not None:
+                demangler.close()
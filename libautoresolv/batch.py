@@ -0,0 +1,233 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# Headless driver: resolve a list or a tree of ELF binaries without the GUI.
+#   python -m libautoresolv.batch [options] <binary|directory>...
+#   idat64 -A -S"path/to/libautoresolv/batch.py [options] <binary|directory>..." any_input
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libautoresolv.error import *
+from libautoresolv.elfutil import *
+from libautoresolv.core import *
+from libautoresolv.symstore import *
+from libautoresolv.dbcache import *
+from libautoresolv.pool import *
+from libautoresolv.profiler import *
+
+REPORT_NAME = "autoresolv_batch_report.json"
+
+
+def getDefaultDbPath():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "db")
+
+
+def getCachePath(db_dir, bin_path):
+    # same name the plugin derives from idaapi.get_root_filename()
+    return os.path.join(db_dir, ".cache_" + os.path.basename(bin_path) + ".db")
+
+
+def findBinaries(paths, exec_only=False):
+    candidates = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    if not os.path.islink(full) and os.path.isfile(full):
+                        candidates.append(full)
+        else:
+            candidates.append(path)
+
+    binaries = []
+    for path in candidates:
+        if exec_only and ".so" in os.path.basename(path):
+            continue
+        if isDynamicElf(path):
+            binaries.append(os.path.abspath(path))
+    return binaries
+
+
+def resolveBinary(bin_path, db_dir, libc=False, force=False, verbose=False, sysroot=None, profile=None, cprofile=None):
+    result = {
+        'binary': bin_path,
+        'cache': getCachePath(db_dir, bin_path),
+        'libs': 0,
+        'libs_found': 0,
+        'imports': 0,
+        'resolved': 0,
+        'symbols': 0,
+        'store_hits': 0,
+        'seconds': 0.0,
+        'skipped': None,
+        'error': None,
+        'profile': None,
+    }
+    t_start = time.time()
+    log = io.StringIO()
+    cache = None
+    profiler = startProfiler("batch_" + os.path.basename(bin_path), db_dir, profile, cprofile)
+
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else log), profileCapture():
+            db_path = result['cache']
+            if force:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(db_path + suffix):
+                        os.remove(db_path + suffix)
+
+            cache = DB_CACHE_MANAGER(db_path, db_dir, bin_path)
+            if cache.check_cache_con():
+                result['skipped'] = "cache already exists, use --force to resolve again"
+                return result
+
+            # DT_NEEDED order, the first library exporting a name wins like in the loader
+            found = resolveImports(bin_path, libc, sysroot=sysroot, store_dir=os.path.join(db_dir, SYMSTORE_DIR))
+            libs, rpath, values = found['libs'], found['rpath'], found['values']
+            result['libs'] = len(libs)
+            result['libs_found'] = found['libs_found']
+            result['imports'] = len(found['imports'])
+            result['symbols'] = found['symbols']
+            result['resolved'] = len(values)
+            result['store_hits'] = found['store_hits']
+
+            with profilePhase("save"):
+                cache.create_cache(libs, bin_path, rpath)
+                cache.CONFIG['demangle'] = False
+                cache.save_conf(cache.CONFIG)
+                cache.save_data(values, cache.CONFIG)
+                cache.save_fingerprints(libs, bin_path)
+                cache.save_wrappers(found['imports'])
+                cache.cache_save_bininfo(bin_path)
+
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        if cache is not None:
+            cache.close()
+        result['seconds'] = time.time() - t_start
+        if profiler is not None:
+            with contextlib.redirect_stdout(sys.stdout if verbose else log):
+                result['profile'] = stopProfiler()
+
+    return result
+
+
+def _printResult(result, done, total):
+    name = os.path.basename(result['binary'])
+    if result['skipped']:
+        print(f"[AutoResolv] [{done}/{total}] {name}: skipped, {result['skipped']}")
+    elif result['error']:
+        print(f"[AutoResolv] [{done}/{total}] {name}: {result['error']}")
+    else:
+        print(f"[AutoResolv] [{done}/{total}] {name}: {result['resolved']}/{result['imports']} imports resolved from {result['libs_found']}/{result['libs']} libraries in {result['seconds']:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="autoresolv-batch", description="Resolve imported functions of ELF binaries without the IDA GUI")
+    parser.add_argument("paths", nargs="+", help="binaries, or directories scanned recursively for dynamic ELF files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--db", default=getDefaultDbPath(), help="directory of the .cache_<bin>.db files and shared symbol store")
+    parser.add_argument("--sysroot", default=None, help="root of the extracted firmware, DT_NEEDED libraries are searched below it")
+    parser.add_argument("--libc", action="store_true", help="also resolve libc functions")
+    parser.add_argument("--force", action="store_true", help="resolve again binaries that already have a cache")
+    parser.add_argument("--exec-only", action="store_true", help="skip shared objects (*.so*) found in directories")
+    parser.add_argument("--profile", action="store_true", help="write a per-phase timing report of each binary next to its cache")
+    parser.add_argument("--cprofile", action="store_true", help="with --profile, also capture a cProfile (.prof) of each binary")
+    parser.add_argument("--report", default=None, help=f"summary report path (default: <db>/{REPORT_NAME})")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.db, exist_ok=True)
+    t_start = time.time()
+
+    # the plugin finds caches by binary name only, a name seen twice would overwrite the first cache
+    binaries = []
+    results = []
+    seen = {}
+    for bin_path in findBinaries(args.paths, args.exec_only):
+        name = os.path.basename(bin_path)
+        if name in seen:
+            results.append({'binary': bin_path, 'cache': getCachePath(args.db, bin_path), 'skipped': f"same name as {seen[name]}", 'error': None})
+            print(f"[AutoResolv] {bin_path}: skipped, same name as {seen[name]}")
+            continue
+        seen[name] = bin_path
+        binaries.append(bin_path)
+
+    total = len(binaries)
+    print(f"[AutoResolv] Batch: {total} binaries to resolve, caches in {args.db}")
+
+    # submit the function from its package module so workers don't need this script as __main__
+    from libautoresolv import batch as batch_module
+    executor = startProcessPool(total, args.jobs, args.verbose)
+    if executor is None:
+        for i, bin_path in enumerate(binaries):
+            result = batch_module.resolveBinary(bin_path, args.db, args.libc, args.force, args.verbose, args.sysroot, args.profile or None, args.cprofile or None)
+            results.append(result)
+            _printResult(result, i + 1, total)
+    else:
+        futures = [executor.submit(batch_module.resolveBinary, bin_path, args.db, args.libc, args.force, args.verbose, args.sysroot, args.profile or None, args.cprofile or None) for bin_path in binaries]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            result = future.result()
+            results.append(result)
+            _printResult(result, i + 1, total)
+        executor.shutdown()
+
+    elapsed = time.time() - t_start
+    ok = [r for r in results if not r['error'] and not r['skipped']]
+    symbols = sum(r['symbols'] for r in ok)
+    summary = {
+        'binaries': len(results),
+        'resolved_binaries': len(ok),
+        'skipped_binaries': len([r for r in results if r['skipped']]),
+        'failed_binaries': len([r for r in results if r['error']]),
+        'imports': sum(r['imports'] for r in ok),
+        'resolved_imports': sum(r['resolved'] for r in ok),
+        'library_symbols': symbols,
+        'store_hits': sum(r['store_hits'] for r in ok),
+        'elapsed_seconds': elapsed,
+        'binaries_per_minute': len(ok) * 60 / elapsed if elapsed else 0.0,
+        'symbols_per_second': symbols / elapsed if elapsed else 0.0,
+    }
+
+    report_path = args.report or os.path.join(args.db, REPORT_NAME)
+    with open(report_path, "w") as fd:
+        json.dump({'summary': summary, 'binaries': results}, fd, indent=2)
+
+    print(f"[AutoResolv] Batch done: {summary['resolved_binaries']}/{summary['binaries']} binaries, {summary['resolved_imports']}/{summary['imports']} imports resolved in {elapsed:.1f}s")
+    print(f"[AutoResolv] Throughput: {summary['binaries_per_minute']:.1f} binaries/min, {summary['symbols_per_second']:.0f} symbols/s, report in {report_path}")
+    return 0 if summary['failed_binaries'] == 0 else 1
+
+
+if __name__ == "__main__":
+    try:
+        import idc
+    except ImportError:
+        idc = None
+
+    if idc is None:
+        sys.exit(main())
+    idc.qexit(main(idc.ARGV[1:]))
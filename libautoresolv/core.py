@@ -0,0 +1,211 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# Resolver core without any IDA import: usable from the plugin, the batch driver or a plain python process.
+# Names are demangled through an optional `demangler(name)` callable, the plugin passes the IDA one.
+
+import time
+from collections import defaultdict
+
+from libautoresolv.elfutil import *
+from libautoresolv.ldpath import *
+from libautoresolv.symstore import *
+from libautoresolv.profiler import *
+
+UNKNOWN_LIBRARY = "Unknow Library"
+
+# True for uClibc firmware, where a later STB_GLOBAL definition
+# overrides an earlier STB_WEAK one (glibc and musl keep the first definition whatever its binding)
+LD_WEAK_OVERRIDE = False
+
+
+def getWrapperName(externalfun):
+    try:
+        return externalfun.split(".")[1]  # remove the .FUN_NAME from wrapper format
+    except Exception:
+        return externalfun
+
+
+def makeRow(fun, lib, lib_path, demangler=None):
+    if demangler is None:
+        return [fun, lib, lib_path]
+
+    demangled_name = demangler(fun)
+    if demangled_name == None:
+        demangled_name = fun
+    return [fun, lib, lib_path, demangled_name]
+
+
+def isVersionMatch(required, version, hidden):
+    """ld.so check_match: an unversioned reference takes the default definition,
+    a versioned one its exact version or an unversioned definition"""
+    if required is None:
+        return not hidden
+    return version == required or (version is None and not hidden)
+
+
+def matchFunctions(externalfuns, libs, paths, demangler=None, versions=None):
+    resolver = IMPORT_RESOLVER(externalfuns, paths, demangler, versions)
+    for lib in paths:
+        if lib in libs:
+            resolver.feed(lib, libs[lib])
+    return resolver.values, resolver.resolved
+
+
+class IMPORT_RESOLVER():
+    """Resolve wrappers library by library, in whatever order the libraries get parsed.
+
+    The first library in `paths` order exporting a name with the version the binary requires
+    wins, as the loader does. A row given by a later library is moved in place if an earlier
+    library shows up afterwards. Libraries are fed with RAW_ELF.get_exports() tuples or a SYMBOL_STORE.
+    """
+
+    def __init__(self, externalfuns, paths, demangler=None, versions=None):
+        self.externalfuns = externalfuns
+        self.paths = paths
+        self.demangler = demangler
+        self.versions = versions or {}  # {function_name: version required by the binary}
+        self.order = {lib: i for i, lib in enumerate(paths)}
+
+        self.resolved = defaultdict(list)
+        self.pending = {}  # {function_name: [wrapper names]}, only names no library exported yet
+        for fun in externalfuns:
+            self.resolved[fun] = [externalfuns[fun], UNKNOWN_LIBRARY]
+            self.pending.setdefault(getWrapperName(fun), []).append(fun)
+
+        self.values = []
+        self.owner = {}  # {function_name: (precedence, [wrapper names], [rows], position of the first row in values)}
+
+    def _precedence(self, lib, bind):
+        if LD_WEAK_OVERRIDE and bind == STB_WEAK:
+            return (1, self.order[lib])
+        return (0, self.order[lib])
+
+    def _store_exports(self, store):
+        # only the imported names are read from the store, never its whole symbol list
+        exports = []
+        for fun in list(self.pending) + list(self.owner):
+            for entry in store.lookup(fun):
+                exports.append((fun,) + entry)
+        return exports
+
+    def feed(self, lib, funs):
+        """Match one parsed library, return (new rows, positions in values of the rows moved to this library)"""
+        if isinstance(funs, SYMBOL_STORE):
+            funs = self._store_exports(funs)
+        lib_path = self.paths[lib]
+        pending = self.pending
+        owner = self.owner
+        versions = self.versions
+        new_rows = []
+        moved = []
+
+        for fun, version, hidden, bind, _ in funs:
+            if fun in pending:
+                if not isVersionMatch(versions.get(fun), version, hidden):
+                    continue
+                wrappers = pending.pop(fun)
+                rows = []
+                for externalfun in wrappers:
+                    rows.append(makeRow(fun, lib, lib_path, self.demangler))
+                    self.resolved[externalfun] = [self.externalfuns[externalfun], lib]
+                owner[fun] = (self._precedence(lib, bind), wrappers, rows, len(self.values) + len(new_rows))
+                new_rows.extend(rows)
+
+            elif fun in owner:
+                prec = self._precedence(lib, bind)
+                if owner[fun][0] <= prec or not isVersionMatch(versions.get(fun), version, hidden):
+                    continue
+                _, wrappers, rows, first = owner[fun]
+                for externalfun, row in zip(wrappers, rows):
+                    row[1] = lib
+                    row[2] = lib_path
+                    self.resolved[externalfun] = [self.externalfuns[externalfun], lib]
+                moved.extend(range(first, first + len(rows)))
+                owner[fun] = (prec, wrappers, rows, first)
+
+        self.values.extend(new_rows)
+        return new_rows, moved
+
+
+def getIncrementalWork(externalfuns, rows, paths, stale_libs=(), known=None):
+    """Split a new resolve over cached rows: (wrappers to resolve, cached rows still valid).
+
+    A cached row stays valid while its function still has a wrapper and no library
+    before or at its provider in `paths` order changed, since that library could now win.
+    Names in `known` (wrappers of the last resolve) left unresolved are only retried when
+    a library changed.
+    """
+    order = {lib: i for i, lib in enumerate(paths)}
+    first_stale = min((order[lib] for lib in stale_libs if lib in order), default=len(paths))
+    names = set(getWrapperName(fun) for fun in externalfuns)
+
+    kept = []
+    done = set()
+    for row in rows:
+        if row[0] in names and order.get(row[1], len(paths)) < first_stale:
+            kept.append(row)
+            done.add(row[0])
+
+    if known is not None and not stale_libs:
+        done |= known
+    todo = {fun: ea for fun, ea in externalfuns.items() if getWrapperName(fun) not in done}
+    return todo, kept
+
+
+def resolveImports(bin_path, libc=False, demangler=None, sysroot=None, store_dir=None):
+    """Imported functions of an ELF file and the library resolving each of them.
+
+    Returns a dict with the `libs` {name: path} and `rpath` of the binary, its `imports`,
+    the matched `values` rows, the `resolved` {import: [None, library]} map and counters.
+    """
+    t_start = time.time()
+    with profilePhase("segment_scan"):
+        libs, rpath = getLibsFromBin(bin_path, sysroot)
+        imports = getImportsFromBin(bin_path)
+
+    resolver = IMPORT_RESOLVER({fun: None for fun in imports}, libs, demangler, getImportVersionsFromBin(bin_path))
+    libs_found = 0
+    symbols = 0
+    stats = {}
+    for lib, path in libs.items():
+        with profilePhase("elf_parse", lib):
+            if store_dir is not None:
+                funs = getLibSymbolStore(path, store_dir, libc, stats)
+            else:
+                funs = getAllFunsFromLib(path, libc)
+        if funs is None:
+            continue
+        libs_found += 1
+        symbols += len(funs)
+        with profilePhase("match", lib):
+            resolver.feed(lib, funs)
+
+    profileCount("imports", len(imports))
+    profileCount("libraries", len(libs))
+    profileCount("library_symbols", symbols)
+    profileCount("resolved", len(resolver.values))
+
+    return {
+        'libs': libs,
+        'rpath': rpath,
+        'imports': imports,
+        'values': resolver.values,
+        'resolved': resolver.resolved,
+        'libs_found': libs_found,
+        'symbols': symbols,
+        'store_hits': stats.get('hits', 0),
+        'seconds': time.time() - t_start,
+    }
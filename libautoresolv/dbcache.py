@@ -13,16 +13,209 @@
 # along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import hashlib
+import re
 import sqlite3
+from collections import OrderedDict
 
 from libautoresolv.error import *
+from libautoresolv.elfutil import getBuildId
 import os
 
+SCHEMA_VERSION = 9
+
+# fingerprint row of the main binary, library names never start with ':'
+BINARY_FINGERPRINT = ":binary"
+
+# Column order is the v1 one, rows are still read positionally with SELECT *
+SCHEMA = [
+    "CREATE TABLE schema_version(version INTEGER NOT NULL)",
+    "CREATE TABLE configuration(id INTEGER PRIMARY KEY, libc INTEGER NOT NULL, demangle INTEGER NOT NULL, comment INTEGER NOT NULL, verbose INTEGER NOT NULL, "
+    "comment_xref_limit INTEGER, comment_xref_sample INTEGER NOT NULL DEFAULT 0, sysroot TEXT, "
+    "profile INTEGER NOT NULL DEFAULT 0, cprofile INTEGER NOT NULL DEFAULT 0, cxxfilt INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE libinfo(libname TEXT PRIMARY KEY, libpath TEXT NOT NULL)",
+    "CREATE TABLE autoresolv_data(fun_name TEXT NOT NULL, library TEXT NOT NULL, library_path TEXT, demangle_name TEXT, PRIMARY KEY(fun_name, library))",
+    "CREATE TABLE signature(fun_name TEXT PRIMARY KEY, csig TEXT NOT NULL)",
+    "CREATE TABLE rpath(id INTEGER PRIMARY KEY, rp TEXT)",
+    "CREATE TABLE bininfo(id INTEGER PRIMARY KEY, binname TEXT)",
+    "CREATE INDEX autoresolv_data_library ON autoresolv_data(library)",
+    "CREATE TABLE fingerprint(name TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, mtime INTEGER, build_id TEXT)",
+    "CREATE TABLE wrapper(name TEXT PRIMARY KEY)",
+    "CREATE INDEX autoresolv_data_path ON autoresolv_data(library_path)",
+    "CREATE INDEX autoresolv_data_demangle ON autoresolv_data(demangle_name)",
+]
+
+# version -> statements upgrading it to the next version
+MIGRATE = {
+    2: ["CREATE TABLE fingerprint(name TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, mtime INTEGER, build_id TEXT)"],
+    3: ["CREATE TABLE wrapper(name TEXT PRIMARY KEY)"],
+    4: ["CREATE INDEX autoresolv_data_path ON autoresolv_data(library_path)",
+        "CREATE INDEX autoresolv_data_demangle ON autoresolv_data(demangle_name)"],
+    5: ["ALTER TABLE configuration ADD COLUMN comment_xref_limit INTEGER",
+        "ALTER TABLE configuration ADD COLUMN comment_xref_sample INTEGER NOT NULL DEFAULT 0"],
+    6: ["ALTER TABLE configuration ADD COLUMN sysroot TEXT"],
+    7: ["ALTER TABLE configuration ADD COLUMN profile INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE configuration ADD COLUMN cprofile INTEGER NOT NULL DEFAULT 0"],
+    8: ["ALTER TABLE configuration ADD COLUMN cxxfilt INTEGER NOT NULL DEFAULT 0"],
+}
+
+# v1 table -> columns copied into the v2 table, duplicated keys keep the last row
+MIGRATE_V1 = {
+    "configuration": "id, libc, demangle, comment, verbose",
+    "libinfo": "libname, libpath",
+    "autoresolv_data": "fun_name, library, library_path, demangle_name",
+    "signature": "fun_name, csig",
+    "rpath": "id, rp",
+    "bininfo": "id, binname",
+}
+
+# trigram FTS5 index over the function names. Per row triggers would make every save several times slower,
+# writers only empty autoresolv_search_state and the first search after them rebuilds the index in bulk.
+# Not part of SCHEMA: a sqlite without FTS5 trigram (before 3.34) still opens the cache and searches by scan
+SEARCH_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS autoresolv_search USING fts5(fun_name, demangle_name, content='autoresolv_data', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TABLE IF NOT EXISTS autoresolv_search_state(fresh INTEGER NOT NULL)",
+]
+
+_SEARCH_SUPPORTED = None
+
+
+def isSearchIndexSupported():
+    global _SEARCH_SUPPORTED
+    if _SEARCH_SUPPORTED is None:
+        try:
+            con = sqlite3.connect(":memory:")
+            con.execute("CREATE VIRTUAL TABLE probe USING fts5(name, tokenize='trigram')")
+            con.close()
+            _SEARCH_SUPPORTED = True
+        except sqlite3.Error:
+            _SEARCH_SUPPORTED = False
+    return _SEARCH_SUPPORTED
+
+
+def getReadOnlyUri(path):
+    # only %, ? and # have to be escaped in a sqlite URI, urllib.request would double the import time of this module
+    path = os.path.abspath(path).replace(os.sep, "/").replace("%", "%25").replace("?", "%3f").replace("#", "%23")
+    return "file:" + ("" if path.startswith("/") else "/") + path + "?mode=ro"
+
+
+def getSearchSchema():
+    return SEARCH_SCHEMA if isSearchIndexSupported() else []
+
+
+def parseSearchQuery(query):
+    """Split a result window search into (library, text, mode, demangled)
+
+    "lib:<library> " terms restrict to a library, "dm:" searches the demangled names,
+    "^text" is a prefix, "/regex/" a regular expression and anything else a substring.
+    """
+    library = None
+    query = query.strip()
+    while query.startswith("lib:"):
+        library, _, query = query[4:].partition(" ")
+        query = query.strip()
+    demangled = query.startswith("dm:")
+    if demangled:
+        query = query[3:]
+
+    if query.startswith("^"):
+        return library, query[1:], "prefix", demangled
+    if len(query) > 1 and query.startswith("/") and query.endswith("/"):
+        return library, query[1:-1], "regex", demangled
+    return library, query, "substring", demangled
+
+
+def _skipGroup(pattern, i):
+    # index after the class or group opened at pattern[i]
+    depth = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "[":
+            i += 1
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        i += 1
+        if depth <= 0:
+            break
+    return i
+
+
+def getRegexLiteral(pattern):
+    """Longest run of plain characters every match of `pattern` contains, None if shorter than a trigram"""
+    # verbose and case insensitive patterns don't match their own characters
+    if re.search(r"\(\?[aiLmsux-]*[ix]", pattern):
+        return None
+
+    runs = [""]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            if escaped and escaped in "0123456789xuUN":
+                # octal, hex, unicode escapes and backreferences: the characters after the letter aren't literal
+                return None
+            if escaped and not escaped.isalnum():
+                runs[-1] += escaped
+            else:
+                runs.append("")
+            i += 2
+            continue
+
+        if char in "[(":
+            # classes and groups are skipped whole
+            i = _skipGroup(pattern, i)
+            runs.append("")
+            continue
+        if char in "*?{":
+            # the previous character may be absent
+            runs[-1] = runs[-1][:-1]
+            runs.append("")
+            if char == "{":
+                end = pattern.find("}", i)
+                i = end if end >= 0 else len(pattern)
+        elif char == "|":
+            # alternatives outside of a group share no run
+            return None
+        elif char in ".^$+":
+            runs.append("")
+        else:
+            runs[-1] += char
+        i += 1
+
+    literal = max(runs, key=len)
+    return literal if len(literal) >= 3 else None
+
+
+def getUniqueRows(rows):
+    """One row per (fun_name, library) like autoresolv_data keeps them, the last one wins as with the upsert"""
+    unique = {}
+    for row in rows:
+        unique[(row[0], row[1])] = row
+    return list(unique.values())
+
+
 class DB_CACHE_MANAGER():
     
     def __init__(self, path, module_path=None, bin_path=None):
         self.db_path = path
         self.is_cached_data = False
+        self.cached_count = 0
+        self.data_demangle = False
+        self._cached_data = None
+        self.search_index = False
+        self.stale_libs = []
         if module_path:
             self.modpath = module_path
 
@@ -49,13 +242,77 @@ class DB_CACHE_MANAGER():
         print(f"[AutoResolv] Connecting to : {self.db_path}")
         self.con = sqlite3.connect(self.db_path)
         self.cur = self.con.cursor()
+        self._tune_connection()
         self.cur.execute("SELECT name from sqlite_master")
         cache_out = self.cur.fetchone()
         if cache_out is not None:
+            self._migrate()
+            self.ensure_search_index()
             return True
         else:
             return False
 
+    def get_schema_version(self):
+        cmd = self.cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'")
+        if cmd.fetchone() is None:
+            return 1
+        return self.cur.execute("SELECT version FROM schema_version").fetchone()[0]
+
+    def _migrate(self):
+        version = self.get_schema_version()
+        if version == SCHEMA_VERSION:
+            return
+        if version > SCHEMA_VERSION:
+            # written by a newer AutoResolv, its tables can't be stamped back to this version
+            raise CacheMigrationError(f"ERR_CRITICAL : DB cache schema v{version} is newer than v{SCHEMA_VERSION}, update AutoResolv or clean the cache")
+
+        print(f"[AutoResolv] Migrating DB cache from schema v{version} to v{SCHEMA_VERSION}")
+        try:
+            self.cur.execute("BEGIN")
+            if version == 1:
+                for table in MIGRATE_V1:
+                    self.cur.execute(f"ALTER TABLE {table} RENAME TO {table}_v1")
+                for statement in SCHEMA:
+                    self.cur.execute(statement)
+                for table, columns in MIGRATE_V1.items():
+                    key = columns.split(",")[0]
+                    self.cur.execute(f"INSERT OR REPLACE INTO {table}({columns}) SELECT {columns} FROM {table}_v1 WHERE {key} IS NOT NULL ORDER BY rowid")
+                    self.cur.execute(f"DROP TABLE {table}_v1")
+                self.cur.execute("INSERT INTO schema_version VALUES (?)", (SCHEMA_VERSION,))
+            else:
+                for step in range(version, SCHEMA_VERSION):
+                    for statement in MIGRATE[step]:
+                        self.cur.execute(statement)
+                self.cur.execute("UPDATE schema_version SET version=?", (SCHEMA_VERSION,))
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise CacheMigrationError
+
+    def ensure_search_index(self):
+        # caches created before it, or by a sqlite without FTS5 trigram, get an empty (stale) index
+        try:
+            with self.con:
+                for statement in getSearchSchema():
+                    self.cur.execute(statement)
+            self.search_index = self.cur.execute("SELECT name FROM sqlite_master WHERE name='autoresolv_search_state'").fetchone() is not None
+        except Exception:
+            print("[AutoResolv] Couldn't create search index of the DB cache, searches will scan it")
+
+    def _search_index_stale(self):
+        # in the transaction of the write, also when this sqlite can't rebuild the index itself
+        if self.search_index:
+            self.cur.execute("DELETE FROM autoresolv_search_state")
+
+    def _tune_connection(self):
+        # one fsync per transaction instead of per statement, readers never block the writer
+        try:
+            self.cur.execute("PRAGMA journal_mode=WAL")
+            self.cur.execute("PRAGMA synchronous=NORMAL")
+            self.cur.execute("PRAGMA cache_size=-16000")
+        except Exception:
+            print("[AutoResolv] Couldn't tune DB cache connection, using sqlite defaults")
+
     def close(self):
         if hasattr(self, 'cur') and self.cur:
             self.cur.close()
@@ -77,55 +334,181 @@ class DB_CACHE_MANAGER():
         return sigs
 
     def parse_data_cache(self, no_check=None):
+        # only counted here, the rows are read on first use of cached_data or paged by CACHED_ROWS
         if no_check:
             self.CONFIG = {}
             self.CONFIG['demangle'] = False
-        cmd = self.cur.execute("SELECT * from autoresolv_data")
-        values = cmd.fetchall()
-        if values == []:
+        self.cached_count = self.cur.execute("SELECT COUNT(*) FROM autoresolv_data").fetchone()[0]
+        self._cached_data = None
+        self.data_demangle = self.CONFIG['demangle']
+        if self.cached_count == 0:
             return None
-        else:
-
-            values_ = []
-            
-            for line in values:
-                if self.CONFIG['demangle']:
-                    values_.append([line[0], line[1], line[2], line[3]])
-                else:
-                    values_.append([line[0], line[1], line[2]])
-
-            self.cached_data = values_
-            self.is_cached_data = True
+        self.is_cached_data = True
+
+    @property
+    def cached_data(self):
+        if self._cached_data is None and self.is_cached_data:
+            cmd = self.cur.execute("SELECT * from autoresolv_data")
+            if self.data_demangle:
+                self._cached_data = [[line[0], line[1], line[2], line[3]] for line in cmd]
+            else:
+                self._cached_data = [[line[0], line[1], line[2]] for line in cmd]
+        return self._cached_data
+
+    @cached_data.setter
+    def cached_data(self, values):
+        values = getUniqueRows(values)
+        self._cached_data = values
+        self.cached_count = len(values)
+        if values:
+            self.data_demangle = len(values[0]) == 4
 
 
     def save_signature(self, sigs):
 
         try:
-            for fun_name in sigs:
-                dataset = (fun_name, sigs[fun_name])
-                self.cur.execute("INSERT INTO signature VALUES (?, ?)", dataset)
-                self.con.commit()
+            with self.con:
+                self.cur.executemany("INSERT INTO signature VALUES (?, ?) ON CONFLICT(fun_name) DO UPDATE SET csig=excluded.csig", sigs.items())
 
         except Exception:
             raise Exception("CacheSaveSignatureError : cannot insert signature to extern database.")
 
     def save_data(self, value, config):
+        # single transaction, rolled back as a whole so autoresolv_data is never half populated
         try:
-            for i in range(len(value)):
-                if config['demangle']:
-                    dataset = (str(value[i][0]), str(value[i][1]), str(value[i][2]), str(value[i][3]))
-                else:
-                    dataset = (str(value[i][0]), str(value[i][1]), str(value[i][2]), "None")
-
-                self.cur.execute("INSERT INTO autoresolv_data VALUES (?, ?, ? , ?)", dataset)
-                self.con.commit()
+            if config['demangle']:
+                dataset = [(str(line[0]), str(line[1]), str(line[2]), str(line[3])) for line in value]
+            else:
+                dataset = [(str(line[0]), str(line[1]), str(line[2]), "None") for line in value]
+
+            with self.con:
+                self.cur.executemany("INSERT INTO autoresolv_data VALUES (?, ?, ? , ?) ON CONFLICT(fun_name, library) DO UPDATE SET library_path=excluded.library_path, demangle_name=excluded.demangle_name", dataset)
+                self._search_index_stale()
                 
         except Exception:
-            CacheSaveResolvedDataError
+            raise CacheSaveResolvedDataError
+
+    def replace_data(self, value, config):
+        # full resolve result: rows that left are deleted, only new or moved rows are written,
+        # signatures of functions that moved or whose library changed are dropped
+        try:
+            old = {}
+            for line in self.cur.execute("SELECT fun_name, library, library_path, demangle_name FROM autoresolv_data"):
+                old[(line[0], line[1])] = (line[2], line[3])
+
+            dataset = []
+            moved = set()
+            for line in value:
+                demangle_name = str(line[3]) if config['demangle'] else "None"
+                row = (str(line[0]), str(line[1]), str(line[2]), demangle_name)
+                if old.get(row[:2]) != row[2:]:
+                    dataset.append(row)
+                    if row[:2] in old and old[row[:2]][0] != row[2]:
+                        moved.add(row[0])
+
+            keys = set((str(line[0]), str(line[1])) for line in value)
+            removed = [key for key in old if key not in keys]
+            stale = set(self.stale_libs)
+            dropped = moved | set(key[0] for key in removed) | set(key[0] for key in old if key[1] in stale)
+
+            with self.con:
+                self.cur.executemany("DELETE FROM autoresolv_data WHERE fun_name=? AND library=?", removed)
+                self.cur.executemany("INSERT INTO autoresolv_data VALUES (?, ?, ? , ?) ON CONFLICT(fun_name, library) DO UPDATE SET library_path=excluded.library_path, demangle_name=excluded.demangle_name", dataset)
+                self.cur.executemany("DELETE FROM signature WHERE fun_name=?", ((fun,) for fun in dropped))
+                if removed or dataset:
+                    self._search_index_stale()
+
+        except Exception:
+            raise CacheSaveResolvedDataError
+
+        if self.CONFIG['verbose']:
+            print(f"[AutoResolv] Cache updated: {len(dataset)} rows written, {len(removed)} removed, {len(dropped)} signatures invalidated")
+
+    def parse_wrappers(self):
+        """Function names of the wrappers seen by the last resolve, None if unknown"""
+        names = set(line[0] for line in self.cur.execute("SELECT name FROM wrapper"))
+        return names or None
+
+    def save_wrappers(self, names):
+        try:
+            with self.con:
+                self.cur.execute("DELETE FROM wrapper")
+                self.cur.executemany("INSERT OR IGNORE INTO wrapper VALUES (?)", ((name,) for name in names))
+        except Exception:
+            raise CacheSaveResolvedDataError
+
+    def _fingerprint(self, path):
+        st = os.stat(path)
+        build_id = getBuildId(path)
+        if build_id is None:
+            digest = hashlib.sha1()
+            with open(path, "rb") as fd:
+                for chunk in iter(lambda: fd.read(1 << 20), b""):
+                    digest.update(chunk)
+            build_id = "sha1:" + digest.hexdigest()
+        return st.st_size, st.st_mtime_ns, build_id
+
+    def _is_fresh(self, path, row):
+        # size and mtime first, the build-id (or content hash) only when they differ
+        try:
+            st = os.stat(path)
+            if (row[0], st.st_size, st.st_mtime_ns) == (path, row[1], row[2]):
+                return True
+            return row[0] == path and self._fingerprint(path)[2] == row[3]
+        except OSError:
+            return False
+
+    def save_fingerprints(self, libs, bin_path):
+        dataset = []
+        for name, path in list(libs.items()) + [(BINARY_FINGERPRINT, bin_path)]:
+            try:
+                dataset.append((name, path) + self._fingerprint(path))
+            except OSError:
+                continue #"Path not found" libraries
+        try:
+            with self.con:
+                self.cur.executemany("INSERT INTO fingerprint VALUES (?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET path=excluded.path, size=excluded.size, mtime=excluded.mtime, build_id=excluded.build_id", dataset)
+        except Exception:
+            raise CacheUpdateConfigurationError
+        self.stale_libs = []
+
+    def check_fingerprints(self, bin_path):
+        """Libraries changed since the cached rows were resolved, every library if the binary changed"""
+        rows = {}
+        for line in self.cur.execute("SELECT name, path, size, mtime, build_id FROM fingerprint"):
+            rows[line[0]] = line[1:]
+
+        if not rows:
+            # cache resolved before fingerprints existed, its rows are trusted as they are
+            if self.is_cached_data:
+                self.save_fingerprints(self.libsinfo, bin_path)
+            return []
+
+        if BINARY_FINGERPRINT in rows and not self._is_fresh(bin_path, rows[BINARY_FINGERPRINT]):
+            print("[AutoResolv] Binary changed since the last resolve, every library will be resolved again")
+            self.stale_libs = list(self.libsinfo)
+            return self.stale_libs
+
+        self.stale_libs = []
+        for lib, path in self.libsinfo.items():
+            if lib in rows:
+                fresh = self._is_fresh(path, rows[lib])
+            else:
+                fresh = not os.path.exists(path) #still missing, nothing to resolve against
+            if not fresh:
+                self.stale_libs.append(lib)
+
+        if self.stale_libs:
+            print(f"[AutoResolv] Changed since the last resolve: {', '.join(self.stale_libs)}")
+        return self.stale_libs
 
     def save_conf(self, config):
         try:
-            self.cur.execute(f"UPDATE configuration SET id=0,libc={config['libc']}, demangle={config['demangle']} , comment={config['comment']} , verbose={config['verbose']} WHERE id=0")
+            dataset = (config['libc'], config['demangle'], config['comment'], config['verbose'],
+                       config['comment_xref_limit'], config['comment_xref_sample'], config['sysroot'], config['profile'], config['cprofile'],
+                       config['cxxfilt'])
+            self.cur.execute("UPDATE configuration SET libc=?, demangle=?, comment=?, verbose=?, comment_xref_limit=?, comment_xref_sample=?, sysroot=?, "
+                             "profile=?, cprofile=?, cxxfilt=? WHERE id=0", dataset)
             self.con.commit()
         except Exception:
             raise CacheUpdateConfigurationError
@@ -136,102 +519,87 @@ class DB_CACHE_MANAGER():
             for path in self.rpath[1:]:
                 rpath += ":" + path
 
-        noRpath = False
+        dataset=(0,rpath)
         try:
-            cmd =self.cur.execute("SELECT * from rpath")
-            cmx = cmd.fetchone()
-            if cmx == None:
-                noRpath = True
-        except Exception: #no rpath data
-            raise Exception("[AutoResolv] Unknow Exception")
-
-        if noRpath:
-            dataset=(0,rpath)
-            try:
-                self.cur.execute(f"INSERT into rpath VALUES (?,?)", dataset)
-                self.con.commit()
-            except Exception:
-                raise Exception("[AutoResolv] Couldn't update rpath cache ")
-        else:
-            try:
-                self.cur.execute(f"UPDATE rpath SET rp='{rpath}' WHERE id=0")
-                self.con.commit()
-            except Exception:
-                raise Exception("[AutoResolv] Couldn't update rpath cache ")
+            self.cur.execute("INSERT into rpath VALUES (?,?) ON CONFLICT(id) DO UPDATE SET rp=excluded.rp", dataset)
+            self.con.commit()
+        except Exception:
+            raise Exception("[AutoResolv] Couldn't update rpath cache ")
 
     def cache_save_bininfo(self, bininfo):
         try:
-            self.cur.execute(f"UPDATE bininfo SET binname='{bininfo}' WHERE id=0")
+            self.cur.execute("UPDATE bininfo SET binname=? WHERE id=0", (bininfo,))
             self.con.commit()
         except Exception:
             raise Exception("[AutoResolv] Couldn't update binfo cache ")
 
     def setNewLibPath(self, lib, path, config):
         try:
-            self.cur.execute(f"UPDATE libinfo SET libpath='{path}' WHERE libname='{lib}'")
+            self.cur.execute("INSERT INTO libinfo VALUES (?, ?) ON CONFLICT(libname) DO UPDATE SET libpath=excluded.libpath", (lib, path))
             self.con.commit()
         except Exception:
             raise CacheUpdateConfigurationError
+        # the next Resolve rechecks what this library can now provide
+        if lib not in self.stale_libs:
+            self.stale_libs.append(lib)
             
 
     def create_cache(self, libs, bininfo, rpath=None):
        
         try:
-            self.cur.execute("CREATE TABLE configuration(id, libc, demangle, comment, verbose)")
-            self.cur.execute("CREATE TABLE libinfo(libname, libpath)")
-            self.cur.execute("CREATE TABLE autoresolv_data(fun_name, library, library_path, demangle_name)")
-            self.cur.execute("CREATE TABLE signature(fun_name, csig)")
-            self.cur.execute("CREATE TABLE rpath(id, rp)")
-            self.cur.execute("CREATE TABLE bininfo(id, binname)")
+            self.cur.execute("BEGIN")
+            for statement in SCHEMA + getSearchSchema():
+                self.cur.execute(statement)
+            self.cur.execute("INSERT INTO schema_version VALUES (?)", (SCHEMA_VERSION,))
+            self.search_index = isSearchIndexSupported()
             print(f"[AutoResolv] Created table sucessfully {self.db_path}")
 
         except Exception:
+            self.con.rollback()
             raise CacheBaseCreationError
 
 
-        conf = (0, False,True,True, True) #default config
+        conf = (0, False,True,True, True, None, False, None, False, False, False) #default config
         self.CONFIG = {}
         self.CONFIG['libc'] = False
         self.CONFIG['demangle'] = True
         self.CONFIG['comment'] = True
         self.CONFIG['verbose'] = True
+        self.CONFIG['comment_xref_limit'] = None
+        self.CONFIG['comment_xref_sample'] = False
+        self.CONFIG['sysroot'] = None
+        self.CONFIG['profile'] = False
+        self.CONFIG['cprofile'] = False
+        self.CONFIG['cxxfilt'] = False
 
         self.libsinfo = libs
 
+        # tables and default rows are committed together
         try:            
-            self.cur.execute("INSERT INTO configuration VALUES (?, ?, ?, ?, ?)", conf)
-            self.con.commit()
+            self.cur.execute("INSERT INTO configuration VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", conf)
             if self.CONFIG['verbose']:
                 print(f"[AutoResolv] Inserted default config into cache")
 
             dataset = (0, bininfo)
             self.cur.execute("INSERT INTO bininfo VALUES (?, ?)", dataset)
-            self.con.commit()
             if self.CONFIG['verbose']:
                 print(f"[AutoResolv] Inserted binary info into cache")
 
-            for lib in libs:
-                dataset = (lib, libs[lib])
-                self.cur.execute("INSERT INTO libinfo VALUES (?, ?)", dataset)
-                self.con.commit()
-                
-
+            self.cur.executemany("INSERT INTO libinfo VALUES (?, ?)", libs.items())
             if self.CONFIG['verbose']:
                 print(f"[AutoResolv] Inserted Parsed lib into cache")
-        
-        except Exception:
-            raise CacheBaseSetup
 
-        if rpath is not None:
-            try:
+            if rpath is not None:
                 dataset = (0, rpath)
                 self.cur.execute("INSERT INTO rpath VALUES (?, ?)", dataset)
-                self.con.commit()                
                 if self.CONFIG['verbose']:
                     print(f"[AutoResolv] Inserted rpath into cache")
 
-            except Exception:
-                raise CacheBaseSetup
+            self.con.commit()
+        
+        except Exception:
+            self.con.rollback()
+            raise CacheBaseSetup
 
     def parse_conf_cache(self):
 
@@ -244,6 +612,12 @@ class DB_CACHE_MANAGER():
             self.CONFIG['demangle'] = bool(config[2])
             self.CONFIG['comment'] = bool(config[3])
             self.CONFIG['verbose'] = bool(config[4])
+            self.CONFIG['comment_xref_limit'] = config[5]
+            self.CONFIG['comment_xref_sample'] = bool(config[6])
+            self.CONFIG['sysroot'] = config[7]
+            self.CONFIG['profile'] = bool(config[8])
+            self.CONFIG['cprofile'] = bool(config[9])
+            self.CONFIG['cxxfilt'] = bool(config[10])
         except Exception:
             raise CacheParseConfigError
 
@@ -256,7 +630,7 @@ class DB_CACHE_MANAGER():
         self.libsinfo = {}
 
         try:
-            cmd =self.cur.execute("SELECT * from libinfo")
+            cmd =self.cur.execute("SELECT * from libinfo ORDER BY rowid") # loader search order
             libs = cmd.fetchall()
             for lib in libs:
                 self.libsinfo[lib[0]] = lib[1]
@@ -280,8 +654,199 @@ class DB_CACHE_MANAGER():
             print("[AutoResolv] Parsed rpath Data from cache")
 
 
-        
-  
+# chooser column -> ORDER BY keys, each one is served by an index so no sort runs over the whole table
+# (an index entry ends with the rowid, so "library, rowid" is the library index order)
+CACHED_ROWS_ORDER = [
+    ("fun_name", "library"),
+    ("library", "rowid"),
+    ("library_path", "rowid"),
+    ("demangle_name", "rowid"),
+]
+
+# rows per block and blocks kept by the result window
+CACHED_ROWS_BLOCK = 256
+CACHED_ROWS_BLOCKS = 32
+# searches matching more rows than this read them in index order instead of sorting all of them per block
+CACHED_ROWS_SORTED_HITS = 4096
+
+
+class CACHED_ROWS():
+    """Read-only sequence over autoresolv_data for the result chooser, rows are read by blocks on demand.
+
+    The length comes from COUNT(*), sorting and filtering are ORDER BY / WHERE on the indexed columns,
+    substring and regex searches first narrow the rows with the trigram index when the cache has one.
+    Sequential scrolling continues from the last key of the previous block instead of an OFFSET scan.
+    """
+
+    def __init__(self, db_path, demangle=False, block_size=None, max_blocks=None):
+        self.db_path = db_path
+        self.width = 4 if demangle else 3
+        self.block_size = block_size or CACHED_ROWS_BLOCK
+        self.max_blocks = max_blocks or CACHED_ROWS_BLOCKS
+        self.order = 0
+        self.descending = False
+        self.where = []
+        self.params = []
+        self.regex = None
+        self.blocks = OrderedDict()  # block number -> (rows, last order key)
+
+        # autocommit: the INSERT into temp.search_hits would otherwise open a transaction that is never
+        # committed, and every later read would see the snapshot it started (no rebuilt index, no new rows)
+        self.con = sqlite3.connect(getReadOnlyUri(db_path), uri=True, isolation_level=None)
+        self.con.create_function("regexp", 2, self._regexp, deterministic=True)
+        self.cur = self.con.cursor()
+        self.count = None
 
-        
+        self.search_index = isSearchIndexSupported() and self.cur.execute("SELECT name FROM sqlite_master WHERE name='autoresolv_search'").fetchone() is not None
+
+    def close(self):
+        self.blocks.clear()
+        if self.con is not None:
+            self.cur.close()
+            self.con.close()
+            self.con = None
+
+    def reload(self):
+        # after the cache was written again
+        self.blocks.clear()
+        self.count = None
+
+    def set_order(self, column, descending=False):
+        self.order = column
+        self.descending = descending
+        self.blocks.clear()
+
+    def set_filter(self, library=None, text=None, mode="substring", demangled=False):
+        """Only rows of `library` and/or whose name matches `text`, None clears
+
+        mode is "prefix" (case sensitive), "substring" (ASCII case insensitive) or "regex" (re.search,
+        an invalid one raises re.error), demangled matches the C++ demangled name instead of the function name.
+        """
+        column = "demangle_name" if demangled else "fun_name"
+        regex = re.compile(text) if text and mode == "regex" else None
+        where = []
+        params = []
+        if library is not None:
+            where.append("library = ?")
+            params.append(library)
+
+        if text and mode == "prefix":
+            # a range on the index of the column instead of LIKE, which is case insensitive and scans
+            where.append(f"{column} >= ? AND {column} < ?")
+            params += [text, text[:-1] + chr(ord(text[-1]) + 1)]
+        elif text:
+            # matched once here, every block and the count then only read the matching rowids
+            literal = text if regex is None else getRegexLiteral(text)
+            match = []
+            match_params = []
+            if literal is not None and len(literal) >= 3 and self._ensure_search_index():
+                # the trigram index returns a superset (LIKE wildcards, case), the exact test follows
+                match.append(f"rowid IN (SELECT rowid FROM autoresolv_search WHERE {column} LIKE ?)")
+                match_params.append(f"%{literal}%")
+            if regex is None:
+                match.append(f"instr(lower({column}), ?) > 0")
+                match_params.append(text.lower())
+            else:
+                match.append(f"{column} REGEXP ?")
+                match_params.append(text)
+
+            self.regex = regex
+            self.cur.execute("DROP TABLE IF EXISTS temp.search_hits")
+            self.cur.execute("CREATE TEMP TABLE search_hits(id INTEGER PRIMARY KEY)")
+            self.cur.execute("INSERT INTO search_hits SELECT rowid FROM autoresolv_data WHERE " + " AND ".join(where + match), params + match_params)
+            # few hits are sorted as they are, many are checked while walking the index of the sort order
+            where.append(("+rowid" if self.cur.rowcount > CACHED_ROWS_SORTED_HITS else "rowid") + " IN search_hits")
+
+        self.where = where
+        self.params = params
+        self.reload()
+
+    def _ensure_search_index(self):
+        if not self.search_index:
+            return False
+        if self.cur.execute("SELECT fresh FROM autoresolv_search_state").fetchone() is not None:
+            return True
+
+        # emptied by the last write, this connection is read only so the rebuild goes through another one
+        print("[AutoResolv] Building search index of the DB cache")
+        try:
+            con = sqlite3.connect(self.db_path, timeout=30)
+            with con:
+                con.execute("INSERT INTO autoresolv_search(autoresolv_search) VALUES ('rebuild')")
+                con.execute("INSERT INTO autoresolv_search_state VALUES (1)")
+            con.close()
+        except sqlite3.Error:
+            print("[AutoResolv] Couldn't build search index of the DB cache, searches will scan it")
+            self.search_index = False
+        return self.search_index
+
+    def _regexp(self, pattern, value):
+        return value is not None and self.regex.search(value) is not None
+
+    def _where(self, extra=None):
+        clauses = self.where + ([extra] if extra else [])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    def __len__(self):
+        if self.count is None:
+            self.count = self.cur.execute("SELECT COUNT(*) FROM autoresolv_data" + self._where(), self.params).fetchone()[0]
+        return self.count
+
+    def _fetch(self, block):
+        keys = CACHED_ROWS_ORDER[self.order]
+        direction = " DESC" if self.descending else ""
+        order = ", ".join(key + direction for key in keys)
+        columns = ", ".join(keys) + ", fun_name, library, library_path, demangle_name"
+
+        # start key of the block: end of the previous block when scrolling, else found on the
+        # covering index alone, OFFSET then skips index entries instead of whole rows
+        previous = self.blocks.get(block - 1)
+        start = None
+        strict = True
+        if previous is not None:
+            start = previous[1]
+        elif block > 0:
+            query = f"SELECT {', '.join(keys)} FROM autoresolv_data{self._where()} ORDER BY {order} LIMIT 1 OFFSET ?"
+            start = self.cur.execute(query, self.params + [block * self.block_size]).fetchone()
+            strict = False
+            if start is None:
+                return [], None
+
+        lines = None
+        if block == 0 or (start is not None and None not in start):
+            seek = None
+            if block > 0:
+                sign = "<" if self.descending else ">"
+                seek = f"({', '.join(keys)}) {sign if strict else sign + '='} (?, ?)"
+            query = f"SELECT {columns} FROM autoresolv_data{self._where(seek)} ORDER BY {order} LIMIT ?"
+            lines = self.cur.execute(query, self.params + (list(start) if seek else []) + [self.block_size]).fetchall()
+
+        # NULL keys (v1 caches) can't be compared, a short block falls back to OFFSET
+        if lines is None or len(lines) < min(self.block_size, len(self) - block * self.block_size):
+            query = f"SELECT {columns} FROM autoresolv_data{self._where()} ORDER BY {order} LIMIT ? OFFSET ?"
+            lines = self.cur.execute(query, self.params + [self.block_size, block * self.block_size]).fetchall()
+
+        rows = [list(line[2:2 + self.width]) for line in lines]
+        last = tuple(lines[-1][:2]) if lines else None
+        return rows, last
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if n < 0 or n >= len(self):
+            raise IndexError(n)
+
+        block, index = divmod(n, self.block_size)
+        entry = self.blocks.get(block)
+        if entry is None:
+            entry = self._fetch(block)
+            self.blocks[block] = entry
+            if len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(block)
+        return entry[0][index]
 
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
@@ -0,0 +1,198 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Bulk demangling for Resolve, without any IDA import: names are deduplicated, looked up in a cache shared
+# by every binary of the db/ directory and only the misses are demangled, by the fallback (IDA) or on request by c++filt processes.
+
+import os
+import shutil
+import sqlite3
+import subprocess
+
+from libautoresolv.error import *
+from libautoresolv.profiler import *
+
+# Shared between every .cache_<bin>.db of the db/ directory
+DEMANGLE_CACHE_NAME = ".demangle.db"
+
+# c++filt of binutils or llvm (name or path) used when a BULK_DEMANGLER is asked for it,
+# its output differs from the IDA demangler one. Both outputs are cached apart.
+DEMANGLE_CXXFILT = "c++filt"
+# names per c++filt process, and processes run at once (None: cpu count)
+DEMANGLE_CHUNK = 4096
+DEMANGLE_MAX_WORKERS = None
+
+# under the host parameter limit of older sqlite (999)
+LOOKUP_CHUNK = 500
+
+
+def isMangled(name):
+    # Itanium C++ ABI, the mangling of ELF binaries; plain C names never leave this module
+    return name.startswith("_Z")
+
+
+def getCxxfilt():
+    if DEMANGLE_CXXFILT is None:
+        return None
+    return shutil.which(DEMANGLE_CXXFILT)
+
+
+def cxxfiltDemangle(names, cxxfilt):
+    """One c++filt process reading `names` on stdin, {name: demangled name or None if left as is}"""
+    proc = subprocess.run([cxxfilt, "-n"], input="\n".join(names) + "\n", capture_output=True, check=True,
+                          encoding="utf-8", errors="replace", creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+    lines = proc.stdout.split("\n")
+    if len(lines) != len(names) + 1:
+        raise ValueError(f"c++filt returned {len(lines) - 1} names for {len(names)}")
+    return {name: (line if line != name else None) for name, line in zip(names, lines)}
+
+
+class DEMANGLE_CACHE():
+
+    def __init__(self, path, verbose=False):
+        self.db_path = path
+        self.verbose = verbose
+
+        try:
+            self.con = sqlite3.connect(self.db_path, timeout=30)
+            self.cur = self.con.cursor()
+            # shared by every IDA instance and binary, readers must not block the writer
+            self.cur.execute("PRAGMA journal_mode=WAL")
+            self.cur.execute("PRAGMA synchronous=NORMAL")
+            self.cur.execute("CREATE TABLE IF NOT EXISTS demangled(engine TEXT NOT NULL, name TEXT NOT NULL, demangled TEXT, PRIMARY KEY(engine, name)) WITHOUT ROWID")
+            self.con.commit()
+        except Exception:
+            raise DemangleCacheError
+
+    def get(self, engine, names):
+        """{name: demangled name or None} of the `names` already demangled by `engine`"""
+        known = {}
+        names = list(names)
+        for i in range(0, len(names), LOOKUP_CHUNK):
+            chunk = names[i:i + LOOKUP_CHUNK]
+            query = f"SELECT name, demangled FROM demangled WHERE engine=? AND name IN ({', '.join('?' * len(chunk))})"
+            known.update(self.cur.execute(query, [engine] + chunk).fetchall())
+        return known
+
+    def put(self, engine, demangled):
+        try:
+            with self.con:
+                self.cur.executemany("INSERT OR REPLACE INTO demangled VALUES (?, ?, ?)", ((engine, name, value) for name, value in demangled.items()))
+        except Exception:
+            print("[AutoResolv] Couldn't save names to demangle cache, Skipping")
+
+    def close(self):
+        if hasattr(self, 'cur') and self.cur:
+            self.cur.close()
+        if hasattr(self, 'con') and self.con:
+            self.con.close()
+
+
+class BULK_DEMANGLER():
+    """Demangle names by batches instead of one call per resolved row.
+
+    A batch is deduplicated, names seen in this session or cached by `engine` are not demangled again,
+    the others go to `fallback(names) -> {name: demangled or None}` (the plugin passes the IDA demangler).
+    With `cxxfilt` they are split over c++filt processes instead, the fallback only takes them when
+    c++filt is missing or fails. Without either they stay as is.
+    """
+
+    def __init__(self, cache_path=None, fallback=None, fallback_engine=None, max_workers=None, verbose=False, cxxfilt=False):
+        self.fallback = fallback
+        self.fallback_engine = fallback_engine
+        self.max_workers = max_workers or DEMANGLE_MAX_WORKERS or os.cpu_count() or 1
+        self.verbose = verbose
+        self.executor = None
+        self.names = {}
+        self.hits = 0
+        self.misses = 0
+
+        self.cxxfilt = getCxxfilt() if cxxfilt else None
+        self.engine = "c++filt" if self.cxxfilt else fallback_engine
+        if cxxfilt and self.cxxfilt is None and verbose:
+            print(f"[AutoResolv] {DEMANGLE_CXXFILT} not found, demangling with the fallback demangler")
+
+        self.cache = None
+        if cache_path is not None:
+            try:
+                self.cache = DEMANGLE_CACHE(cache_path, verbose)
+            except DemangleCacheError:
+                print("[AutoResolv] Couldn't open shared demangle cache, demangling every name")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def demangle(self, names):
+        """{name: demangled name or None} for every name of `names`"""
+        todo = set(name for name in names if name not in self.names and isMangled(name))
+        profileCount("demangle_names", len(todo))
+        if todo and self.cache is not None and self.engine is not None:
+            known = self.cache.get(self.engine, todo)
+            self.names.update(known)
+            self.hits += len(known)
+            todo.difference_update(known)
+
+        if todo:
+            self.misses += len(todo)
+            profileCount("demangle_misses", len(todo))
+            engine, demangled = self._demangle(sorted(todo))
+            self.names.update(demangled)
+            if self.cache is not None and engine is not None:
+                self.cache.put(engine, demangled)
+
+        return {name: self.names.get(name) for name in names}
+
+    def demangleRows(self, rows):
+        # rows of IMPORT_RESOLVER.feed() get their demangled name column, the name itself if it isn't mangled
+        demangled = self.demangle([row[0] for row in rows])
+        for row in rows:
+            name = demangled[row[0]]
+            row.append(name if name is not None else row[0])
+
+    def _demangle(self, names):
+        if self.cxxfilt is not None:
+            try:
+                return "c++filt", self._cxxfilt(names)
+            except Exception as e:
+                # not retried for every batch, the rest of the session uses the fallback
+                print(f"[AutoResolv] c++filt failed ({str(e)}), demangling with the fallback demangler")
+                self.cxxfilt = None
+                self.engine = self.fallback_engine
+
+        if self.fallback is not None:
+            return self.fallback_engine, self.fallback(names)
+        return None, {name: None for name in names}
+
+    def _cxxfilt(self, names):
+        chunks = [names[i:i + DEMANGLE_CHUNK] for i in range(0, len(names), DEMANGLE_CHUNK)]
+        if len(chunks) == 1 or self.max_workers < 2:
+            demangled = {}
+            for chunk in chunks:
+                demangled.update(cxxfiltDemangle(chunk, self.cxxfilt))
+            return demangled
+
+        # the work is done in the c++filt processes, threads only feed their pipes
+        if self.executor is None:
+            # concurrent.futures pulls logging in, most batches fit one chunk and never import it
+            import concurrent.futures
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        demangled = {}
+        for result in self.executor.map(cxxfiltDemangle, chunks, [self.cxxfilt] * len(chunks)):
+            demangled.update(result)
+        return demangled
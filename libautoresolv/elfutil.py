@@ -0,0 +1,502 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+from libautoresolv.error import *
+
+# No IDA import in this module: it is also loaded by the library parser processes
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+
+SHT_NOTE = 7
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_SYMENT = 11
+DT_RPATH = 15
+DT_RUNPATH = 29
+DT_PLTRELSZ = 2
+DT_RELA = 7
+DT_PLTREL = 20
+DT_JMPREL = 23
+DT_GNU_HASH = 0x6ffffef5
+DT_VERSYM = 0x6ffffff0
+DT_VERDEF = 0x6ffffffc
+DT_VERDEFNUM = 0x6ffffffd
+DT_VERNEED = 0x6ffffffe
+DT_VERNEEDNUM = 0x6fffffff
+
+EM_MIPS = 8
+
+SHN_UNDEF = 0
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+STB_GLOBAL = 1
+STB_WEAK = 2
+STV_DEFAULT = 0
+STV_PROTECTED = 3
+VER_FLG_BASE = 1
+VERSYM_HIDDEN = 0x8000
+NT_GNU_BUILD_ID = 3
+
+# (real path, size, mtime) -> exports of getAllFunsFromLib, least recently used first.
+# libraries kept, the symbol store already persists them
+FUNS_CACHE_LIBS = 64
+_FUNS_CACHE = OrderedDict()
+
+# (Ehdr, Phdr, Shdr, Dyn, Sym) layouts, Sym keeps only st_name, st_info, st_other, st_shndx
+_ELF_FORMATS = {
+    32: ("16xHHIIIIIHHHHHH", "IIIIIIII", "IIIIIIIIII", "iI", "I8xBBH"),
+    64: ("16xHHIQQQIHHHHHH", "IIQQQQQQ", "IIQQQQIIQQ", "qQ", "IBBH16x"),
+}
+
+
+class RAW_ELF():
+    """Minimal mmap based ELF reader, only what the dynamic symbol lookup needs"""
+
+    def __init__(self, path):
+        self.fd = open(path, "rb")
+        try:
+            self.mm = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: #empty file
+            self.fd.close()
+            raise ELFParseError(f"ERR_CRITICAL : {path} is empty")
+
+        try:
+            self._parse_headers()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+        self.fd.close()
+
+    def _parse_headers(self):
+        mm = self.mm
+        if mm[:4] != b"\x7fELF" or mm[4] not in (1, 2) or mm[5] not in (1, 2):
+            raise ELFParseError("ERR_CRITICAL : Not a valid ELF file")
+
+        self.elfclass = 32 if mm[4] == 1 else 64
+        self.endian = "<" if mm[5] == 1 else ">"
+        ehdr, phdr, shdr, dyn, sym = (self.endian + f for f in _ELF_FORMATS[self.elfclass])
+        self.dyn_fmt = struct.Struct(dyn)
+        self.sym_fmt = struct.Struct(sym)
+
+        (self.e_type, self.e_machine, _, _, phoff, shoff, _, _,
+         phentsize, phnum, shentsize, shnum, _) = struct.unpack_from(ehdr, mm, 0)
+
+        self.segments = []
+        for i in range(phnum):
+            fields = struct.unpack_from(phdr, mm, phoff + i * phentsize)
+            if self.elfclass == 32:
+                p_type, p_offset, p_vaddr, _, p_filesz = fields[:5]
+            else:
+                p_type, _, p_offset, p_vaddr, _, p_filesz = fields[:6]
+            self.segments.append((p_type, p_offset, p_vaddr, p_filesz))
+
+        self.sections = []
+        if shoff:
+            if shnum == 0: #extended numbering, real count is in section 0 sh_size
+                shnum = struct.unpack_from(shdr, mm, shoff)[5]
+            for i in range(shnum):
+                fields = struct.unpack_from(shdr, mm, shoff + i * shentsize)
+                # (sh_type, sh_offset, sh_size, sh_link, sh_entsize)
+                self.sections.append((fields[1], fields[4], fields[5], fields[6], fields[9]))
+
+    def vaddr_to_offset(self, vaddr):
+        for p_type, p_offset, p_vaddr, p_filesz in self.segments:
+            if p_type == PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        return None
+
+    def get_string(self, offset):
+        end = self.mm.find(b"\0", offset)
+        if end == -1:
+            end = len(self.mm)
+        return self.mm[offset:end].decode("utf-8", errors="replace")
+
+    def iter_dynamic(self):
+        for p_type, p_offset, _, p_filesz in self.segments:
+            if p_type != PT_DYNAMIC:
+                continue
+            for d_tag, d_val in self.dyn_fmt.iter_unpack(self.mm[p_offset:p_offset + p_filesz - p_filesz % self.dyn_fmt.size]):
+                if d_tag == DT_NULL:
+                    break
+                yield d_tag, d_val
+            return
+
+    def _dynsym_from_tags(self):
+        tags = {}
+        for d_tag, d_val in self.iter_dynamic():
+            tags.setdefault(d_tag, d_val)
+
+        if DT_SYMTAB not in tags or DT_STRTAB not in tags:
+            return None
+        sym_ptr = tags[DT_SYMTAB]
+        sym_off = self.vaddr_to_offset(sym_ptr)
+        str_off = self.vaddr_to_offset(tags[DT_STRTAB])
+        if sym_off is None or str_off is None:
+            return None
+
+        count = None
+        if DT_GNU_HASH in tags and self.vaddr_to_offset(tags[DT_GNU_HASH]) is not None:
+            count = self._gnu_hash_count(self.vaddr_to_offset(tags[DT_GNU_HASH]))
+        elif DT_HASH in tags and self.vaddr_to_offset(tags[DT_HASH]) is not None:
+            count = struct.unpack_from(self.endian + "I", self.mm, self.vaddr_to_offset(tags[DT_HASH]) + 4)[0]
+        else:
+            # no hash table, the symbol table ends at the closest higher table
+            higher = [val for tag, val in tags.items() if val > sym_ptr and tag != DT_SYMENT]
+            if higher:
+                count = (min(higher) - sym_ptr) // self.sym_fmt.size
+            else:
+                for p_type, _, p_vaddr, p_filesz in self.segments:
+                    if p_type == PT_LOAD and p_vaddr <= sym_ptr <= p_vaddr + p_filesz:
+                        count = (p_vaddr + p_filesz - sym_ptr) // self.sym_fmt.size
+        if count is None:
+            return None
+
+        return sym_off, count, str_off
+
+    def _gnu_hash_count(self, offset):
+        nbuckets, symoffset, bloom_size, _ = struct.unpack_from(self.endian + "IIII", self.mm, offset)
+        buckets_off = offset + 16 + bloom_size * (self.elfclass // 8)
+        buckets = struct.unpack_from(f"{self.endian}{nbuckets}I", self.mm, buckets_off)
+        max_idx = max(buckets) if buckets else 0
+        if max_idx < symoffset:
+            return symoffset
+
+        chain_off = buckets_off + nbuckets * 4 + (max_idx - symoffset) * 4
+        while True:
+            if struct.unpack_from(self.endian + "I", self.mm, chain_off)[0] & 1:
+                return max_idx + 1
+            max_idx += 1
+            chain_off += 4
+
+    def dynsym_table(self):
+        """Return (symtab offset, symbol count, strtab offset) of the dynamic symbols"""
+        for sh_type, sh_offset, sh_size, sh_link, sh_entsize in self.sections:
+            if sh_type == SHT_DYNSYM and sh_link < len(self.sections):
+                return sh_offset, sh_size // self.sym_fmt.size, self.sections[sh_link][1]
+
+        # stripped section headers, use DT_SYMTAB/DT_STRTAB like the loader
+        return self._dynsym_from_tags()
+
+    def iter_dynsym(self):
+        """Yield raw (st_name, st_info, st_other, st_shndx) of every dynamic symbol"""
+        table = self.dynsym_table()
+        if table is None:
+            return iter(())
+        sym_off, count, _ = table
+        return self.sym_fmt.iter_unpack(self.mm[sym_off:sym_off + count * self.sym_fmt.size])
+
+    def get_defined_funs(self):
+        table = self.dynsym_table()
+        if table is None:
+            return []
+        _, _, str_off = table
+
+        get_string = self.get_string
+        return [get_string(str_off + st_name)
+                for st_name, st_info, _, st_shndx in self.iter_dynsym()
+                if st_info & 0xf == STT_FUNC and st_shndx != SHN_UNDEF]
+
+    def _dynamic_tags(self):
+        tags = {}
+        for d_tag, d_val in self.iter_dynamic():
+            tags.setdefault(d_tag, d_val)
+        return tags
+
+    def _version_names(self, tags):
+        """{version index: name} from DT_VERDEF (base version excluded) and DT_VERNEED"""
+        names = {}
+        strtab = self.vaddr_to_offset(tags[DT_STRTAB]) if DT_STRTAB in tags else None
+        if strtab is None:
+            return names
+
+        mm = self.mm
+        off = self.vaddr_to_offset(tags[DT_VERDEF]) if DT_VERDEF in tags else None
+        for _ in range(tags.get(DT_VERDEFNUM, 0xffff) if off is not None else 0):
+            _, vd_flags, vd_ndx, vd_cnt, _, vd_aux, vd_next = struct.unpack_from(self.endian + "HHHHIII", mm, off)
+            if not vd_flags & VER_FLG_BASE and vd_cnt:
+                names[vd_ndx] = self.get_string(strtab + struct.unpack_from(self.endian + "I", mm, off + vd_aux)[0])
+            if not vd_next:
+                break
+            off += vd_next
+
+        off = self.vaddr_to_offset(tags[DT_VERNEED]) if DT_VERNEED in tags else None
+        for _ in range(tags.get(DT_VERNEEDNUM, 0xffff) if off is not None else 0):
+            _, vn_cnt, _, vn_aux, vn_next = struct.unpack_from(self.endian + "HHIII", mm, off)
+            aux = off + vn_aux
+            for _ in range(vn_cnt):
+                _, _, vna_other, vna_name, vna_next = struct.unpack_from(self.endian + "IHHII", mm, aux)
+                names[vna_other] = self.get_string(strtab + vna_name)
+                if not vna_next:
+                    break
+                aux += vna_next
+            if not vn_next:
+                break
+            off += vn_next
+        return names
+
+    def iter_versioned_dynsym(self):
+        """Yield (name, version or None, hidden, st_info, st_other, st_shndx) of every dynamic symbol"""
+        table = self.dynsym_table()
+        if table is None:
+            return
+        _, count, str_off = table
+
+        tags = self._dynamic_tags()
+        versym = None
+        names = {}
+        off = self.vaddr_to_offset(tags[DT_VERSYM]) if DT_VERSYM in tags else None
+        if off is not None:
+            versym = struct.unpack_from(f"{self.endian}{count}H", self.mm, off)
+            names = self._version_names(tags)
+
+        get_string = self.get_string
+        for i, (st_name, st_info, st_other, st_shndx) in enumerate(self.iter_dynsym()):
+            if versym is None:
+                yield get_string(str_off + st_name), None, False, st_info, st_other, st_shndx
+            else:
+                # index 0 and 1 (local, global/base) are unversioned
+                yield (get_string(str_off + st_name), names.get(versym[i] & 0x7fff),
+                       bool(versym[i] & VERSYM_HIDDEN), st_info, st_other, st_shndx)
+
+    def get_exports(self):
+        """(name, version, hidden, binding, visibility) of exported functions and ifuncs, hidden is a non default name@VERSION"""
+        return [(name, version, hidden, st_info >> 4, st_other & 3)
+                for name, version, hidden, st_info, st_other, st_shndx in self.iter_versioned_dynsym()
+                if st_info & 0xf in (STT_FUNC, STT_GNU_IFUNC) and st_shndx != SHN_UNDEF and st_other & 3 in (STV_DEFAULT, STV_PROTECTED)]
+
+    def get_import_versions(self):
+        """{name: version} of undefined functions, None for unversioned references"""
+        return {name: version
+                for name, version, _, st_info, _, st_shndx in self.iter_versioned_dynsym()
+                if st_info & 0xf == STT_FUNC and st_shndx == SHN_UNDEF and name}
+
+    def get_undefined_funs(self):
+        table = self.dynsym_table()
+        if table is None:
+            return []
+        _, _, str_off = table
+
+        get_string = self.get_string
+        return [get_string(str_off + st_name)
+                for st_name, st_info, _, st_shndx in self.iter_dynsym()
+                if st_info & 0xf == STT_FUNC and st_shndx == SHN_UNDEF and st_name != 0]
+
+    def get_plt_imports(self):
+        """Names bound through PLT relocations (DT_JMPREL), None when the binary has no such table"""
+        tags = self._dynamic_tags()
+        if DT_JMPREL not in tags or DT_PLTRELSZ not in tags:
+            return None
+
+        rel_off = self.vaddr_to_offset(tags[DT_JMPREL])
+        table = self.dynsym_table()
+        if rel_off is None or table is None:
+            return None
+        sym_off, count, str_off = table
+
+        # Elf_Rela adds r_addend after (r_offset, r_info)
+        is_rela = tags.get(DT_PLTREL) == DT_RELA
+        if self.elfclass == 32:
+            rel_fmt = struct.Struct(self.endian + ("IIi" if is_rela else "II"))
+        else:
+            rel_fmt = struct.Struct(self.endian + ("QQq" if is_rela else "QQ"))
+
+        imports = []
+        seen = set()
+        size = tags[DT_PLTRELSZ] - tags[DT_PLTRELSZ] % rel_fmt.size
+        for rel in rel_fmt.iter_unpack(self.mm[rel_off:rel_off + size]):
+            r_info = rel[1]
+            if self.elfclass == 32:
+                r_sym = r_info >> 8
+            elif self.e_machine == EM_MIPS and self.endian == "<":
+                r_sym = r_info & 0xffffffff #mips64el stores r_sym first, then the 4 type bytes
+            else:
+                r_sym = r_info >> 32
+
+            if r_sym == 0 or r_sym >= count or r_sym in seen:
+                continue
+            seen.add(r_sym)
+            st_name = self.sym_fmt.unpack_from(self.mm, sym_off + r_sym * self.sym_fmt.size)[0]
+            if st_name:
+                imports.append(self.get_string(str_off + st_name))
+        return imports
+
+    def get_needed(self):
+        """(DT_NEEDED names, DT_RPATH, DT_RUNPATH) of the dynamic section, missing tags are None"""
+        tags = list(self.iter_dynamic())
+        strtab = None
+        for d_tag, d_val in tags:
+            if d_tag == DT_STRTAB:
+                strtab = self.vaddr_to_offset(d_val)
+                break
+        if strtab is None:
+            return [], None, None
+
+        needed = []
+        rpath = None
+        runpath = None
+        for d_tag, d_val in tags:
+            if d_tag == DT_NEEDED:
+                needed.append(self.get_string(strtab + d_val))
+            elif d_tag == DT_RPATH and rpath is None:
+                rpath = self.get_string(strtab + d_val)
+            elif d_tag == DT_RUNPATH and runpath is None:
+                runpath = self.get_string(strtab + d_val)
+        return needed, rpath, runpath
+
+    def build_id(self):
+        notes = [(off, size) for sh_type, off, size, _, _ in self.sections if sh_type == SHT_NOTE]
+        if not notes:
+            notes = [(off, size) for p_type, off, _, size in self.segments if p_type == PT_NOTE]
+
+        for offset, size in notes:
+            end = offset + size
+            while offset + 12 <= end:
+                namesz, descsz, n_type = struct.unpack_from(self.endian + "III", self.mm, offset)
+                name_off = offset + 12
+                desc_off = name_off + ((namesz + 3) & ~3)
+                if n_type == NT_GNU_BUILD_ID and self.mm[name_off:name_off + namesz].rstrip(b"\0") == b"GNU":
+                    return self.mm[desc_off:desc_off + descsz].hex()
+                offset = desc_off + ((descsz + 3) & ~3)
+        return None
+
+
+def getBuildId(path):
+    try:
+        with RAW_ELF(path) as elf:
+            return elf.build_id()
+    except Exception:
+        return None
+
+def checkLibExist(newpath):
+    return os.path.exists(newpath)
+
+def isLibSkipped(path, libc):
+    if "Path not found" in path:
+        print(f"[AutoResolv] Couldn't Open {path} because path is not given")
+        return True
+    if ("libc.so" in path):
+        if (not libc):
+            return True
+    return False
+
+def _getAllFunsFromLibElftools(file):
+    # imported here, pyelftools takes longer to import than the rest of the resolver
+    from elftools.elf.elffile import ELFFile
+    elf = ELFFile(file)
+    funs = []
+    for seg in elf.iter_segments():
+        if seg.header['p_type'] == "PT_DYNAMIC":
+            for symb in seg.iter_symbols():
+                if symb.entry['st_shndx'] != 'SHN_UNDEF' and symb.entry['st_info']['type'] in ('STT_FUNC', 'STT_LOOS', 'STT_GNU_IFUNC'):
+                    bind = STB_WEAK if symb.entry['st_info']['bind'] == 'STB_WEAK' else STB_GLOBAL
+                    funs.append((symb.name, None, False, bind, STV_DEFAULT))
+    return funs
+
+def parseLibExports(path):
+    try:
+        with RAW_ELF(path) as elf:
+            return elf.get_exports()
+    except OSError:
+        print(f"[AutoResolv] Couldn't Open {path}, Are you sure the path is correct?")
+        return None
+    except Exception:
+        # malformed tables the raw reader can't walk, let pyelftools try
+        try:
+            with open(path, "rb") as file:
+                return _getAllFunsFromLibElftools(file)
+        except Exception:
+            print(f"[AutoResolv] Couldn't parse {path}, Skipping")
+            return None
+
+def getAllFunsFromLib(path, libc):
+    # list of RAW_ELF.get_exports() tuples, the function name comes first
+
+    if isLibSkipped(path, libc):
+        return None
+
+    # libraries shared by many binaries are parsed or looked up once per process
+    try:
+        st = os.stat(path)
+        key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    except OSError:
+        key = None
+    if key in _FUNS_CACHE:
+        _FUNS_CACHE.move_to_end(key)
+        return _FUNS_CACHE[key]
+
+    funs = parseLibExports(path)
+    if funs is None:
+        return None
+
+    _cacheFuns(key, funs)
+    return funs
+
+def _cacheFuns(key, funs):
+    if key is None:
+        return
+    _FUNS_CACHE[key] = funs
+    if len(_FUNS_CACHE) > FUNS_CACHE_LIBS:
+        _FUNS_CACHE.popitem(last=False)
+
+def clearFunsCache():
+    # at the end of a resolve, the exports of its libraries aren't kept for the rest of the session
+    _FUNS_CACHE.clear()
+        
+def getImportVersionsFromBin(binary):
+    """{name: version} required by the binary (.gnu.version_r), empty if it can't be read"""
+    try:
+        with RAW_ELF(binary) as elf:
+            return elf.get_import_versions()
+    except Exception:
+        return {}
+
+def getImportsFromBin(binary):
+    # PLT relocations match the wrappers IDA shows, MIPS without PLT falls back to undefined functions
+    try:
+        with RAW_ELF(binary) as elf:
+            imports = elf.get_plt_imports()
+            if imports is None:
+                imports = elf.get_undefined_funs()
+            return imports
+    except Exception:
+        raise Exception("[AutoResolv] Couldn't open binary, Aborting !")
+
+def isDynamicElf(path):
+    try:
+        with RAW_ELF(path) as elf:
+            return any(p_type == PT_DYNAMIC for p_type, _, _, _ in elf.segments)
+    except Exception:
+        return False
@@ -75,4 +75,24 @@ class IdaGetSegPLTError(Error):
 class IdaGetFunsError(Error):
     def __init__(self, message="ERR_CRITICAL : Retreived 0 function from .PLT ! Resolving can't be done"):
         self.message = message
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class ELFParseError(Error):
+    def __init__(self, message="ERR_CRITICAL : Parsing of ELF file failed"):
+        self.message = message
+        super().__init__(self.message)
+
+class CacheMigrationError(Error):
+    def __init__(self, message="ERR_CRITICAL : Migration of DB cache to the current schema failed"):
+        self.message = message
+        super().__init__(self.message)
+
+class SignatureCacheError(Error):
+    def __init__(self, message="ERR_CRITICAL : Opening of the shared signature cache failed"):
+        self.message = message
+        super().__init__(self.message)
+
+class DemangleCacheError(Error):
+    def __init__(self, message="ERR_CRITICAL : Opening of the shared demangle cache failed"):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,273 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# Shared library lookup following ld.so: DT_RPATH (ignored when DT_RUNPATH is set), DT_RUNPATH,
+# ld.so.conf then the default directories, everything below an optional sysroot.
+# LD_LIBRARY_PATH is not used, it belongs to the analysis host and not to the analysed binary.
+
+import glob
+import os
+import struct
+from collections import deque
+
+from libautoresolv.elfutil import *
+
+# False only looks at the binary direct DT_NEEDED entries
+LD_TRANSITIVE = True
+
+LD_SO_CONF = "/etc/ld.so.conf"
+
+EM_386 = 3
+EM_PPC = 20
+EM_PPC64 = 21
+EM_S390 = 22
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+EM_RISCV = 243
+
+# (e_machine, elfclass, endian) -> multiarch triplets, the first one is also the $PLATFORM guess
+MULTIARCH = {
+    (EM_386, 32, "<"): ["i386-linux-gnu"],
+    (EM_X86_64, 64, "<"): ["x86_64-linux-gnu"],
+    (EM_X86_64, 32, "<"): ["x86_64-linux-gnux32"],
+    (EM_ARM, 32, "<"): ["arm-linux-gnueabihf", "arm-linux-gnueabi"],
+    (EM_ARM, 32, ">"): ["armeb-linux-gnueabihf", "armeb-linux-gnueabi"],
+    (EM_AARCH64, 64, "<"): ["aarch64-linux-gnu"],
+    (EM_AARCH64, 64, ">"): ["aarch64_be-linux-gnu"],
+    (EM_MIPS, 32, ">"): ["mips-linux-gnu"],
+    (EM_MIPS, 32, "<"): ["mipsel-linux-gnu"],
+    (EM_MIPS, 64, ">"): ["mips64-linux-gnuabi64"],
+    (EM_MIPS, 64, "<"): ["mips64el-linux-gnuabi64"],
+    (EM_PPC, 32, ">"): ["powerpc-linux-gnu"],
+    (EM_PPC64, 64, ">"): ["powerpc64-linux-gnu"],
+    (EM_PPC64, 64, "<"): ["powerpc64le-linux-gnu"],
+    (EM_RISCV, 64, "<"): ["riscv64-linux-gnu"],
+    (EM_S390, 64, ">"): ["s390x-linux-gnu"],
+}
+
+# directory -> set of file names, every search directory is listed once per session
+_DIR_INDEX = {}
+# file -> (e_machine, elfclass, endian), None when not an ELF file
+_ELF_IDENT = {}
+# sysroot -> LD_RESOLVER
+_RESOLVERS = {}
+# real path -> (needed, rpath, runpath), None when unreadable, every library is read once per session
+_NODES = {}
+
+
+def clearDirIndex():
+    _DIR_INDEX.clear()
+    _ELF_IDENT.clear()
+    _NODES.clear()
+
+
+def getDynamicNode(path):
+    key = os.path.realpath(path)
+    if key not in _NODES:
+        try:
+            with RAW_ELF(key) as elf:
+                _NODES[key] = elf.get_needed()
+        except Exception:
+            _NODES[key] = None
+    return _NODES[key]
+
+
+def listDir(path):
+    names = _DIR_INDEX.get(path)
+    if names is None:
+        try:
+            with os.scandir(path) as it:
+                names = frozenset(entry.name for entry in it)
+        except OSError:
+            names = frozenset()
+        _DIR_INDEX[path] = names
+    return names
+
+
+def getElfIdent(path):
+    if path not in _ELF_IDENT:
+        ident = None
+        try:
+            with open(path, "rb") as fd:
+                head = fd.read(20)
+            if len(head) == 20 and head[:4] == b"\x7fELF" and head[4] in (1, 2) and head[5] in (1, 2):
+                endian = "<" if head[5] == 1 else ">"
+                ident = (struct.unpack_from(endian + "H", head, 18)[0], 32 if head[4] == 1 else 64, endian)
+        except OSError:
+            pass
+        _ELF_IDENT[path] = ident
+    return _ELF_IDENT[path]
+
+
+class LD_RESOLVER():
+
+    def __init__(self, sysroot=None, verbose=False):
+        self.sysroot = os.path.abspath(sysroot) if sysroot else None
+        self.verbose = verbose
+        self._conf_dirs = None
+        self._system_dirs = {}
+
+    def host_path(self, path):
+        if self.sysroot is None:
+            return path
+        return os.path.join(self.sysroot, path.lstrip("/"))
+
+    def _parse_conf(self, conf, dirs, seen):
+        host_conf = self.host_path(conf)
+        if host_conf in seen:
+            return
+        seen.add(host_conf)
+        try:
+            with open(host_conf) as fd:
+                lines = fd.readlines()
+        except OSError:
+            return
+
+        for line in lines:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            words = line.split()
+            if words[0] == "include":
+                for pattern in words[1:]:
+                    if not pattern.startswith("/"):
+                        pattern = os.path.join(os.path.dirname(conf), pattern)
+                    for match in sorted(glob.glob(self.host_path(pattern))):
+                        guest = match if self.sysroot is None else "/" + os.path.relpath(match, self.sysroot)
+                        self._parse_conf(guest, dirs, seen)
+            elif words[0] == "hwcap":
+                continue
+            else:
+                for path in line.replace(",", " ").replace(":", " ").split():
+                    if path.startswith("/"):
+                        dirs.append(path.split("=", 1)[0])
+
+    def conf_dirs(self):
+        if self._conf_dirs is None:
+            self._conf_dirs = []
+            self._parse_conf(LD_SO_CONF, self._conf_dirs, set())
+        return self._conf_dirs
+
+    def system_dirs(self, ident):
+        """ld.so.conf, multiarch and default directories for binaries of `ident` architecture"""
+        if ident not in self._system_dirs:
+            guest = list(self.conf_dirs())
+            for triplet in MULTIARCH.get(ident, []):
+                guest += ["/lib/" + triplet, "/usr/lib/" + triplet]
+            if ident[1] == 64:
+                guest += ["/lib64", "/usr/lib64"]
+            else:
+                guest += ["/lib32", "/usr/lib32"]
+            guest += ["/lib", "/usr/lib"]
+            self._system_dirs[ident] = list(dict.fromkeys(self.host_path(path) for path in guest))
+        return self._system_dirs[ident]
+
+    def expand(self, value, origin, ident):
+        """Host directories of a DT_RPATH/DT_RUNPATH value, $ORIGIN is already a host path"""
+        if not value:
+            return []
+        triplets = MULTIARCH.get(ident, ["unknown"])
+        lib = "lib64" if ident[1] == 64 else "lib"
+        platform = triplets[0].split("-")[0]
+
+        dirs = []
+        for entry in value.split(":"):
+            if not entry:
+                continue
+            for token, repl in (("$ORIGIN", origin), ("$LIB", lib), ("$PLATFORM", platform)):
+                entry = entry.replace("${" + token[1:] + "}", repl).replace(token, repl)
+
+            if entry.startswith(origin):
+                dirs.append(os.path.normpath(entry))
+            elif entry.startswith("/"):
+                dirs.append(os.path.normpath(self.host_path(entry)))
+            elif self.verbose:
+                print(f"[AutoResolv] Ignoring relative search path {entry}, it depends on the loader working directory")
+        return dirs
+
+    def find(self, name, dirs, ident):
+        """First file called `name` in `dirs` built for the same architecture, None if not found"""
+        if "/" in name:
+            path = self.host_path(name) if name.startswith("/") else None
+            return path if path and os.path.isfile(path) else None
+
+        for path in dirs:
+            if name in listDir(path):
+                full = os.path.join(path, name)
+                lib_ident = getElfIdent(full)
+                # ld.so skips libraries of another architecture found earlier in the path
+                if lib_ident is None or lib_ident == ident:
+                    return full
+        return None
+
+
+def getLdResolver(sysroot=None, verbose=False):
+    key = os.path.abspath(sysroot) if sysroot else None
+    if key not in _RESOLVERS:
+        _RESOLVERS[key] = LD_RESOLVER(sysroot, verbose)
+    return _RESOLVERS[key]
+
+
+def getLibsFromBin(binary, sysroot=None, verbose=False, transitive=None):
+    """Libraries loaded for `binary` in ld.so breadth-first order, the order symbols are looked up in.
+
+    Returns ({name: path or "Path not found"}, directories of the binary DT_RPATH/DT_RUNPATH or None).
+    """
+    if transitive is None:
+        transitive = LD_TRANSITIVE
+    resolver = getLdResolver(sysroot, verbose)
+    try:
+        with RAW_ELF(binary) as elf:
+            needed, rpath, runpath = elf.get_needed()
+            ident = (elf.e_machine, elf.elfclass, elf.endian)
+    except Exception:
+        raise Exception("[AutoResolv] Couldn't open binary, Aborting !")
+
+    has_paths = rpath is not None or runpath is not None
+    system_dirs = resolver.system_dirs(ident)
+    libs = {}
+    main_dirs = None
+    # (needed, rpath, runpath, $ORIGIN, DT_RPATH of the loaders up to the binary)
+    queue = deque([(needed, rpath, runpath, os.path.dirname(os.path.realpath(binary)), [])])
+    while queue:
+        needed, rpath, runpath, origin, chain = queue.popleft()
+        # an object with DT_RUNPATH ignores its DT_RPATH and the one of its loaders
+        if runpath is None:
+            chain = resolver.expand(rpath, origin, ident) + chain
+            dirs = chain + system_dirs
+        else:
+            dirs = resolver.expand(runpath, origin, ident) + system_dirs
+
+        if main_dirs is None:
+            main_dirs = dirs[:len(dirs) - len(system_dirs)]
+            for path in main_dirs:
+                if not os.path.isdir(path):
+                    print(f"[AutoResolv] RPATH dir {path} not found on computer, you must enter librairies manually on AutoResolv")
+
+        for lib in needed:
+            if lib in libs:
+                continue
+            path = resolver.find(lib, list(dict.fromkeys(dirs)), ident)
+            libs[lib] = path if path is not None else "Path not found"
+            if path is None or not transitive:
+                continue
+            node = getDynamicNode(path)
+            if node is not None:
+                queue.append((node[0], node[1], node[2], os.path.dirname(path), chain))
+
+    if not has_paths:
+        return libs, None
+    return libs, ":".join(main_dirs)
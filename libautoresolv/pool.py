@@ -0,0 +1,201 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import threading
+
+from libautoresolv.elfutil import *
+from libautoresolv.symstore import *
+from libautoresolv.profiler import *
+
+# Under 2 jobs, spawning interpreters costs more than it saves
+POOL_MIN_JOBS = 2
+
+
+def getPythonExecutable():
+    # Inside IDA sys.executable is ida64 itself, workers need the interpreter IDAPython is built on
+    exe = os.path.basename(sys.executable or "").lower()
+    if exe.startswith("python"):
+        return sys.executable
+
+    candidates = [
+        os.path.join(sys.exec_prefix, "bin", f"python{sys.version_info[0]}.{sys.version_info[1]}"),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+        os.path.join(sys.exec_prefix, "python.exe"),
+    ]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+
+    return shutil.which("python3")
+
+
+def startProcessPool(nb_jobs, max_workers=None, verbose=False, cancelable=False):
+    """Spawn-based process pool on a real interpreter, None when it isn't worth or can't be started.
+
+    A ProcessPoolExecutor, or with `cancelable` a multiprocessing.Pool, whose terminate() kills running jobs.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, nb_jobs)
+    if nb_jobs < POOL_MIN_JOBS or max_workers < 2:
+        return None
+
+    python = getPythonExecutable()
+    if python is None:
+        print("[AutoResolv] No python interpreter found for the process pool, running sequentially")
+        return None
+
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        ctx.set_executable(python)
+        if cancelable:
+            executor = ctx.Pool(max_workers)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx)
+    except Exception as e:
+        print(f"[AutoResolv] Couldn't start the process pool ({str(e)}), running sequentially")
+        return None
+
+    if verbose:
+        print(f"[AutoResolv] Running {nb_jobs} jobs with {max_workers} processes ({python})")
+    return executor
+
+
+class CANCEL_TOKEN():
+    """Set from the UI thread, polled by the thread driving the parsing"""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_canceled(self):
+        return self.event.is_set()
+
+
+class LIB_PARSER_POOL():
+
+    def __init__(self, max_workers=None, verbose=False, token=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.verbose = verbose
+        self.token = token
+        self.pool = None
+        self.pending = set()
+
+    def _canceled(self):
+        return self.token is not None and self.token.is_canceled()
+
+    def _start(self, nb_libs):
+        if self.pool is None:
+            self.pool = startProcessPool(nb_libs, self.max_workers, self.verbose, cancelable=True)
+        return self.pool is not None
+
+    def parse(self, libsinfo, libc, poll=0.1, store_dir=None):
+        """Yield (lib, funs) as each library finishes, and (None, None) every poll seconds while waiting.
+
+        With `store_dir`, workers write a symbol store file and funs is the opened SYMBOL_STORE.
+        """
+
+        todo = []
+        for lib, path in libsinfo.items():
+            if isLibSkipped(path, libc):
+                yield lib, None
+                continue
+
+            if store_dir is not None:
+                store = openSymbolStore(getSymbolStorePath(store_dir, path), path)
+                if store is not None:
+                    profileCount("store_hits")
+                    yield lib, store
+                    continue
+
+            todo.append(lib)
+
+        if not self._start(len(todo)):
+            for lib in todo:
+                if self._canceled():
+                    return
+                with profilePhase("elf_parse", lib):
+                    if store_dir is not None:
+                        # already looked up in the store above, only built and opened once parsed
+                        store_path = buildSymbolStore(libsinfo[lib], store_dir)
+                        funs = openSymbolStore(store_path, libsinfo[lib]) if store_path is not None else None
+                    else:
+                        funs = getAllFunsFromLib(libsinfo[lib], libc)
+                yield lib, funs
+            return
+
+        # parser processes time themselves when profiling, their CPU isn't visible from here
+        profiler = getProfiler()
+        done = queue.Queue()
+        for lib in todo:
+            if store_dir is not None:
+                job = (buildSymbolStore, libsinfo[lib], store_dir)
+            else:
+                job = (getAllFunsFromLib, libsinfo[lib], libc)
+            if profiler is not None:
+                job = (timedCall,) + job
+            # results come back through the queue in completion order, from the pool's result thread
+            self.pool.apply_async(job[0], job[1:],
+                                  callback=lambda funs, lib=lib: done.put((lib, funs, None)),
+                                  error_callback=lambda e, lib=lib: done.put((lib, None, e)))
+            self.pending.add(lib)
+
+        while self.pending:
+            try:
+                lib, funs, error = done.get(timeout=poll)
+            except queue.Empty:
+                lib = None
+            if self._canceled():
+                self.cancel()
+                return
+            if lib is None:
+                yield None, None
+                continue
+
+            self.pending.discard(lib)
+            if error is not None:
+                print(f"[AutoResolv] Parser process failed on {lib}: {str(error)}")
+            elif profiler is not None:
+                funs, wall, cpu = funs
+                profiler.record("elf_parse", wall, cpu, lib)
+
+            if store_dir is not None:
+                # only the store path crosses the process boundary, not the symbol list
+                funs = openSymbolStore(funs, libsinfo[lib]) if funs is not None else None
+            yield lib, funs
+
+    def terminate(self):
+        """Kill the parser processes, libraries being parsed are abandoned"""
+        pool = self.pool
+        if pool is not None:
+            pool.terminate()
+
+    def cancel(self):
+        self.pending = set()
+        self.terminate()
+        self.shutdown(wait=False)
+
+    def shutdown(self, wait=True):
+        pool = self.pool
+        if pool is not None:
+            self.pool = None
+            pool.close()
+            if wait:
+                pool.join()
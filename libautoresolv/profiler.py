@@ -0,0 +1,238 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows, peak RSS is not reported
+    resource = None
+
+# profiler of the run in progress, None when profiling is disabled
+_ACTIVE = None
+
+
+def getPeakRss():
+    """Peak resident set size of this process in KiB, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB on Linux
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def timedCall(fun, *args):
+    """fun(*args) with its wall and CPU time, picklable so parser processes can report their own cost"""
+    t_wall = time.perf_counter()
+    t_cpu = time.process_time()
+    result = fun(*args)
+    return result, time.perf_counter() - t_wall, time.process_time() - t_cpu
+
+
+class _NULL_PHASE():
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = _NULL_PHASE()
+
+
+class PHASE():
+
+    def __init__(self, profiler, name, key):
+        self.profiler = profiler
+        self.name = name
+        self.key = key
+
+    def __enter__(self):
+        # thread CPU: phases of the UI thread and of the resolve worker overlap
+        self.t_wall = time.perf_counter()
+        self.t_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.t_wall, time.thread_time() - self.t_cpu, self.key)
+        return False
+
+
+class PROFILER():
+
+    def __init__(self, name, report_dir=None, cprofile=False):
+        self.name = name
+        self.report_dir = report_dir
+        self.cprofile = cprofile
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.profiles = []
+        self.started = time.time()
+        self.t_wall = time.perf_counter()
+        self.t_cpu = time.process_time()
+
+    def phase(self, name, key=None):
+        return PHASE(self, name, key)
+
+    def record(self, name, wall, cpu, key=None):
+        rss = getPeakRss()
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'max_wall': 0.0, 'peak_rss_kb': None}
+            phase['calls'] += 1
+            phase['wall'] += wall
+            phase['cpu'] += cpu
+            phase['max_wall'] = max(phase['max_wall'], wall)
+            phase['peak_rss_kb'] = rss
+            if key is not None:
+                items = phase.setdefault('items', {})
+                item = items.setdefault(key, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+                item['calls'] += 1
+                item['wall'] += wall
+                item['cpu'] += cpu
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def capture(self):
+        """cProfile of the calling thread for the duration of the with block"""
+        if not self.cprofile:
+            return NULL_PHASE
+        return _CAPTURE(self)
+
+    def report(self):
+        children_cpu = None
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            children_cpu = usage.ru_utime + usage.ru_stime
+        with self.lock:
+            return {
+                'run': self.name,
+                'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                'wall': time.perf_counter() - self.t_wall,
+                'cpu': time.process_time() - self.t_cpu,
+                'children_cpu': children_cpu,
+                'peak_rss_kb': getPeakRss(),
+                'phases': {name: dict(phase) for name, phase in self.phases.items()},
+                'counters': dict(self.counters),
+            }
+
+    def save(self):
+        """Write the JSON report (and the merged cProfile), return the report path or None"""
+        report = self.report()
+        if self.report_dir is None:
+            return None
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        base = os.path.join(self.report_dir, f".profile_{self.name}_{stamp}")
+        try:
+            if self.profiles:
+                import pstats
+                stats = pstats.Stats(self.profiles[0])
+                for profile in self.profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(base + ".prof")
+                report['cprofile'] = base + ".prof"
+            with open(base + ".json", "w") as fd:
+                json.dump(report, fd, indent=2)
+        except Exception as e:
+            print(f"[AutoResolv] Couldn't write profiling report ({str(e)}), Skipping")
+            return None
+        return base + ".json"
+
+
+class _CAPTURE():
+
+    def __init__(self, profiler):
+        # cProfile and pstats are imported by runs that use them only, like pyelftools
+        import cProfile
+        self.profiler = profiler
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        try:
+            self.profile.enable()
+        except ValueError:
+            # another profiler already hooks this thread
+            self.profile = None
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.disable()
+            with self.profiler.lock:
+                self.profiler.profiles.append(self.profile)
+        return False
+
+
+def startProfiler(name, report_dir=None, enabled=False, cprofile=False):
+    """Make a PROFILER the active one for this run, None when profiling is disabled
+
+    enabled writes per-phase timers, counters and peak RSS to one JSON report per run,
+    cprofile also captures a cProfile of the run (.prof next to the report), much slower.
+    """
+    global _ACTIVE
+    if not enabled:
+        _ACTIVE = None
+        return None
+    _ACTIVE = PROFILER(name, report_dir, bool(cprofile))
+    return _ACTIVE
+
+
+def stopProfiler():
+    """Save and detach the active profiler, return its report path"""
+    global _ACTIVE
+    profiler = _ACTIVE
+    _ACTIVE = None
+    if profiler is None:
+        return None
+    path = profiler.save()
+    if path is not None:
+        print(f"[AutoResolv] Profiling report written to {path}")
+    return path
+
+
+def getProfiler():
+    return _ACTIVE
+
+
+def profilePhase(name, key=None):
+    # the shared no-op phase when disabled, nothing is timed nor allocated
+    profiler = _ACTIVE
+    if profiler is None:
+        return NULL_PHASE
+    return profiler.phase(name, key)
+
+
+def profileCount(name, n=1):
+    profiler = _ACTIVE
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+def profileCapture():
+    profiler = _ACTIVE
+    if profiler is None:
+        return NULL_PHASE
+    return profiler.capture()
@@ -15,8 +15,14 @@
 import idaapi
 import subprocess
 import os
+import re
 import sys
 
+from libautoresolv.dbcache import parseSearchQuery
+
+# chooser column -> label of its "Sort by" popup entry, paged results sort in SQL
+SORT_COLUMNS = ["Function Name", "Library Name", "Path", "C++ Demangled Name"]
+
 
 #class for result print on IDA
 class ResultShower(idaapi.Choose):
@@ -54,12 +60,19 @@ class ResultShower(idaapi.Choose):
                 embedded=embedded)
 
 
+        # items is a list of rows, or a dbcache.CACHED_ROWS paging them from the DB cache
         self.items = items
+        self.width = 4 if self.demangle else 3
+        self.paged = hasattr(items, "set_order")
+        self.library = None
+        self.query = ""
         self.selcount = 0
         self.n = len(items)
         self.popup_names = ["Open lib in ida"]
 
     def OnClose(self):
+        if self.paged:
+            self.items.close()
         return
         self.selcount += 1
 
@@ -68,19 +81,65 @@ class ResultShower(idaapi.Choose):
 
     def OnGetLine(self, n):
         res = self.items[n]
-        if self.demangle:
-            res =   [res[0], res[1], res[2], res[3]]
-        else:
-            res = [res[0], res[1], res[2]]
+        if len(res) != self.width:
+            res = res[:self.width]
         return res
 
     def OnGetSize(self):
         n = len(self.items)
         return n
+
+    def update_items(self):
+        # rows are appended/updated in self.items while libraries are still being resolved
+        self.n = len(self.items)
+        self.Refresh()
+
+    def set_items(self, items):
+        # the resolved rows were saved, the window now pages them from the DB cache
+        if self.paged:
+            self.items.close()
+        self.items = items
+        self.paged = hasattr(items, "set_order")
+        self.library = None
+        self.query = ""
+        self._register_actions()
+        self.update_items()
+
     def OnPopup(self, form, popup_handle):
         idaapi.attach_action_to_popup(form, popup_handle, "AutoResolv:OpenLibInIDA", None)
+        if self.paged:
+            for column in range(self.width):
+                idaapi.attach_action_to_popup(form, popup_handle, f"AutoResolv:SortBy{column}", "Sort/")
+            idaapi.attach_action_to_popup(form, popup_handle, "AutoResolv:Search", None)
+            idaapi.attach_action_to_popup(form, popup_handle, "AutoResolv:FilterLibrary", None)
+            idaapi.attach_action_to_popup(form, popup_handle, "AutoResolv:ClearFilter", None)
         return True
 
+    def sort(self, column):
+        # same column again flips the direction
+        descending = self.items.order == column and not self.items.descending
+        self.items.set_order(column, descending)
+        self.update_items()
+
+    def filter_library(self, library):
+        self.library = library
+        self.search(self.query)
+
+    def search(self, query):
+        # a "lib:" term of the query wins over the library picked from the popup
+        library, text, mode, demangled = parseSearchQuery(query)
+        if demangled and not self.demangle:
+            print("[AutoResolv] C++ demangled names aren't in the cache, enable demangling and resolve again")
+            return
+        try:
+            self.items.set_filter(library or self.library, text, mode, demangled)
+        except re.error as e:
+            print(f"[AutoResolv] Invalid regex {text} : {e}")
+            return
+        self.query = query
+        self.update_items()
+        print(f"[AutoResolv] {len(self.items)} functions shown")
+
     def show(self):
         self._register_actions()
         return self.Show() >= 0
@@ -97,9 +156,26 @@ class ResultShower(idaapi.Choose):
         )
         
         idaapi.register_action(action_desc)
+
+        if not self.paged:
+            return
+        for column in range(self.width):
+            idaapi.unregister_action(f"AutoResolv:SortBy{column}")
+            idaapi.register_action(idaapi.action_desc_t(f"AutoResolv:SortBy{column}", f"Sort by {SORT_COLUMNS[column]}", SortHandler(self, column), None, None, 0))
+        idaapi.unregister_action("AutoResolv:Search")
+        idaapi.register_action(idaapi.action_desc_t("AutoResolv:Search", "Search functions...", SearchHandler(self), None, None, 0))
+        idaapi.unregister_action("AutoResolv:FilterLibrary")
+        idaapi.register_action(idaapi.action_desc_t("AutoResolv:FilterLibrary", "Show only this library", FilterLibraryHandler(self), None, None, 0))
+        idaapi.unregister_action("AutoResolv:ClearFilter")
+        idaapi.register_action(idaapi.action_desc_t("AutoResolv:ClearFilter", "Show all functions", FilterLibraryHandler(self, clear=True), None, None, 0))
     
     def _unregister_actions(self):
         idaapi.unregister_action("AutoResolv:OpenLibInIDA")
+        for column in range(len(SORT_COLUMNS)):
+            idaapi.unregister_action(f"AutoResolv:SortBy{column}")
+        idaapi.unregister_action("AutoResolv:Search")
+        idaapi.unregister_action("AutoResolv:FilterLibrary")
+        idaapi.unregister_action("AutoResolv:ClearFilter")
 
 class OpenLibInIDAHandler(idaapi.action_handler_t):
     
@@ -124,3 +200,52 @@ class OpenLibInIDAHandler(idaapi.action_handler_t):
     
     def update(self, ctx):
         return idaapi.AST_ENABLE_ALWAYS
+
+class SortHandler(idaapi.action_handler_t):
+
+    def __init__(self, result_shower, column):
+        idaapi.action_handler_t.__init__(self)
+        self.result_shower = result_shower
+        self.column = column
+
+    def activate(self, ctx):
+        self.result_shower.sort(self.column)
+        return 1
+
+    def update(self, ctx):
+        return idaapi.AST_ENABLE_ALWAYS
+
+class FilterLibraryHandler(idaapi.action_handler_t):
+
+    def __init__(self, result_shower, clear=False):
+        idaapi.action_handler_t.__init__(self)
+        self.result_shower = result_shower
+        self.clear = clear
+
+    def activate(self, ctx):
+        if self.clear:
+            # the search goes away too
+            self.result_shower.query = ""
+            self.result_shower.filter_library(None)
+        elif ctx.chooser_selection:
+            self.result_shower.filter_library(self.result_shower.items[ctx.chooser_selection[0]][1])
+        return 1
+
+    def update(self, ctx):
+        return idaapi.AST_ENABLE_ALWAYS
+
+class SearchHandler(idaapi.action_handler_t):
+
+    def __init__(self, result_shower):
+        idaapi.action_handler_t.__init__(self)
+        self.result_shower = result_shower
+
+    def activate(self, ctx):
+        query = idaapi.ask_str(self.result_shower.query, 0, "Search (text, ^prefix, /regex/, dm: demangled names, lib:<library>)")
+        if query is None:
+            return 0
+        self.result_shower.search(query)
+        return 1
+
+    def update(self, ctx):
+        return idaapi.AST_ENABLE_ALWAYS
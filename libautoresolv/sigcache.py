@@ -0,0 +1,74 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import sqlite3
+
+from libautoresolv.error import *
+
+# Shared between every library exported from the db/ directory
+SIGCACHE_NAME = ".sigcache.db"
+
+
+class SIGNATURE_CACHE():
+
+    def __init__(self, path, build_id, verbose=False):
+        self.db_path = path
+        self.build_id = build_id
+        self.verbose = verbose
+        self.pending = []
+
+        try:
+            self.con = sqlite3.connect(self.db_path, timeout=30)
+            self.cur = self.con.cursor()
+            self.cur.execute("CREATE TABLE IF NOT EXISTS prototype(build_id TEXT NOT NULL, ea INTEGER NOT NULL, fingerprint TEXT NOT NULL, csig TEXT NOT NULL, PRIMARY KEY(build_id, ea))")
+            self.con.commit()
+        except Exception:
+            raise SignatureCacheError
+
+        # one library per export, load its prototypes once instead of a query per function
+        self.prototypes = {}
+        cmd = self.cur.execute("SELECT ea, fingerprint, csig FROM prototype WHERE build_id=?", (self.build_id,))
+        for ea, fingerprint, csig in cmd.fetchall():
+            self.prototypes[ea] = (fingerprint, csig)
+
+        if self.verbose:
+            print(f"[AutoResolv] Signature cache: {len(self.prototypes)} prototypes known for build-id {self.build_id}")
+
+    def get(self, ea, fingerprint):
+        known = self.prototypes.get(ea)
+        if known is None or known[0] != fingerprint:
+            return None
+        return known[1]
+
+    def put(self, ea, fingerprint, csig):
+        self.prototypes[ea] = (fingerprint, csig)
+        self.pending.append((self.build_id, ea, fingerprint, csig))
+
+    def flush(self):
+        if not self.pending:
+            return
+        try:
+            with self.con:
+                self.cur.executemany("INSERT INTO prototype VALUES (?, ?, ?, ?) ON CONFLICT(build_id, ea) DO UPDATE SET fingerprint=excluded.fingerprint, csig=excluded.csig", self.pending)
+            self.pending = []
+        except Exception:
+            print("[AutoResolv] Couldn't save prototypes to signature cache, Skipping")
+
+    def close(self):
+        self.flush()
+        if hasattr(self, 'cur') and self.cur:
+            self.cur.close()
+        if hasattr(self, 'con') and self.con:
+            self.con.close()
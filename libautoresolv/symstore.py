@@ -0,0 +1,228 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# Compact read-only symbol store, one file per library in db/.symstore/:
+#   header | buckets | hashes | name offsets | name lengths | version offsets | version lengths | flags | strings
+# Entries are sorted by crc32 of the name and bucketed on the hash top bits, so a lookup is
+# one bucket read plus a couple of comparisons straight from the mmap, without loading the library symbols.
+
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from libautoresolv.elfutil import *
+from libautoresolv.profiler import *
+
+SYMSTORE_DIR = ".symstore"
+
+SYMSTORE_MAGIC = b"ARSYM\x01\x00" + (b"<" if sys.byteorder == "little" else b">")
+_HEADER = struct.Struct("=8sQQIII4x")
+_NO_VERSION = 0xffffffff
+
+# store file -> SYMBOL_STORE, stores are opened once per process
+_STORES = {}
+
+
+def getSymbolStorePath(store_dir, lib_path):
+    key = hashlib.sha1(os.path.realpath(lib_path).encode("utf-8", errors="surrogateescape")).hexdigest()
+    return os.path.join(store_dir, key[:24] + ".sym")
+
+
+def writeSymbolStore(store_path, exports, size, mtime):
+    blob = bytearray()
+    strings = {}
+
+    def intern(text):
+        raw = text.encode("utf-8", errors="surrogateescape")
+        if raw not in strings:
+            strings[raw] = len(blob)
+            blob.extend(raw)
+        return strings[raw], len(raw)
+
+    entries = []
+    for name, version, hidden, bind, visibility in exports:
+        name_off, name_len = intern(name)
+        ver_off, ver_len = intern(version) if version is not None else (_NO_VERSION, 0)
+        crc = zlib.crc32(blob[name_off:name_off + name_len])
+        entries.append((crc, name_off, name_len, ver_off, ver_len, int(bool(hidden)) | (visibility & 3) << 1 | (bind & 0xf) << 3))
+    entries.sort()
+
+    count = len(entries)
+    bits = max(1, (count // 2).bit_length())
+    shift = 32 - bits
+    buckets = array.array("I", [0] * ((1 << bits) + 1))
+    for crc, *_ in entries:
+        buckets[(crc >> shift) + 1] += 1
+    for i in range(1, len(buckets)):
+        buckets[i] += buckets[i - 1]
+
+    columns = [array.array("I", (entry[i] for entry in entries)) for i in range(5)]
+    flags = bytes(entry[5] for entry in entries)
+
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fd:
+        fd.write(_HEADER.pack(SYMSTORE_MAGIC, size, mtime, count, bits, len(blob)))
+        buckets.tofile(fd)
+        for column in columns:
+            column.tofile(fd)
+        fd.write(flags)
+        fd.write(blob)
+    # readers never see a half written store, concurrent builders just replace each other
+    os.replace(tmp_path, store_path)
+
+
+class SYMBOL_STORE():
+
+    def __init__(self, store_path):
+        self.path = store_path
+        with open(store_path, "rb") as fd:
+            self.mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, self.size, self.mtime, self.count, bits, blob_size = _HEADER.unpack_from(self.mm, 0)
+            if magic != SYMSTORE_MAGIC:
+                raise ELFParseError(f"ERR_CRITICAL : {store_path} is not a symbol store")
+            self.shift = 32 - bits
+            self.view = view = memoryview(self.mm)
+            off = _HEADER.size
+            nb = (1 << bits) + 1
+            self.buckets = view[off:off + nb * 4].cast("I")
+            off += nb * 4
+            self.hashes, self.name_off, self.name_len, self.ver_off, self.ver_len = (
+                view[off + i * self.count * 4:off + (i + 1) * self.count * 4].cast("I") for i in range(5))
+            off += 5 * self.count * 4
+            self.flags = view[off:off + self.count]
+            self.blob = off + self.count
+            if self.blob + blob_size != len(self.mm):
+                raise ELFParseError(f"ERR_CRITICAL : {store_path} is truncated")
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        for name in ("buckets", "hashes", "name_off", "name_len", "ver_off", "ver_len", "flags", "view"):
+            if hasattr(self, name):
+                getattr(self, name).release()
+        self.mm.close()
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        flags = self.flags[i]
+        version = None
+        if self.ver_off[i] != _NO_VERSION:
+            start = self.blob + self.ver_off[i]
+            version = self.mm[start:start + self.ver_len[i]].decode("utf-8", errors="surrogateescape")
+        return version, bool(flags & 1), flags >> 3, flags >> 1 & 3
+
+    def _name(self, i):
+        start = self.blob + self.name_off[i]
+        return self.mm[start:start + self.name_len[i]]
+
+    def lookup(self, name):
+        """[(version, hidden, binding, visibility)] of every export called `name`"""
+        raw = name.encode("utf-8", errors="surrogateescape")
+        crc = zlib.crc32(raw)
+        bucket = crc >> self.shift
+        found = []
+        for i in range(self.buckets[bucket], self.buckets[bucket + 1]):
+            if self.hashes[i] == crc and self._name(i) == raw:
+                found.append(self._entry(i))
+        return found
+
+    def __contains__(self, name):
+        return bool(self.lookup(name))
+
+    def __iter__(self):
+        # materializes every symbol, only for callers that really need the whole list
+        for i in range(self.count):
+            yield (self._name(i).decode("utf-8", errors="surrogateescape"),) + self._entry(i)
+
+
+def openSymbolStore(store_path, lib_path=None):
+    """Opened store, None if missing, unreadable or older than `lib_path`"""
+    store = _STORES.get(store_path)
+    if store is None:
+        try:
+            store = SYMBOL_STORE(store_path)
+        except Exception:
+            return None
+
+    if lib_path is not None:
+        try:
+            st = os.stat(lib_path)
+        except OSError:
+            st = None
+        if st is None or (st.st_size, st.st_mtime_ns) != (store.size, store.mtime):
+            _STORES.pop(store_path, None)
+            store.close()
+            return None
+
+    _STORES[store_path] = store
+    return store
+
+
+def buildSymbolStore(lib_path, store_dir):
+    """Parse `lib_path` into its store file, return the store path or None, runs in parser processes"""
+    try:
+        st = os.stat(lib_path)
+    except OSError:
+        print(f"[AutoResolv] Couldn't Open {lib_path}, Are you sure the path is correct?")
+        return None
+
+    exports = parseLibExports(lib_path)
+    if exports is None:
+        return None
+
+    store_path = getSymbolStorePath(store_dir, lib_path)
+    try:
+        os.makedirs(store_dir, exist_ok=True)
+        with profilePhase("index_build"):
+            writeSymbolStore(store_path, exports, st.st_size, st.st_mtime_ns)
+    except OSError:
+        print(f"[AutoResolv] Couldn't write symbol store of {lib_path}, Skipping")
+        return None
+    return store_path
+
+
+def getLibSymbolStore(lib_path, store_dir, libc, stats=None):
+    """SYMBOL_STORE of a library, built on first use, None if skipped or unparsable"""
+    if isLibSkipped(lib_path, libc):
+        return None
+
+    store_path = getSymbolStorePath(store_dir, lib_path)
+    store = openSymbolStore(store_path, lib_path)
+    if store is not None:
+        if stats is not None:
+            stats['hits'] = stats.get('hits', 0) + 1
+        profileCount("store_hits")
+        return store
+
+    if stats is not None:
+        stats['misses'] = stats.get('misses', 0) + 1
+    if buildSymbolStore(lib_path, store_dir) is None:
+        return None
+    return openSymbolStore(store_path, lib_path)
+
+
+def clearSymbolStores():
+    for store in _STORES.values():
+        store.close()
+    _STORES.clear()
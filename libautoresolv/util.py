@@ -1,4 +1,3 @@
-
 # This file is part of AutoResolv.
 # Copyright 2022 - Airbus, thibault poncetta
 # AutoResolv is free software: you can redistribute it and/or modify
@@ -17,15 +16,28 @@ import idautils
 import idc
 import ida_funcs
 import idaapi
+import ida_auto
+import ida_kernwin
+import ida_nalt
+import ida_typeinf
 import os
 import subprocess
-import elftools
 import re
-from elftools.elf.elffile import ELFFile
+import time
 
 from libautoresolv.error import *
+from libautoresolv.elfutil import *
+from libautoresolv.ldpath import *
+from libautoresolv.core import *
+from libautoresolv.symstore import *
+from libautoresolv.sigcache import *
+from libautoresolv.demangler import *
+from libautoresolv.profiler import *
 from collections import defaultdict
 
+# False always decompiles, even when IDA already knows the function type
+SIGNATURE_FROM_TYPEINFO = True
+
 def get_seg(segname):
     for s in idautils.Segments():
         seg = idaapi.getseg(s)
@@ -59,178 +71,192 @@ def get_funs(s,e):
     return fun_list
 
 
-def checkLibExist(newpath):
-    return os.path.exists(newpath)
+def idaDemangle(fun):
+    return idc.demangle_name(fun, idc.get_inf_attr(idc.INF_SHORT_DN))
 
-def getAllFunsFromLib(path, libc):
+def getDemangler(config):
+    return idaDemangle if config['demangle'] else None
 
-    if "Path not found" in path:
-        print(f"[AutoResolv] Couldn't Open {path} because path is not given")
-        return None
-    if ("libc.so" in path):
-        if (not libc):
-            return None
-  
-    funs = []
-    file = None
-    try:
-        file = open(path,"rb")
-    except Exception:
-        print(f"[AutoResolv] Couldn't Open {path}, Are you sure the path is correct?")
-        return None
+def executeSync(fun, write=False):
+    """Run fun() on the IDA main thread and return its result, IDA APIs are not thread safe"""
+    result = []
 
-    elf = ELFFile(file)
-    funs = []
-    for seg in elf.iter_segments():
-        if seg.header['p_type'] == "PT_DYNAMIC":
-            for symb in seg.iter_symbols():
-                if symb.entry['st_shndx'] != 'SHN_UNDEF' and symb.entry['st_info']['type'] == 'STT_FUNC':
-                    funs.append(symb.name)                    
-    return funs
-        
-def getLibsFromBin(binary):
-    print("[AutoResolv] Using readelf to parse binary info.")
-    libs = {}
-    rpath = None
-    try:
-        libs = {}
-        fd = open(binary ,"rb")
-        elf = ELFFile(fd)
-        for seg in elf.iter_segments():
-            if seg.header['p_type'] == "PT_DYNAMIC":
-                for tag in seg.iter_tags():
-                    if tag.entry['d_tag'] == "DT_NEEDED":
-                        libs[tag.needed] = "Path not found"
-                    if tag.entry['d_tag'] == "DT_RPATH" or tag.entry['d_tag'] == "DT_RUNPATH":
-                        
-                        try:
-                            rpath = tag.rpath
-                        except Exception:
-                            rpath = tag.runpath
-
-    except Exception as e:
-        raise Exception("[AutoResolv] Couldn't open binary, Aborting !")
-    for lib in libs:
-        path_lib = os.path.join("/usr/lib", lib)
-        _exist = os.path.exists(path_lib)
-        if _exist:
-            libs[lib] = path_lib
-
-        path_lib = os.path.join("/lib/x86_64-linux-gnu", lib)
-        _exist = os.path.exists(path_lib)
-        if _exist:
-            libs[lib] = path_lib
-
-    if rpath is not None:
-        all_rpath = rpath.split(":")
-        for rpath_ in all_rpath:
-            dir = None
-            try:
-                dir = os.listdir(rpath_)
-            except FileNotFoundError:
-                print("[AutoResolv] RPATH dir not found on computer, you must enter librairies manually on AutoResolv")
-                return libs, None
-
-            for lib in dir:
-                if not os.path.isdir(os.path.join(rpath_, lib)):
-                    path_lib = os.path.join(rpath_, lib)
-                    _exist = os.path.exists(path_lib)
-                    if _exist:
-                        double = False
-                        setTXZ = None
-                        for libx in libs:
-                            if (lib.split(".")[0] + ".so") in libx and libs[libx] != "Path not found": #remove double , libcustom.so.1 and libcustom.so.1.0.0
-                                double=True
-                            
-
-                        if not double:
-                            lib_formatted = lib
-                            if len(lib.split(".")) > 3:
-                                lib_formatted = ".".join(lib.split(".")[0:-2])
-                            if lib_formatted in libs:
-                                libs[lib_formatted] = path_lib
-
-    return libs,rpath
-
-def Resolve(externalfuns, libs, paths, config):
-        resolved = defaultdict(list)
-        for fun in externalfuns:
-            resolved[fun] = [externalfuns[fun], "Unknow Library"]
-        values = []
-
-        # Optimized algorithm using hash table - O(L×F + E) instead of O(L×F×E)
-        # Step 1: Build reverse index of library functions - O(L × F)
-        func_to_lib = {}  # {function_name: (lib_name, lib_path)}
-        for lib in libs:
-            for fun in libs[lib]:
-                # Store last occurrence to match original behavior
-                func_to_lib[fun] = (lib, paths[lib])
-
-        # Step 2: Match external functions using hash lookup - O(E)
-        for externalfun in externalfuns:
-            externalfun_ = externalfun
-            try:
-                externalfun_ = externalfun.split(".")[1]  # remove the .FUN_NAME from wrapper format
-            except Exception:
-                pass
+    def _run():
+        result.append(fun())
+        return 1
+
+    ida_kernwin.execute_sync(_run, ida_kernwin.MFF_WRITE if write else ida_kernwin.MFF_READ)
+    return result[0] if result else None
 
-            # O(1) hash lookup instead of O(L × F) nested loops
-            if externalfun_ in func_to_lib:
-                lib, lib_path = func_to_lib[externalfun_]
+def idaDemangleNames(names):
+    # fallback of BULK_DEMANGLER, one main thread round trip for a whole batch
+    return executeSync(lambda: {name: idaDemangle(name) for name in names})
 
-                if not config['demangle']:
-                    values.append([externalfun_, lib, lib_path])
-                    resolved[externalfun] = [externalfuns[externalfun], lib]
-                else:
-                    demangled_name = idc.demangle_name(externalfun_, idc.get_inf_attr(idc.INF_SHORT_DN))
-                    if demangled_name == None:
-                        demangled_name = externalfun_
+def getIdaDemangleEngine():
+    # the IDA output depends on its short name options, each set of options is cached apart
+    return f"ida:{idc.get_inf_attr(idc.INF_SHORT_DN)}"
 
-                    values.append([externalfun_, lib, lib_path, demangled_name])
-                    resolved[externalfun] = [externalfuns[externalfun], lib]
+def Resolve(externalfuns, libs, paths, config, versions=None):
+    return matchFunctions(externalfuns, libs, paths, getDemangler(config), versions)
 
-        return values, resolved
+class INCREMENTAL_RESOLVER(IMPORT_RESOLVER):
+
+    def __init__(self, externalfuns, paths, config, versions=None):
+        super().__init__(externalfuns, paths, getDemangler(config), versions)
+        self.config = config
+
+def _sampleXrefs(xrefs, limit, sample):
+    if limit is None or len(xrefs) <= limit:
+        return xrefs
+    if limit <= 0:
+        return []
+    if not sample:
+        return xrefs[:limit]
+    step = len(xrefs) / limit
+    return [xrefs[int(i * step)] for i in range(limit)]
 
 def CommentFuns(external_resolved, config):
-        
-        fun_cpt=0
-        xref_cpt = 0
+
+        # limit None = every xref, 0 = wrappers only, N = at most N xrefs per wrapper (first N, or spread if sample)
+        limit = config.get('comment_xref_limit')
+        sample = config.get('comment_xref_sample', False)
+
+        t_start = time.time()
+
+        # Step 1: collect every (ea, library) pair once
+        targets = {}  # {ea: [libs]}
+        wrappers = set()
         for fun in external_resolved:
             try:
                 ea = external_resolved[fun][0]
                 lib = external_resolved[fun][1]
-                xrefs= idautils.XrefsTo(ea)
+                # same test as before batching: UNKNOWN_LIBRARY is "Unknow Library", so unresolved wrappers are still commented
                 if "Unknown Library" in lib:
                     continue
 
-                # Set comment at function address, append if already exists
-                existing_cmt = idc.get_cmt(ea, 0)
-                if existing_cmt:
-                    if lib not in existing_cmt:
-                        idc.set_cmt(ea, f"{existing_cmt}, {lib}", 0)
-                else:
-                    idc.set_cmt(ea, lib, 0)
-                fun_cpt += 1
-
-                # Set comment at cross-reference locations, append if already exists
-                for xref in xrefs:
-                    existing_xref_cmt = idc.get_cmt(xref.frm, 0)
-                    if existing_xref_cmt:
-                        if lib not in existing_xref_cmt:
-                            idc.set_cmt(xref.frm, f"{existing_xref_cmt}, {lib}", 0)
-                            xref_cpt += 1
-                    else:
-                        idc.set_cmt(xref.frm, lib, 0)
-                        xref_cpt += 1
+                targets.setdefault(ea, [])
+                if lib not in targets[ea]:
+                    targets[ea].append(lib)
+                wrappers.add(ea)
+
+                if limit is not None and limit <= 0:
+                    continue
+                xrefs = [xref.frm for xref in idautils.XrefsTo(ea)]
+                for frm in _sampleXrefs(xrefs, limit, sample):
+                    targets.setdefault(frm, [])
+                    if lib not in targets[frm]:
+                        targets[frm].append(lib)
             except Exception:
                 if config['verbose']:
                     print(f"[AutoResolv] Couldn't patch {fun}, Skipping")
 
+        t_collect = time.time()
+
+        # Step 2: read existing comments once, only eas whose comment changes are written
+        patches = {}
+        for ea, libs in targets.items():
+            existing_cmt = idc.get_cmt(ea, 0)
+            new_libs = [lib for lib in libs if not existing_cmt or lib not in existing_cmt]
+            if not new_libs:
+                continue
+            if existing_cmt:
+                patches[ea] = existing_cmt + ", " + ", ".join(new_libs)
+            else:
+                patches[ea] = ", ".join(new_libs)
+
+        # Step 3: apply the whole batch with auto-analysis suspended, refresh the views once
+        fun_cpt=0
+        xref_cpt = 0
+        auto_state = ida_auto.enable_auto(False)
+        try:
+            for ea, cmt in patches.items():
+                try:
+                    idc.set_cmt(ea, cmt, 0)
+                    if ea in wrappers:
+                        fun_cpt += 1
+                    else:
+                        xref_cpt += 1
+                except Exception:
+                    if config['verbose']:
+                        print(f"[AutoResolv] Couldn't comment 0x{ea:x}, Skipping")
+        finally:
+            ida_auto.enable_auto(auto_state)
+            ida_kernwin.refresh_idaview_anyway()
+
+        t_apply = time.time()
+        profileCount("comments_written", len(patches))
         if config['verbose']:
             print(f"[AutoResolv] Patched {fun_cpt} functions and {xref_cpt} functions references")
+            print(f"[AutoResolv] Comments: {len(targets)} addresses collected in {t_collect - t_start:.2f}s, {len(patches)} written in {t_apply - t_collect:.2f}s")
             
 
-def getSignature(values, config):
+def getInputBuildId():
+    # read from the IDB so it always matches the analysed file, even if it moved on disk
+    s,e = get_seg(".note.gnu.build-id")
+    if s is not None:
+        namesz = idc.get_wide_dword(s)
+        descsz = idc.get_wide_dword(s + 4)
+        desc = idaapi.get_bytes(s + 12 + ((namesz + 3) & ~3), descsz)
+        if desc:
+            return desc.hex()
+
+    md5 = ida_nalt.retrieve_input_file_md5()
+    if md5:
+        return "md5:" + md5.hex()
+    return None
+
+def getFunFingerprint(ea):
+    # a retyped or re-bounded function must be decompiled again
+    return f"{ida_funcs.get_func(ea).end_ea:x}:{idc.get_type(ea)}"
+
+def getTypedPrototype(ea):
+    # only a type IDA already holds (user, FLIRT, TIL, DWARF), guessed types would need the decompiler anyway
+    tif = ida_typeinf.tinfo_t()
+    if not ida_nalt.get_tinfo(tif, ea) or not tif.is_func():
+        return None
+
+    decl = ida_typeinf.print_type(ea, ida_typeinf.PRTYPE_1LINE)
+    if not decl:
+        return None
+    return decl.rstrip(";") + ";"
+
+def getPrototype(ea, sigcache=None, stats=None):
+    fingerprint = None
+    if sigcache is not None:
+        fingerprint = getFunFingerprint(ea)
+        signature = sigcache.get(ea, fingerprint)
+        if signature is not None:
+            if stats is not None:
+                stats['cached'] += 1
+            return signature
+
+    if SIGNATURE_FROM_TYPEINFO:
+        signature = getTypedPrototype(ea)
+        if signature is not None:
+            if stats is not None:
+                stats['typeinfo'] += 1
+            return signature
+
+    with profilePhase("decompile"):
+        signature = str(idaapi.decompile(ea)).split("\n")[0] + ";"
+    if stats is not None:
+        stats['decompiled'] += 1
+    if sigcache is not None:
+        sigcache.put(ea, fingerprint, signature)
+    return signature
+
+def openSignatureCache(modpath, verbose=False):
+    build_id = getInputBuildId()
+    if build_id is None:
+        print("[AutoResolv] No build-id nor input MD5 for this binary, signature cache disabled")
+        return None
+    try:
+        return SIGNATURE_CACHE(os.path.join(modpath, SIGCACHE_NAME), build_id, verbose)
+    except SignatureCacheError:
+        print("[AutoResolv] Couldn't open signature cache, decompiling every function")
+        return None
+
+def getSignature(values, config, sigcache=None):
 
     s,e = get_seg(".text")
     if s is None or e is None:
@@ -244,6 +270,7 @@ def getSignature(values, config):
     cpt = 0
     matched_libs = set()
     skipped_count = 0
+    stats = {'cached': 0, 'typeinfo': 0, 'decompiled': 0}
 
     for i in range(len(values)):
         try:
@@ -263,9 +290,9 @@ def getSignature(values, config):
                 ea = all_funs[fun_name]
 
                 if config['verbose']:
-                    print(f"[AutoResolv] getSignature: Decompiling function '{fun_name}' at 0x{ea:x}")
+                    print(f"[AutoResolv] getSignature: Extracting function '{fun_name}' at 0x{ea:x}")
 
-                signature = str(idaapi.decompile(ea)).split("\n")[0] + ";"
+                signature = getPrototype(ea, sigcache, stats)
                 allsigs[fun_name] = signature
                 cpt += 1
 
@@ -288,96 +315,105 @@ def getSignature(values, config):
         print(f"[AutoResolv] getSignature: Matched libraries: {matched_libs if matched_libs else 'None'}")
         print(f"[AutoResolv] getSignature: Successfully extracted: {cpt} signatures")
         print(f"[AutoResolv] getSignature: Skipped/Failed: {skipped_count} functions")
+        print(f"[AutoResolv] getSignature: From type info: {stats['typeinfo']}, decompiled: {stats['decompiled']}, from signature cache: {stats['cached']}")
         print(f"[AutoResolv] getSignature: ================================")
 
+    if sigcache is not None:
+        sigcache.flush()
+
+    for key in stats:
+        profileCount("signatures_" + key, stats[key])
     return cpt, allsigs
 
 def refactorExtern(signature, config):
-    s,e = get_seg(".plt")
-    s2, e2 = get_seg(".plt.sec")
-    all_funs1 = None
-    if s is not None and e is not None:
-        all_funs1 = get_extern(s,e)
-        if config['verbose']:
-            print(f"[AutoResolv] refactorExtern: Found {len(all_funs1)} functions in .plt segment")
-    else:
-        if config['verbose']:
-            print(f"[AutoResolv] refactorExtern: .plt segment not found")
+    t_start = time.time()
+    with profilePhase("segment_scan"):
+        s,e = get_seg(".plt")
+        s2, e2 = get_seg(".plt.sec")
+        all_funs1 = None
+        if s is not None and e is not None:
+            all_funs1 = get_extern(s,e)
+            if config['verbose']:
+                print(f"[AutoResolv] refactorExtern: Found {len(all_funs1)} functions in .plt segment")
+        else:
+            if config['verbose']:
+                print(f"[AutoResolv] refactorExtern: .plt segment not found")
 
     
-    all_funs2 = None
-    if s2 is not None and e2 is not None:
-        all_funs2 = get_extern(s2, e2)
-        if config['verbose']:
-            print(f"[AutoResolv] refactorExtern: Found {len(all_funs2)} functions in .plt.sec segment")
-    else:
-        if config['verbose']:
-            print(f"[AutoResolv] refactorExtern: .plt.sec segment not found")
+        all_funs2 = None
+        if s2 is not None and e2 is not None:
+            all_funs2 = get_extern(s2, e2)
+            if config['verbose']:
+                print(f"[AutoResolv] refactorExtern: Found {len(all_funs2)} functions in .plt.sec segment")
+        else:
+            if config['verbose']:
+                print(f"[AutoResolv] refactorExtern: .plt.sec segment not found")
 
-    all_funs = {}
-    if all_funs1 is not None:
-        all_funs.update(all_funs1)
-    if all_funs2 is not None:
-        all_funs.update(all_funs2)
+        all_funs = {}
+        if all_funs1 is not None:
+            all_funs.update(all_funs1)
+        if all_funs2 is not None:
+            all_funs.update(all_funs2)
 
     if len(all_funs) == 0:
         print(f"[AutoResolv] refactorExtern: ERROR: No external functions found in .plt or .plt.sec segments!")
         return 0, 0
 
-    if config['verbose']:
-        print(f"[AutoResolv] refactorExtern: Total {len(all_funs)} external functions to check")
-        print(f"[AutoResolv] refactorExtern: Function names: {list(all_funs.keys())[:10]}..." if len(all_funs) > 10 else f"[AutoResolv] refactorExtern: Function names: {list(all_funs.keys())}")
+    t_scan = time.time()
 
-    cpt = 0
-    xref_cpt = 0
-    for sig in signature:
-        matched = False
-        for fun in all_funs:
-            try:
-                # Wrapper functions have format ".fun_name"
-                if "." not in fun:
-                    continue
+    # Wrapper functions have format ".fun_name", index them once by the name Resolve matches on
+    wrappers = {}
+    for fun in all_funs:
+        if "." not in fun:
+            continue
+        wrappers[getWrapperName(fun)] = all_funs[fun]
 
-                fun_name = fun.split(".")[1]  # Extract function name from wrapper
+    if config['verbose']:
+        print(f"[AutoResolv] refactorExtern: Total {len(all_funs)} external functions, {len(wrappers)} wrappers to check")
 
-                if fun_name == sig:
-                    matched = True
-                    call_type = signature[sig]
-                    ea = all_funs["." + fun_name]
+    t_index = time.time()
 
-                    if config['verbose']:
-                        print(f"[AutoResolv] refactorExtern: Applying signature to '{fun_name}' at 0x{ea:x}")
-                        print(f"[AutoResolv] refactorExtern: Signature: {call_type}")
+    cpt = 0
+    xref_cpt = 0
+    unmatched = []
+    failed = []
+    with profilePhase("settype"):
+        for sig in signature:
+            ea = wrappers.get(sig)
+            if ea is None:
+                unmatched.append(sig)
+                continue
 
-                    # Set type for the wrapper function
-                    idc.SetType(ea, call_type)
+            try:
+                call_type = signature[sig]
 
-                    # Set type for all cross-references
-                    xrefs = idautils.XrefsTo(ea)
-                    for xref in xrefs:
-                        idc.SetType(xref.frm, call_type)
-                        xref_cpt += 1
+                # Set type for the wrapper function
+                idc.SetType(ea, call_type)
 
-                    cpt += 1
-                    if config['verbose']:
-                        print(f"[AutoResolv] refactorExtern: ✓ Successfully refactored '{fun_name}' and {xref_cpt} xrefs")
-                    break  # Found match, move to next signature
+                # Set type for all cross-references
+                for xref in idautils.XrefsTo(ea):
+                    idc.SetType(xref.frm, call_type)
+                    xref_cpt += 1
 
-            except IndexError:
-                # Function name doesn't have "." separator
-                if config['verbose']:
-                    print(f"[AutoResolv] refactorExtern: Skipping '{fun}' - invalid wrapper format")
+                cpt += 1
             except Exception as e:
+                failed.append(sig)
                 if config['verbose']:
-                    print(f"[AutoResolv] refactorExtern: ERROR: Couldn't refactor '{fun}': {str(e)}")
+                    print(f"[AutoResolv] refactorExtern: ERROR: Couldn't refactor '{sig}': {str(e)}")
 
-        if not matched and config['verbose']:
-            print(f"[AutoResolv] refactorExtern: WARNING: No matching wrapper found for signature '{sig}'")
+    t_apply = time.time()
+    profileCount("settype_functions", cpt)
+    profileCount("settype_xrefs", xref_cpt)
 
     if config['verbose']:
         print(f"[AutoResolv] refactorExtern: ========== Summary ==========")
         print(f"[AutoResolv] refactorExtern: Successfully refactored: {cpt} functions")
         print(f"[AutoResolv] refactorExtern: Successfully refactored: {xref_cpt} cross-references")
+        if unmatched:
+            print(f"[AutoResolv] refactorExtern: No matching wrapper for {len(unmatched)} signatures: {unmatched[:10]}{'...' if len(unmatched) > 10 else ''}")
+        if failed:
+            print(f"[AutoResolv] refactorExtern: Failed: {len(failed)} signatures")
+        print(f"[AutoResolv] refactorExtern: Timing: segment scan {t_scan - t_start:.2f}s, index {t_index - t_scan:.2f}s, SetType {t_apply - t_index:.2f}s")
         print(f"[AutoResolv] refactorExtern: ================================")
 
     return cpt, xref_cpt
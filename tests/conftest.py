@@ -0,0 +1,76 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The tests only cover the modules that never import IDA. Run them with python3 -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.elfgen import STB_GLOBAL, STB_WEAK, STT_FUNC, TARGETS, writeElf
+from libautoresolv.dbcache import DB_CACHE_MANAGER
+
+
+def writeFile(path, data):
+    with open(path, "wb") as fd:
+        fd.write(data)
+    return path
+
+
+def touch(path):
+    # same size, later mtime: only the build-id or the content tell whether it changed
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+
+def getHostLibs():
+    """System libraries mapped in this interpreter, real ELF files to check the parsers against"""
+    libs = set()
+    try:
+        with open("/proc/self/maps") as fd:
+            for line in fd:
+                path = line.split()[-1]
+                name = os.path.basename(path)
+                if name.startswith("lib") and ".so" in name and os.path.isfile(path):
+                    libs.add(path)
+    except OSError:
+        pass
+    return sorted(libs)
+
+
+def writeLib(path, names, target="x86_64", **kwargs):
+    """Synthetic shared library exporting `names`, every third one weak"""
+    exports = [(name, STB_WEAK if i % 3 == 0 else STB_GLOBAL, STT_FUNC) for i, name in enumerate(names)]
+    return writeElf(path, TARGETS[target], exports, soname=os.path.basename(path), **kwargs)
+
+
+def makeCache(path, rows, demangle=True, libs=None):
+    """New DB cache at `path` holding `rows` ([fun_name, library, path(, demangled)])"""
+    cache = DB_CACHE_MANAGER(path, module_path=os.path.dirname(path), bin_path="/bin/true")
+    cache.check_cache_con()
+    if libs is None:
+        libs = {row[1]: row[2] for row in rows}
+    cache.create_cache(libs, "/bin/true")
+    cache.CONFIG['demangle'] = demangle
+    cache.CONFIG['verbose'] = False
+    cache.save_data(rows, cache.CONFIG)
+    return cache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / ".cache_test.db")
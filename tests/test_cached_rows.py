@@ -0,0 +1,119 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+
+import pytest
+
+from conftest import makeCache
+from libautoresolv.dbcache import CACHED_ROWS, CACHED_ROWS_ORDER
+
+LIBS = ["libc.so.6", "libz.so.1", "libcrypto.so.3", "libé.so"]
+
+
+def makeRows(count=1000, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    keys = set()
+    while len(rows) < count:
+        name = rng.choice(["mem", "str", "_ZN3foo", "inflate", "EVP_", "é"]) + "".join(rng.choice("abcXYZ019_") for _ in range(rng.randint(0, 6)))
+        lib = rng.choice(LIBS)
+        if (name, lib) in keys:
+            continue
+        keys.add((name, lib))
+        rows.append([name, lib, "/lib/" + lib, rng.choice([name, "foo::" + name, "bar::" + name])])
+    return rows
+
+
+def expectedOrder(rows, column, descending):
+    # rowid is the insertion order of save_data
+    position = {id(row): i for i, row in enumerate(rows)}
+    keys = CACHED_ROWS_ORDER[column]
+
+    def key(row):
+        return tuple(position[id(row)] if name == "rowid" else row[["fun_name", "library", "library_path", "demangle_name"].index(name)] for name in keys)
+    return sorted(rows, key=key, reverse=descending)
+
+
+@pytest.fixture
+def rows(cache_path):
+    rows = makeRows()
+    makeCache(cache_path, rows).close()
+    return rows
+
+
+@pytest.mark.parametrize("column", range(len(CACHED_ROWS_ORDER)))
+@pytest.mark.parametrize("descending", [False, True])
+def test_order_matches_python_sort(cache_path, rows, column, descending):
+    view = CACHED_ROWS(cache_path, demangle=True, block_size=7, max_blocks=3)
+    try:
+        view.set_order(column, descending)
+        expected = expectedOrder(rows, column, descending)
+        assert len(view) == len(rows)
+        assert list(view) == expected
+
+        # random access jumps over blocks that were never read, or already evicted
+        rng = random.Random(column)
+        for n in rng.sample(range(len(rows)), 50) + [0, len(rows) - 1]:
+            assert view[n] == expected[n]
+        assert view[-1] == expected[-1]
+        with pytest.raises(IndexError):
+            view[len(rows)]
+        assert len(view.blocks) <= 3
+    finally:
+        view.close()
+
+
+@pytest.mark.parametrize("column", range(len(CACHED_ROWS_ORDER)))
+def test_filters_keep_the_order(cache_path, rows, column):
+    view = CACHED_ROWS(cache_path, demangle=True, block_size=5)
+    try:
+        view.set_order(column, True)
+        for library, text, mode in [("libz.so.1", None, "substring"), (None, "mem", "prefix"), ("libé.so", "é", "prefix"),
+                                    (None, "XY", "substring"), ("libc.so.6", "^(str|mem)[a-c]", "regex"), ("libnone.so", None, "substring")]:
+            view.set_filter(library, text, mode)
+            expected = [row for row in expectedOrder(rows, column, True) if library in (None, row[1])]
+            if mode == "prefix":
+                expected = [row for row in expected if row[0].startswith(text)]
+            elif mode == "substring" and text:
+                expected = [row for row in expected if text.lower() in row[0].lower()]
+            elif mode == "regex":
+                expected = [row for row in expected if row[0][:3] in ("str", "mem") and row[0][3:4] in ("a", "b", "c")]
+            assert list(view) == expected, (library, text, mode)
+
+        view.set_filter()
+        assert len(view) == len(rows)
+    finally:
+        view.close()
+
+
+def test_rows_without_demangled_names(cache_path, rows):
+    view = CACHED_ROWS(cache_path, demangle=False, block_size=64)
+    try:
+        assert list(view) == [row[:3] for row in expectedOrder(rows, 0, False)]
+    finally:
+        view.close()
+
+
+def test_reload_sees_new_rows(cache_path):
+    cache = makeCache(cache_path, [["open", "liba.so", "/lib/liba.so", "open"]])
+    view = CACHED_ROWS(cache_path, demangle=True)
+    try:
+        assert len(view) == 1
+        cache.save_data([["close", "liba.so", "/lib/liba.so", "close"]], cache.CONFIG)
+        view.reload()
+        assert [row[0] for row in view] == ["close", "open"]
+    finally:
+        view.close()
+        cache.close()
@@ -0,0 +1,91 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from libautoresolv.core import IMPORT_RESOLVER, UNKNOWN_LIBRARY, getIncrementalWork, matchFunctions
+from libautoresolv.elfutil import STB_GLOBAL
+
+PATHS = {"liba.so": "/lib/liba.so", "libb.so": "/lib/libb.so", "libc.so.6": "/lib/libc.so.6"}
+ROWS = [["open", "liba.so", "/lib/liba.so"], ["read", "libb.so", "/lib/libb.so"], ["memcpy", "libc.so.6", "/lib/libc.so.6"]]
+EXTERNALS = {".open": 0x10, ".read": 0x20, ".memcpy": 0x30}
+
+
+def export(name, version=None, hidden=False):
+    return (name, version, hidden, STB_GLOBAL, 0)
+
+
+def test_first_library_in_loader_order_wins():
+    imports = {".memcpy": 0x10, ".open": 0x20, ".missing": 0x30}
+    libs = {"libc.so.6": [export("memcpy"), export("open")], "liba.so": [export("open")]}
+    values, resolved = matchFunctions(imports, libs, PATHS)
+    assert sorted(values) == [["memcpy", "libc.so.6", "/lib/libc.so.6"], ["open", "liba.so", "/lib/liba.so"]]
+    assert resolved[".open"] == [0x20, "liba.so"]
+    assert resolved[".missing"] == [0x30, UNKNOWN_LIBRARY]
+
+
+def test_feed_reports_positions_of_moved_rows():
+    # libraries parsed out of order: a row given by libc moves when liba, earlier in PATHS, shows up
+    resolver = IMPORT_RESOLVER({".memcpy": 1, ".open": 2, ".read": 3}, PATHS)
+    new_rows, moved = resolver.feed("libc.so.6", [export("memcpy"), export("open"), export("read")])
+    assert [row[0] for row in new_rows] == ["memcpy", "open", "read"]
+    assert moved == []
+
+    new_rows, moved = resolver.feed("liba.so", [export("read")])
+    assert new_rows == []
+    assert moved == [2]
+    assert resolver.values[2] == ["read", "liba.so", "/lib/liba.so"]
+
+    # a later library in PATHS never takes a row back
+    assert resolver.feed("libb.so", [export("read"), export("open")]) == ([], [1])
+    assert resolver.values[1][1] == "libb.so"
+
+
+def test_versioned_import_skips_other_versions():
+    versions = {"memcpy": "GLIBC_2.14"}
+    libs = {"liba.so": [export("memcpy", "GLIBC_2.2.5", True)], "libc.so.6": [export("memcpy", "GLIBC_2.14")]}
+    values, _ = matchFunctions({".memcpy": 0}, libs, PATHS, versions=versions)
+    assert values == [["memcpy", "libc.so.6", "/lib/libc.so.6"]]
+
+
+def test_nothing_to_resolve_over_an_unchanged_cache():
+    todo, kept = getIncrementalWork(EXTERNALS, ROWS, PATHS)
+    assert todo == {}
+    assert kept == ROWS
+
+
+def test_new_wrappers_are_resolved_and_gone_ones_dropped():
+    externals = {".open": 0x10, ".memcpy": 0x30, ".write": 0x40}
+    todo, kept = getIncrementalWork(externals, ROWS, PATHS)
+    assert todo == {".write": 0x40}
+    assert kept == [ROWS[0], ROWS[2]]
+
+
+def test_changed_library_invalidates_rows_it_could_take():
+    # libb.so comes before libc.so.6: memcpy may now come from it, open from liba.so stays
+    todo, kept = getIncrementalWork(EXTERNALS, ROWS, PATHS, stale_libs=["libb.so"])
+    assert todo == {".read": 0x20, ".memcpy": 0x30}
+    assert kept == [ROWS[0]]
+
+    todo, kept = getIncrementalWork(EXTERNALS, ROWS, PATHS, stale_libs=["libunknown.so"])
+    assert todo == {}
+
+
+def test_unresolved_wrappers_are_retried_only_when_a_library_changed():
+    externals = dict(EXTERNALS, **{".missing": 0x50})
+    known = {"open", "read", "memcpy", "missing"}
+    assert getIncrementalWork(externals, ROWS, PATHS, known=known) == ({}, ROWS)
+    todo, kept = getIncrementalWork(externals, ROWS, PATHS, stale_libs=["libc.so.6"], known=known)
+    assert todo == {".memcpy": 0x30, ".missing": 0x50}
+    assert kept == ROWS[:2]
+    # without the wrappers of the last resolve, every unresolved name is retried
+    assert getIncrementalWork(externals, ROWS, PATHS)[0] == {".missing": 0x50}
@@ -0,0 +1,120 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+
+import pytest
+
+from conftest import getHostLibs, makeCache, touch, writeFile
+from libautoresolv.dbcache import BINARY_FINGERPRINT
+
+ROWS = [("inflate", "libz.so"), ("open", "liba.so"), ("read", "liba.so")]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    paths = {
+        "liba.so": writeFile(str(tmp_path / "liba.so"), b"liba content"),
+        "libz.so": writeFile(str(tmp_path / "libz.so"), b"libz content"),
+    }
+    return writeFile(str(tmp_path / "app"), b"binary content"), paths
+
+
+@pytest.fixture
+def cache(cache_path, tree):
+    bin_path, paths = tree
+    rows = [[fun, lib, paths[lib], fun] for fun, lib in ROWS]
+    cache = makeCache(cache_path, rows, libs=paths)
+    cache.parse_data_cache()
+    cache.save_fingerprints(cache.libsinfo, bin_path)
+    yield cache
+    cache.close()
+
+
+def test_unchanged_libraries(cache, tree):
+    bin_path, paths = tree
+    assert cache.check_fingerprints(bin_path) == []
+    # same content with another mtime is matched by its content hash
+    touch(paths["libz.so"])
+    assert cache.check_fingerprints(bin_path) == []
+
+
+def test_changed_library(cache, tree):
+    bin_path, paths = tree
+    writeFile(paths["libz.so"], b"libz other content")
+    assert cache.check_fingerprints(bin_path) == ["libz.so"]
+    assert cache.stale_libs == ["libz.so"]
+
+
+def test_moved_library(cache, tree, tmp_path):
+    bin_path, paths = tree
+    cache.libsinfo["liba.so"] = writeFile(str(tmp_path / "liba.so.1"), b"liba content")
+    assert cache.check_fingerprints(bin_path) == ["liba.so"]
+
+
+def test_library_without_fingerprint(cache, tree, tmp_path):
+    bin_path, _ = tree
+    cache.libsinfo["libm.so"] = "Path not found"
+    assert cache.check_fingerprints(bin_path) == []
+    cache.libsinfo["libm.so"] = writeFile(str(tmp_path / "libm.so"), b"libm content")
+    assert cache.check_fingerprints(bin_path) == ["libm.so"]
+
+
+def test_changed_binary_marks_every_library(cache, tree):
+    bin_path, _ = tree
+    writeFile(bin_path, b"binary other content")
+    assert sorted(cache.check_fingerprints(bin_path)) == ["liba.so", "libz.so"]
+
+
+@pytest.mark.skipif(not getHostLibs(), reason="no shared library mapped in this interpreter")
+def test_build_id_is_checked_before_the_content(cache, tmp_path):
+    lib = str(tmp_path / "libhost.so")
+    shutil.copyfile(getHostLibs()[0], lib)
+    row = (lib,) + cache._fingerprint(lib)
+    assert not row[3].startswith("sha1:")
+    touch(lib)
+    assert cache._is_fresh(lib, row)
+    assert not cache._is_fresh(lib, (lib,) + row[1:3] + ("0" * 40,))
+    assert not cache._is_fresh(str(tmp_path / "missing.so"), row)
+
+
+def test_cache_without_fingerprints_is_trusted(cache, tree):
+    bin_path, paths = tree
+    cache.cur.execute("DELETE FROM fingerprint")
+    cache.con.commit()
+    writeFile(paths["libz.so"], b"libz other content")
+    assert cache.check_fingerprints(bin_path) == []
+    names = set(line[0] for line in cache.cur.execute("SELECT name FROM fingerprint"))
+    assert names == {"liba.so", "libz.so", BINARY_FINGERPRINT}
+
+
+def test_replace_data_writes_the_difference(cache, tree):
+    bin_path, paths = tree
+    cache.save_signature({"open": "int open(char *)", "read": "int read(int)", "inflate": "int inflate(void *)"})
+    writeFile(paths["libz.so"], b"libz other content")
+    cache.check_fingerprints(bin_path)
+
+    # read moved to libz.so, open left, inflate kept from a changed library
+    cache.replace_data([["inflate", "libz.so", paths["libz.so"], "inflate"], ["read", "libz.so", "/lib/libz.so", "read"]], cache.CONFIG)
+    cache.parse_data_cache()
+    assert sorted(cache.cached_data) == [["inflate", "libz.so", paths["libz.so"], "inflate"], ["read", "libz.so", "/lib/libz.so", "read"]]
+    assert cache.parse_signature() is None
+
+
+def test_new_library_path_is_resolved_again(cache, tree):
+    bin_path, _ = tree
+    assert cache.check_fingerprints(bin_path) == []
+    cache.setNewLibPath("libz.so", "/opt/lib/libz.so", cache.CONFIG)
+    assert cache.stale_libs == ["libz.so"]
@@ -0,0 +1,179 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sqlite3
+
+import pytest
+
+from conftest import makeCache
+from libautoresolv.dbcache import CACHED_ROWS, DB_CACHE_MANAGER, SCHEMA, SCHEMA_VERSION, isSearchIndexSupported
+from libautoresolv.error import CacheMigrationError
+
+# create_cache of the schema-less v1 caches
+SCHEMA_V1 = [
+    "CREATE TABLE configuration(id, libc, demangle, comment, verbose)",
+    "CREATE TABLE libinfo(libname, libpath)",
+    "CREATE TABLE autoresolv_data(fun_name, library, library_path, demangle_name)",
+    "CREATE TABLE signature(fun_name, csig)",
+    "CREATE TABLE rpath(id, rp)",
+    "CREATE TABLE bininfo(id, binname)",
+]
+
+CONFIGURATION_V2 = "CREATE TABLE configuration(id INTEGER PRIMARY KEY, libc INTEGER NOT NULL, demangle INTEGER NOT NULL, comment INTEGER NOT NULL, verbose INTEGER NOT NULL)"
+
+
+def openCache(path):
+    cache = DB_CACHE_MANAGER(path, module_path=os.path.dirname(path), bin_path="/bin/true")
+    assert cache.check_cache_con()
+    return cache
+
+
+def getSchemaObjects(path):
+    con = sqlite3.connect(path)
+    names = set(line[0] for line in con.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%'"))
+    con.close()
+    return names
+
+
+def test_migrate_v1(cache_path):
+    con = sqlite3.connect(cache_path)
+    for statement in SCHEMA_V1:
+        con.execute(statement)
+    con.execute("INSERT INTO configuration VALUES (0, 1, 0, 1, 0)")
+    con.execute("INSERT INTO bininfo VALUES (0, '/bin/app')")
+    con.execute("INSERT INTO rpath VALUES (0, '/opt/lib:/opt/lib2')")
+    con.executemany("INSERT INTO libinfo VALUES (?, ?)", [("libz.so", "/lib/libz.so"), ("liba.so", "/lib/liba.so"), ("libz.so", "/usr/lib/libz.so")])
+    con.executemany("INSERT INTO autoresolv_data VALUES (?, ?, ?, ?)", [
+        ("inflate", "libz.so", "/lib/libz.so", "None"),
+        ("open", "liba.so", "/lib/liba.so", "None"),
+        ("inflate", "libz.so", "/usr/lib/libz.so", "None"),
+        (None, "liba.so", "/lib/liba.so", "None"),
+    ])
+    con.executemany("INSERT INTO signature VALUES (?, ?)", [("open", "int open(char *)"), ("open", "int open(const char *, int)")])
+    con.commit()
+    con.close()
+
+    cache = openCache(cache_path)
+    try:
+        assert cache.get_schema_version() == SCHEMA_VERSION
+        cache.parse_conf_cache()
+        assert cache.CONFIG == {'libc': True, 'demangle': False, 'comment': True, 'verbose': False,
+                                'comment_xref_limit': None, 'comment_xref_sample': False, 'sysroot': None,
+                                'profile': False, 'cprofile': False, 'cxxfilt': False}
+        cache.parse_bininfo_cache()
+        assert cache.bin_path == "/bin/app"
+        cache.parse_rpath_cache()
+        assert cache.rpath == ["/opt/lib", "/opt/lib2"]
+        # duplicated v1 keys keep their last row, rows without a key are dropped
+        cache.parse_libinfo_cache()
+        assert cache.libsinfo == {"libz.so": "/usr/lib/libz.so", "liba.so": "/lib/liba.so"}
+        cache.parse_data_cache()
+        assert sorted(cache.cached_data) == [["inflate", "libz.so", "/usr/lib/libz.so"], ["open", "liba.so", "/lib/liba.so"]]
+        assert cache.parse_signature() == {"open": "int open(const char *, int)"}
+        assert cache.parse_wrappers() is None
+        assert cache.check_fingerprints("/bin/true") == []
+    finally:
+        cache.close()
+
+    expected = set(statement.split()[2].split("(")[0] for statement in SCHEMA)
+    if isSearchIndexSupported():
+        expected |= {"autoresolv_search", "autoresolv_search_state"}
+    assert expected <= getSchemaObjects(cache_path)
+    assert not any(name.endswith("_v1") for name in getSchemaObjects(cache_path))
+
+    view = CACHED_ROWS(cache_path)
+    try:
+        view.set_filter(None, "infl", "substring")
+        assert list(view) == [["inflate", "libz.so", "/usr/lib/libz.so"]]
+    finally:
+        view.close()
+
+
+def test_migrate_v2(cache_path):
+    # v2 is SCHEMA up to the library index with the v2 configuration columns
+    con = sqlite3.connect(cache_path)
+    for statement in SCHEMA[:SCHEMA.index("CREATE INDEX autoresolv_data_library ON autoresolv_data(library)") + 1]:
+        if statement.startswith("CREATE TABLE configuration"):
+            statement = CONFIGURATION_V2
+        con.execute(statement)
+    con.execute("INSERT INTO schema_version VALUES (2)")
+    con.execute("INSERT INTO configuration VALUES (0, 0, 1, 1, 1)")
+    con.execute("INSERT INTO autoresolv_data VALUES ('open', 'liba.so', '/lib/liba.so', 'open')")
+    con.commit()
+    con.close()
+
+    cache = openCache(cache_path)
+    try:
+        assert cache.get_schema_version() == SCHEMA_VERSION
+        cache.parse_conf_cache()
+        assert cache.CONFIG['comment_xref_limit'] is None and not cache.CONFIG['comment_xref_sample']
+        cache.CONFIG['comment_xref_limit'] = 3
+        cache.CONFIG['sysroot'] = "/opt/firmware"
+        cache.save_conf(cache.CONFIG)
+        cache.parse_conf_cache()
+        assert cache.CONFIG['comment_xref_limit'] == 3 and cache.CONFIG['sysroot'] == "/opt/firmware"
+        cache.parse_data_cache()
+        assert cache.cached_data == [["open", "liba.so", "/lib/liba.so", "open"]]
+        cache.save_wrappers({".open"})
+        assert cache.parse_wrappers() == {".open"}
+    finally:
+        cache.close()
+    assert {"fingerprint", "wrapper", "autoresolv_data_path", "autoresolv_data_demangle"} <= getSchemaObjects(cache_path)
+
+
+def test_save_data_updates_rows_in_place(cache_path):
+    cache = makeCache(cache_path, [["open", "liba.so", "/lib/liba.so", "open"], ["read", "liba.so", "/lib/liba.so", "read"]])
+    try:
+        cache.save_data([["open", "liba.so", "/usr/lib/liba.so", "open"]], cache.CONFIG)
+        cache.parse_data_cache()
+        assert sorted(cache.cached_data) == [["open", "liba.so", "/usr/lib/liba.so", "open"], ["read", "liba.so", "/lib/liba.so", "read"]]
+    finally:
+        cache.close()
+
+
+def test_current_version_is_not_migrated(cache_path, capsys):
+    makeCache(cache_path, [["open", "liba.so", "/lib/liba.so", "open"]]).close()
+    capsys.readouterr()
+    openCache(cache_path).close()
+    assert "Migrating" not in capsys.readouterr().out
+
+
+def test_newer_version_is_refused(cache_path):
+    makeCache(cache_path, [["open", "liba.so", "/lib/liba.so", "open"]]).close()
+    con = sqlite3.connect(cache_path)
+    con.execute("UPDATE schema_version SET version=?", (SCHEMA_VERSION + 1,))
+    con.commit()
+    con.close()
+
+    cache = DB_CACHE_MANAGER(cache_path, module_path=os.path.dirname(cache_path), bin_path="/bin/true")
+    try:
+        with pytest.raises(CacheMigrationError):
+            cache.check_cache_con()
+        assert cache.get_schema_version() == SCHEMA_VERSION + 1
+    finally:
+        cache.close()
+
+
+def test_cached_rows_are_counted_like_saved(cache_path):
+    rows = [["open", "liba.so", "/lib/liba.so", "open"], ["read", "liba.so", "/lib/liba.so", "read"], ["open", "liba.so", "/usr/lib/liba.so", "open"]]
+    cache = makeCache(cache_path, rows)
+    try:
+        cache.cached_data = rows
+        assert cache.cached_data == [["open", "liba.so", "/usr/lib/liba.so", "open"], ["read", "liba.so", "/lib/liba.so", "read"]]
+        cache.parse_data_cache()
+        assert cache.cached_count == 2
+        assert sorted(cache.cached_data) == [["open", "liba.so", "/usr/lib/liba.so", "open"], ["read", "liba.so", "/lib/liba.so", "read"]]
+    finally:
+        cache.close()
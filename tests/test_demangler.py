@@ -0,0 +1,140 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import shutil
+
+import pytest
+
+from libautoresolv import demangler
+from libautoresolv.demangler import BULK_DEMANGLER, DEMANGLE_CACHE_NAME
+
+NAMES = ["_ZN3foo3barEv", "memcpy", "_ZN3foo3barEv", "_Z3addii", "_Znotmangled", "open"]
+CXXFILT = {"_ZN3foo3barEv": "foo::bar()", "_Z3addii": "add(int, int)", "_Znotmangled": None}
+
+
+class FAKE_FALLBACK():
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, names):
+        self.calls.append(list(names))
+        return {name: "fallback:" + name for name in names}
+
+
+@pytest.fixture
+def no_cxxfilt(monkeypatch):
+    monkeypatch.setattr(demangler, "DEMANGLE_CXXFILT", None)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / DEMANGLE_CACHE_NAME)
+
+
+def test_fallback_gets_each_mangled_name_once(no_cxxfilt, cache_path):
+    fallback = FAKE_FALLBACK()
+    bulk = BULK_DEMANGLER(cache_path, fallback, "ida")
+    try:
+        result = bulk.demangle(NAMES)
+        assert fallback.calls == [["_Z3addii", "_ZN3foo3barEv", "_Znotmangled"]]
+        assert result["memcpy"] is None
+        assert result["_Z3addii"] == "fallback:_Z3addii"
+
+        bulk.demangle(NAMES)
+        assert len(fallback.calls) == 1
+        assert (bulk.hits, bulk.misses) == (0, 3)
+    finally:
+        bulk.close()
+
+
+def test_cache_is_shared_per_engine(no_cxxfilt, cache_path):
+    bulk = BULK_DEMANGLER(cache_path, FAKE_FALLBACK(), "ida")
+    bulk.demangle(NAMES)
+    bulk.close()
+
+    fallback = FAKE_FALLBACK()
+    bulk = BULK_DEMANGLER(cache_path, fallback, "ida")
+    try:
+        assert bulk.demangle(["_Z3addii"]) == {"_Z3addii": "fallback:_Z3addii"}
+        assert fallback.calls == []
+        assert bulk.hits == 1
+    finally:
+        bulk.close()
+
+    # another demangler never reads what this one produced
+    fallback = FAKE_FALLBACK()
+    bulk = BULK_DEMANGLER(cache_path, fallback, "other")
+    try:
+        bulk.demangle(["_Z3addii"])
+        assert fallback.calls == [["_Z3addii"]]
+    finally:
+        bulk.close()
+
+
+@pytest.mark.skipif(shutil.which("c++filt") is None, reason="no c++filt in the PATH")
+def test_cxxfilt_is_opt_in(cache_path):
+    fallback = FAKE_FALLBACK()
+    bulk = BULK_DEMANGLER(cache_path, fallback, "ida")
+    try:
+        assert (bulk.cxxfilt, bulk.engine) == (None, "ida")
+        assert bulk.demangle(["_Z3addii"]) == {"_Z3addii": "fallback:_Z3addii"}
+    finally:
+        bulk.close()
+
+
+def test_rows_get_a_demangled_column(no_cxxfilt):
+    bulk = BULK_DEMANGLER()
+    try:
+        rows = [["_Z3addii", "liba.so", "/lib/liba.so"], ["open", "libc.so.6", "/lib/libc.so.6"]]
+        bulk.demangleRows(rows)
+        # without c++filt nor fallback every name is left as is
+        assert [row[3] for row in rows] == ["_Z3addii", "open"]
+    finally:
+        bulk.close()
+
+
+@pytest.mark.skipif(shutil.which("c++filt") is None, reason="no c++filt in the PATH")
+def test_cxxfilt_chunks(monkeypatch, cache_path):
+    bulk = BULK_DEMANGLER(cache_path, FAKE_FALLBACK(), "ida", cxxfilt=True)
+    try:
+        assert bulk.engine == "c++filt"
+        assert bulk.demangle(NAMES) == {name: CXXFILT.get(name) for name in NAMES}
+    finally:
+        bulk.close()
+
+    names = [f"_Z{len(f'fun{i}')}fun{i}v" for i in range(20)]
+    monkeypatch.setattr(demangler, "DEMANGLE_CHUNK", 3)
+    bulk = BULK_DEMANGLER(max_workers=4, cxxfilt=True)
+    try:
+        assert bulk.demangle(names) == {name: f"fun{i}()" for i, name in enumerate(names)}
+        assert bulk.executor is not None
+    finally:
+        bulk.close()
+
+
+@pytest.mark.skipif(shutil.which("false") is None, reason="no false in the PATH")
+def test_failing_cxxfilt_switches_to_fallback(monkeypatch, cache_path):
+    monkeypatch.setattr(demangler, "DEMANGLE_CXXFILT", "false")
+    fallback = FAKE_FALLBACK()
+    bulk = BULK_DEMANGLER(cache_path, fallback, "ida", cxxfilt=True)
+    try:
+        assert bulk.demangle(["_Z3addii"]) == {"_Z3addii": "fallback:_Z3addii"}
+        assert (bulk.cxxfilt, bulk.engine) == (None, "ida")
+        bulk.demangle(["_Z3subii"])
+        assert fallback.calls == [["_Z3addii"], ["_Z3subii"]]
+        assert bulk.cache.get("ida", ["_Z3addii"]) == {"_Z3addii": "fallback:_Z3addii"}
+        assert bulk.cache.get("c++filt", ["_Z3addii"]) == {}
+    finally:
+        bulk.close()
@@ -0,0 +1,162 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import shutil
+import struct
+import subprocess
+
+import pytest
+from elftools.elf.elffile import ELFFile
+
+from benchmarks.elfgen import TARGETS, writeElf
+from conftest import getHostLibs, writeLib
+from libautoresolv import elfutil
+from libautoresolv.elfutil import (STB_GLOBAL, STB_WEAK, STV_DEFAULT, STV_PROTECTED, RAW_ELF, _getAllFunsFromLibElftools,
+                                   clearFunsCache, getAllFunsFromLib, getImportsFromBin, getImportVersionsFromBin)
+from libautoresolv.error import ELFParseError
+
+
+def stripSectionHeaders(path):
+    # e_shoff, e_shnum and e_shstrndx to 0, like sstrip does
+    with open(path, "r+b") as fd:
+        ident = fd.read(6)
+        endian = "<" if ident[5] == 1 else ">"
+        if ident[4] == 1:
+            fd.seek(0x20)
+            fd.write(struct.pack(endian + "I", 0))
+            fd.seek(0x30)
+        else:
+            fd.seek(0x28)
+            fd.write(struct.pack(endian + "Q", 0))
+            fd.seek(0x3c)
+        fd.write(struct.pack(endian + "HH", 0, 0))
+
+
+def readelfSymbols(path):
+    """(name, version, hidden, type, binding, visibility, defined) of the dynamic symbols readelf shows"""
+    out = subprocess.run(["readelf", "--dyn-syms", "-W", path], capture_output=True, text=True, check=True).stdout
+    symbols = []
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) < 8 or not fields[0][:-1].isdigit():
+            continue
+        _, _, _, type_, bind, vis, ndx, name = fields[:8]
+        hidden = "@@" not in name and "@" in name
+        name, _, version = name.replace("@@", "@").partition("@")
+        symbols.append((name, version or None, hidden, type_, bind, vis, ndx != "UND"))
+    return symbols
+
+
+@pytest.mark.parametrize("path", getHostLibs())
+def test_functions_match_pyelftools(path):
+    with open(path, "rb") as fd:
+        expected = _getAllFunsFromLibElftools(fd)
+    with RAW_ELF(path) as elf:
+        assert sorted(fun[0] for fun in elf.get_exports()) == sorted(fun[0] for fun in expected)
+
+
+@pytest.mark.parametrize("path", getHostLibs())
+def test_build_id_matches_pyelftools(path):
+    expected = None
+    with open(path, "rb") as fd:
+        for sec in ELFFile(fd).iter_sections():
+            if sec.header['sh_type'] == "SHT_NOTE":
+                for note in sec.iter_notes():
+                    if note['n_type'] == "NT_GNU_BUILD_ID":
+                        expected = note['n_desc']
+    with RAW_ELF(path) as elf:
+        assert elf.build_id() == expected
+
+
+@pytest.mark.parametrize("path", getHostLibs())
+def test_stripped_section_headers(tmp_path, path):
+    stripped = str(tmp_path / "stripped.so")
+    shutil.copyfile(path, stripped)
+    stripSectionHeaders(stripped)
+    with RAW_ELF(path) as elf:
+        expected = (sorted(elf.get_exports()), elf.get_needed(), elf.build_id())
+    with RAW_ELF(stripped) as elf:
+        assert elf.sections == []
+        assert (sorted(elf.get_exports()), elf.get_needed(), elf.build_id()) == expected
+
+
+@pytest.mark.skipif(shutil.which("readelf") is None, reason="no readelf in the PATH")
+@pytest.mark.parametrize("path", getHostLibs())
+def test_versions_match_readelf(path):
+    binds = {"GLOBAL": STB_GLOBAL, "WEAK": STB_WEAK, "UNIQUE": 10}
+    visibilities = {"DEFAULT": STV_DEFAULT, "PROTECTED": STV_PROTECTED}
+    symbols = readelfSymbols(path)
+    exports = [(name, version, hidden, binds[bind], visibilities[vis]) for name, version, hidden, type_, bind, vis, defined in symbols
+               if defined and type_ in ("FUNC", "IFUNC") and vis in visibilities]
+    imports = {name: version for name, version, _, type_, _, _, defined in symbols if not defined and type_ == "FUNC" and name}
+    with RAW_ELF(path) as elf:
+        assert sorted(elf.get_exports(), key=repr) == sorted(exports, key=repr)
+    assert getImportVersionsFromBin(path) == imports
+
+
+def test_not_an_elf(tmp_path):
+    empty = tmp_path / "empty.so"
+    empty.write_bytes(b"")
+    text = tmp_path / "text.so"
+    text.write_bytes(b"INPUT(-lfoo)\n")
+    for path in (empty, text):
+        with pytest.raises(ELFParseError):
+            RAW_ELF(str(path))
+        assert getAllFunsFromLib(str(path), False) is None
+
+
+def test_skipped_libraries(tmp_path):
+    assert getAllFunsFromLib("Path not found", True) is None
+    assert getAllFunsFromLib(str(tmp_path / "missing.so"), False) is None
+    assert getAllFunsFromLib("/lib/libc.so.6", False) is None
+
+
+@pytest.mark.parametrize("target", sorted(TARGETS))
+@pytest.mark.parametrize("sections", [True, False])
+def test_exports_of_every_target(tmp_path, target, sections):
+    clearFunsCache()
+    names = [f"fun{i}" for i in range(100)]
+    path = writeLib(str(tmp_path / "libt.so.1"), names, target, version="LIBT_1.0", sections=sections)
+    funs = getAllFunsFromLib(path, False)
+    assert [fun[0] for fun in funs] == names
+    assert set(fun[1] for fun in funs) == {"LIBT_1.0"}
+    assert [fun[3] for fun in funs] == [STB_WEAK if i % 3 == 0 else STB_GLOBAL for i in range(len(names))]
+
+
+@pytest.mark.parametrize("target", sorted(TARGETS))
+@pytest.mark.parametrize("sections", [True, False])
+def test_imports_of_every_target(tmp_path, target, sections):
+    imports = [(f"fun{i}", "libt.so.1", "LIBT_1.0" if i % 2 else None) for i in range(50)]
+    path = writeElf(str(tmp_path / "app"), TARGETS[target], imports=imports, needed=["libt.so.1", "libc.so.6"], runpath="$ORIGIN", sections=sections)
+    assert getImportsFromBin(path) == [name for name, _, _ in imports]
+    assert getImportVersionsFromBin(path) == {name: version for name, _, version in imports}
+    with RAW_ELF(path) as elf:
+        assert elf.get_needed() == (["libt.so.1", "libc.so.6"], None, "$ORIGIN")
+        assert (elf.e_machine, elf.elfclass, elf.endian) == (TARGETS[target].machine, TARGETS[target].elfclass, TARGETS[target].endian)
+
+
+def test_exports_cache_is_bounded(tmp_path, monkeypatch):
+    clearFunsCache()
+    monkeypatch.setattr(elfutil, "FUNS_CACHE_LIBS", 2)
+    paths = [writeLib(str(tmp_path / f"lib{i}.so"), [f"fun{i}"]) for i in range(3)]
+    first = getAllFunsFromLib(paths[0], False)
+    getAllFunsFromLib(paths[1], False)
+    # lib0 was used last, lib1 is evicted by lib2
+    assert getAllFunsFromLib(paths[0], False) is first
+    getAllFunsFromLib(paths[2], False)
+    assert len(elfutil._FUNS_CACHE) == 2
+    assert getAllFunsFromLib(paths[0], False) is first
+
+    clearFunsCache()
+    assert getAllFunsFromLib(paths[0], False) is not first
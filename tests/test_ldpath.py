@@ -0,0 +1,198 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import struct
+
+import pytest
+
+from libautoresolv import ldpath
+from libautoresolv.ldpath import EM_ARM, EM_X86_64, LD_RESOLVER, clearDirIndex, getElfIdent, getLibsFromBin
+
+X86_64 = (EM_X86_64, 64, "<")
+ARM = (EM_ARM, 32, "<")
+
+
+class FIRMWARE():
+    """Firmware tree below `root`, objects are only 20 bytes ELF headers and their dynamic
+    section is served by the fake RAW_ELF"""
+
+    def __init__(self, root):
+        self.root = root
+        self.nodes = {}
+
+    def host(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def add(self, path, needed=(), rpath=None, runpath=None, ident=X86_64):
+        host = self.host(path)
+        os.makedirs(os.path.dirname(host), exist_ok=True)
+        machine, elfclass, endian = ident
+        with open(host, "wb") as fd:
+            fd.write(b"\x7fELF" + bytes([1 if elfclass == 32 else 2, 1 if endian == "<" else 2, 1]) + bytes(9))
+            fd.write(struct.pack(endian + "HH", 3, machine))
+        self.nodes[os.path.realpath(host)] = (list(needed), rpath, runpath)
+        return host
+
+    def write(self, path, text):
+        host = self.host(path)
+        os.makedirs(os.path.dirname(host), exist_ok=True)
+        with open(host, "w") as fd:
+            fd.write(text)
+
+
+@pytest.fixture
+def firmware(tmp_path, monkeypatch):
+    firmware = FIRMWARE(str(tmp_path / "rootfs"))
+
+    class FAKE_ELF():
+
+        def __init__(self, path):
+            self.node = firmware.nodes[os.path.realpath(path)]
+            self.e_machine, self.elfclass, self.endian = getElfIdent(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def get_needed(self):
+            return self.node
+
+    monkeypatch.setattr(ldpath, "RAW_ELF", FAKE_ELF)
+    monkeypatch.setattr(ldpath, "_RESOLVERS", {})
+    clearDirIndex()
+    yield firmware
+    clearDirIndex()
+
+
+def resolve(firmware, binary, **kwargs):
+    return getLibsFromBin(firmware.host(binary), sysroot=firmware.root, **kwargs)
+
+
+def test_rpath_is_searched_before_default_dirs(firmware):
+    firmware.add("/bin/app", ["libfoo.so"], rpath="/opt/a")
+    firmware.add("/usr/lib/libfoo.so")
+    firmware.add("/opt/a/libfoo.so")
+    libs, rpath = resolve(firmware, "/bin/app")
+    assert libs == {"libfoo.so": firmware.host("/opt/a/libfoo.so")}
+    assert rpath == firmware.host("/opt/a")
+
+
+def test_runpath_disables_rpath(firmware):
+    firmware.add("/bin/app", ["libfoo.so", "libbar.so"], rpath="/opt/a", runpath="/opt/b")
+    firmware.add("/opt/a/libfoo.so")
+    firmware.add("/opt/b/libfoo.so")
+    firmware.add("/opt/a/libbar.so")
+    firmware.add("/lib/libbar.so")
+    libs, rpath = resolve(firmware, "/bin/app")
+    assert libs == {"libfoo.so": firmware.host("/opt/b/libfoo.so"), "libbar.so": firmware.host("/lib/libbar.so")}
+    assert rpath == firmware.host("/opt/b")
+
+
+def test_origin_is_the_binary_directory(firmware):
+    firmware.add("/opt/app/bin/app", ["libfoo.so", "libbar.so"], runpath="$ORIGIN/../lib:${ORIGIN}/plugins:lib")
+    firmware.add("/opt/app/lib/libfoo.so")
+    firmware.add("/opt/app/bin/plugins/libbar.so")
+    # $ORIGIN is the directory of the real file, not of the symlink the binary is opened through
+    os.symlink(firmware.host("/opt/app/bin/app"), firmware.host("/app"))
+    libs, rpath = resolve(firmware, "/app")
+    assert libs == {"libfoo.so": firmware.host("/opt/app/lib/libfoo.so"), "libbar.so": firmware.host("/opt/app/bin/plugins/libbar.so")}
+    # the relative entry depends on the working directory of the loader and is dropped
+    assert rpath == firmware.host("/opt/app/lib") + ":" + firmware.host("/opt/app/bin/plugins")
+
+
+def test_expand_lib_and_platform(firmware):
+    resolver = LD_RESOLVER(firmware.root)
+    assert resolver.expand("/opt/$LIB:/opt/${PLATFORM}/lib:", "/origin", X86_64) == [firmware.host("/opt/lib64"), firmware.host("/opt/x86_64/lib")]
+    assert resolver.expand("/opt/$LIB/$PLATFORM", "/origin", ARM) == [firmware.host("/opt/lib/arm")]
+    assert resolver.expand(None, "/origin", ARM) == []
+
+
+def test_ld_so_conf_include(firmware):
+    firmware.write("/etc/ld.so.conf", "# comment\ninclude ld.so.conf.d/*.conf\n/opt/first\nhwcap 0 nosegneg\n")
+    firmware.write("/etc/ld.so.conf.d/b.conf", "/opt/b1, /opt/b2\n")
+    firmware.write("/etc/ld.so.conf.d/a.conf", "/opt/a1:/opt/a2=libc5  # comment\ninclude /etc/ld.so.conf\n")
+    resolver = LD_RESOLVER(firmware.root)
+    # includes are expanded in name order where they appear, a conf file is read once
+    assert resolver.conf_dirs() == ["/opt/a1", "/opt/a2", "/opt/b1", "/opt/b2", "/opt/first"]
+
+    firmware.add("/bin/app", ["libfoo.so"])
+    firmware.add("/usr/lib/libfoo.so")
+    firmware.add("/opt/b2/libfoo.so")
+    libs, rpath = resolve(firmware, "/bin/app")
+    assert libs == {"libfoo.so": firmware.host("/opt/b2/libfoo.so")}
+    assert rpath is None
+
+
+def test_multiarch_dirs(firmware):
+    firmware.add("/bin/app", ["libc.so.6", "libz.so.1"], ident=ARM)
+    firmware.add("/lib/x86_64-linux-gnu/libc.so.6")
+    firmware.add("/lib/arm-linux-gnueabihf/libc.so.6", ident=ARM)
+    firmware.add("/usr/lib/arm-linux-gnueabi/libz.so.1", ident=ARM)
+    firmware.add("/usr/lib/libz.so.1", ident=ARM)
+    libs, _ = resolve(firmware, "/bin/app")
+    assert libs == {"libc.so.6": firmware.host("/lib/arm-linux-gnueabihf/libc.so.6"), "libz.so.1": firmware.host("/usr/lib/arm-linux-gnueabi/libz.so.1")}
+
+    resolver = LD_RESOLVER(firmware.root)
+    dirs = [os.path.relpath(path, firmware.root) for path in resolver.system_dirs(X86_64)]
+    assert dirs == ["lib/x86_64-linux-gnu", "usr/lib/x86_64-linux-gnu", "lib64", "usr/lib64", "lib", "usr/lib"]
+
+
+def test_library_of_another_architecture_is_skipped(firmware):
+    firmware.add("/bin/app", ["libfoo.so"], rpath="/opt/x86", ident=ARM)
+    firmware.add("/opt/x86/libfoo.so")
+    firmware.add("/lib/libfoo.so", ident=ARM)
+    libs, _ = resolve(firmware, "/bin/app")
+    assert libs == {"libfoo.so": firmware.host("/lib/libfoo.so")}
+
+
+def test_missing_library(firmware, capsys):
+    firmware.add("/bin/app", ["libfoo.so"], rpath="/opt/missing")
+    libs, rpath = resolve(firmware, "/bin/app")
+    assert libs == {"libfoo.so": "Path not found"}
+    assert rpath == firmware.host("/opt/missing")
+    assert "RPATH dir" in capsys.readouterr().out
+
+
+def test_closure_in_breadth_first_order(firmware):
+    firmware.add("/bin/app", ["liba.so", "libb.so"])
+    firmware.add("/lib/liba.so", ["libc.so", "libb.so"])
+    firmware.add("/lib/libb.so", ["libd.so"])
+    firmware.add("/lib/libc.so", ["libd.so"])
+    firmware.add("/lib/libd.so")
+    libs, _ = resolve(firmware, "/bin/app")
+    assert list(libs) == ["liba.so", "libb.so", "libc.so", "libd.so"]
+
+    libs, _ = resolve(firmware, "/bin/app", transitive=False)
+    assert list(libs) == ["liba.so", "libb.so"]
+
+
+def test_dependencies_use_the_rpath_of_their_loaders(firmware):
+    firmware.add("/bin/app", ["liba.so"], rpath="/opt/app")
+    firmware.add("/opt/app/liba.so", ["libb.so", "libc.so"], rpath="$ORIGIN/a")
+    firmware.add("/opt/app/a/libb.so", ["libd.so"], runpath="/opt/runpath")
+    firmware.add("/opt/app/libc.so")
+    # DT_RUNPATH of libb.so drops the DT_RPATH chain of its loaders
+    firmware.add("/opt/app/libd.so")
+    firmware.add("/lib/libd.so")
+    libs, rpath = resolve(firmware, "/bin/app")
+    assert libs == {
+        "liba.so": firmware.host("/opt/app/liba.so"),
+        "libb.so": firmware.host("/opt/app/a/libb.so"),
+        "libc.so": firmware.host("/opt/app/libc.so"),
+        "libd.so": firmware.host("/lib/libd.so"),
+    }
+    assert rpath == firmware.host("/opt/app")
@@ -0,0 +1,117 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+import re
+
+import pytest
+
+from conftest import makeCache
+from libautoresolv.dbcache import CACHED_ROWS, getRegexLiteral, isSearchIndexSupported, parseSearchQuery
+
+NAMES = ["Abcdef", "abcdef", "x41bcd", "fun_123", "fun_1235", "FUN_999", "_ZN3foo3barEv", "memcpy",
+         "memcpy_chk", "str.cat", "a|b", "café_open", "CAFÉ_open", "AAbcd", "k12b", "tab\tname"]
+
+PATTERNS = [r"\x41bcd", r"\101bcd", r"Abcd", r"\N{LATIN CAPITAL LETTER A}bcd", r"(?i)abcdef",
+            r"(?i)café", r"(?x) a b c d", r"^fun_\w+", r"[0-9]{3}5", r"fun_1(23)?", r"mem(cpy|set)_chk",
+            r"str\.cat", r"a\|b", r"memcpy|fun_", r"(a)\1bcd", r"_ZN3foo", r"bcd{1,2}e", r"abc*def", r"ab+cd"]
+
+
+def asciiLower(text):
+    # LIKE and lower() of sqlite only fold ASCII letters
+    return "".join(char.lower() if char.isascii() else char for char in text)
+
+
+def test_parse_search_query():
+    assert parseSearchQuery("memcpy") == (None, "memcpy", "substring", False)
+    assert parseSearchQuery(" ^mem") == (None, "mem", "prefix", False)
+    assert parseSearchQuery("/^mem.*/") == (None, "^mem.*", "regex", False)
+    assert parseSearchQuery("lib:libc.so.6 dm:foo::") == ("libc.so.6", "foo::", "substring", True)
+    assert parseSearchQuery("lib:a.so lib:b.so ^x") == ("b.so", "x", "prefix", False)
+    assert parseSearchQuery("/") == (None, "/", "substring", False)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_regex_literal_never_drops_a_match(pattern):
+    # the trigram prefilter keeps the rows containing the literal, every re.search match must be one of them
+    literal = getRegexLiteral(pattern)
+    regex = re.compile(pattern)
+    for name in NAMES:
+        if regex.search(name) and literal is not None:
+            assert asciiLower(literal) in asciiLower(name), (pattern, literal, name)
+
+
+def test_regex_literal_values():
+    assert getRegexLiteral(r"^fun_\w+") == "fun_"
+    assert getRegexLiteral(r"str\.cat") == "str.cat"
+    assert getRegexLiteral(r"ab") is None
+    assert getRegexLiteral(r"\x41bcd") is None
+    assert getRegexLiteral(r"(?i)abcdef") is None
+
+
+def randomNames(count, seed=1):
+    rng = random.Random(seed)
+    names = list(NAMES)
+    while len(names) < count:
+        names.append(rng.choice(["fun_", "Abc", "x41", "mem", "_ZN3foo", "str."]) + "".join(rng.choice("abcdAB0123_") for _ in range(rng.randint(1, 8))))
+    return sorted(set(names))
+
+
+@pytest.mark.parametrize("demangled", [False, True])
+def test_set_filter_matches_python(cache_path, demangled):
+    libs = ["liba.so", "libb.so", "libc.so.6"]
+    rows = [[name, libs[i % 3], "/lib/" + libs[i % 3], "dm_" + name] for i, name in enumerate(randomNames(600))]
+    makeCache(cache_path, rows).close()
+    column = 3 if demangled else 0
+
+    view = CACHED_ROWS(cache_path, demangle=True, block_size=16)
+    try:
+        for pattern in PATTERNS:
+            for library in (None, "libb.so"):
+                view.set_filter(library, pattern, "regex", demangled)
+                regex = re.compile(pattern)
+                expected = sorted(row for row in rows if regex.search(row[column]) and library in (None, row[1]))
+                assert sorted(view) == expected, pattern
+
+        for text in ("abc", "X41", "fun_12", "é"):
+            view.set_filter(None, text, "substring", demangled)
+            expected = sorted(row for row in rows if asciiLower(text) in asciiLower(row[column]))
+            assert sorted(view) == expected, text
+    finally:
+        view.close()
+
+
+@pytest.mark.skipif(not isSearchIndexSupported(), reason="sqlite without FTS5 trigram")
+def test_search_index_follows_writes(cache_path):
+    cache = makeCache(cache_path, [["memcpy", "libc.so.6", "/lib/libc.so.6", "memcpy"]])
+    view = CACHED_ROWS(cache_path, demangle=True)
+    try:
+        view.set_filter(None, "memcpy", "substring")
+        assert len(view) == 1
+        cache.save_data([["memcpy_chk", "libc.so.6", "/lib/libc.so.6", "memcpy_chk"]], cache.CONFIG)
+        view.set_filter(None, "memcpy", "substring")
+        assert [row[0] for row in view] == ["memcpy", "memcpy_chk"]
+    finally:
+        view.close()
+        cache.close()
+
+
+def test_invalid_regex_raises(cache_path):
+    makeCache(cache_path, [["memcpy", "libc.so.6", "/lib/libc.so.6", "memcpy"]]).close()
+    view = CACHED_ROWS(cache_path, demangle=True)
+    try:
+        with pytest.raises(re.error):
+            view.set_filter(None, "(", "regex")
+    finally:
+        view.close()
@@ -0,0 +1,141 @@
+# This file is part of AutoResolv.
+# Copyright 2022 - Airbus, thibault poncetta
+# AutoResolv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# AutoResolv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with AutoResolv.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+
+import pytest
+
+from benchmarks.elfgen import TARGETS
+from conftest import getHostLibs, touch, writeLib
+from libautoresolv import pool
+from libautoresolv.core import IMPORT_RESOLVER
+from libautoresolv.elfutil import STB_GLOBAL, STB_WEAK, STV_DEFAULT, STV_PROTECTED, clearFunsCache, getAllFunsFromLib
+from libautoresolv.pool import LIB_PARSER_POOL
+from libautoresolv.symstore import (SYMBOL_STORE, clearSymbolStores, getLibSymbolStore, getSymbolStorePath,
+                                    openSymbolStore, writeSymbolStore)
+
+EXPORTS = [
+    ("memcpy", "GLIBC_2.14", False, STB_GLOBAL, STV_DEFAULT),
+    ("memcpy", "GLIBC_2.2.5", True, STB_GLOBAL, STV_DEFAULT),
+    ("open", None, False, STB_WEAK, STV_PROTECTED),
+    ("_ZN3foo3barEv", "FOO_1.0", False, STB_GLOBAL, STV_DEFAULT),
+    ("café", None, False, STB_GLOBAL, STV_DEFAULT),
+] + [(f"fun{i}", "LIBT_1.0" if i % 2 else None, False, STB_GLOBAL, STV_DEFAULT) for i in range(500)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    clearSymbolStores()
+    clearFunsCache()
+    yield
+    clearSymbolStores()
+    clearFunsCache()
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / "lib.sym")
+    writeSymbolStore(path, EXPORTS, 1234, 5678)
+    store = SYMBOL_STORE(path)
+    try:
+        assert (len(store), store.size, store.mtime) == (len(EXPORTS), 1234, 5678)
+        assert sorted(store, key=repr) == sorted(EXPORTS, key=repr)
+        assert sorted(store.lookup("memcpy")) == [("GLIBC_2.14", False, STB_GLOBAL, STV_DEFAULT), ("GLIBC_2.2.5", True, STB_GLOBAL, STV_DEFAULT)]
+        assert store.lookup("open") == [(None, False, STB_WEAK, STV_PROTECTED)]
+        assert "café" in store
+        assert store.lookup("missing") == []
+    finally:
+        store.close()
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "empty.sym")
+    writeSymbolStore(path, [], 0, 0)
+    store = SYMBOL_STORE(path)
+    try:
+        assert len(store) == 0
+        assert store.lookup("memcpy") == []
+    finally:
+        store.close()
+
+
+def test_truncated_store_is_not_opened(tmp_path):
+    path = str(tmp_path / "lib.sym")
+    writeSymbolStore(path, EXPORTS, 0, 0)
+    with open(path, "r+b") as fd:
+        fd.truncate(os.path.getsize(path) - 1)
+    assert openSymbolStore(path) is None
+
+
+@pytest.mark.skipif(len(getHostLibs()) < 2, reason="needs two shared libraries mapped in this interpreter")
+def test_library_store_is_built_once_and_rebuilt_when_changed(tmp_path):
+    first, second = getHostLibs()[:2]
+    lib = str(tmp_path / "libt.so.1")
+    shutil.copyfile(first, lib)
+    store_dir = str(tmp_path / ".symstore")
+    stats = {}
+
+    store = getLibSymbolStore(lib, store_dir, False, stats)
+    assert sorted(store, key=repr) == sorted(getAllFunsFromLib(lib, False), key=repr)
+    assert getLibSymbolStore(lib, store_dir, False, stats) is store
+    assert stats == {'misses': 1, 'hits': 1}
+
+    shutil.copyfile(second, lib)
+    touch(lib)
+    assert sorted(getLibSymbolStore(lib, store_dir, False, stats), key=repr) == sorted(getAllFunsFromLib(second, False), key=repr)
+    assert stats['misses'] == 2
+    assert os.path.isfile(getSymbolStorePath(store_dir, lib))
+
+
+def test_resolver_matches_store_like_list(tmp_path):
+    path = str(tmp_path / "lib.sym")
+    writeSymbolStore(path, EXPORTS, 0, 0)
+    imports = {".memcpy": 1, ".open": 2, ".fun7": 3, ".missing": 4}
+    paths = {"libt.so": "/lib/libt.so"}
+
+    from_list = IMPORT_RESOLVER(imports, paths, versions={"memcpy": "GLIBC_2.2.5"})
+    from_list.feed("libt.so", EXPORTS)
+    store = openSymbolStore(path)
+    from_store = IMPORT_RESOLVER(imports, paths, versions={"memcpy": "GLIBC_2.2.5"})
+    from_store.feed("libt.so", store)
+    assert sorted(from_store.values) == sorted(from_list.values)
+    assert [row[0] for row in sorted(from_store.values)] == ["fun7", "memcpy", "open"]
+
+
+def test_sequential_parse_looks_each_library_up_once(tmp_path, monkeypatch):
+    libs = {}
+    for i, target in enumerate(sorted(TARGETS)):
+        libs[f"libt{i}.so.1"] = writeLib(str(tmp_path / f"libt{i}.so.1"), [f"t{i}_fun{j}" for j in range(200)], target)
+    store_dir = str(tmp_path / ".symstore")
+    calls = {'open': 0, 'build': 0}
+
+    def countCalls(name, fun):
+        def counted(*args):
+            calls[name] += 1
+            return fun(*args)
+        return counted
+    monkeypatch.setattr(pool, "openSymbolStore", countCalls('open', pool.openSymbolStore))
+    monkeypatch.setattr(pool, "buildSymbolStore", countCalls('build', pool.buildSymbolStore))
+
+    # a single worker never starts the process pool
+    parser = LIB_PARSER_POOL(max_workers=1)
+    first = {lib: sorted(funs, key=repr) for lib, funs in parser.parse(libs, False, store_dir=store_dir) if lib is not None}
+    # a miss, then the built store
+    assert calls == {'open': 2 * len(libs), 'build': len(libs)}
+
+    clearSymbolStores()
+    second = {lib: sorted(funs, key=repr) for lib, funs in parser.parse(libs, False, store_dir=store_dir) if lib is not None}
+    assert calls == {'open': 3 * len(libs), 'build': len(libs)}
+    assert second == first
+    assert all(len(funs) == 200 for funs in first.values())